@@ -2,38 +2,215 @@
 LLM-based semantic analyzer using Claude
 """
 
+import asyncio
+import hashlib
 import json
 import logging
 import os
 import random
+import re
 import time
-from datetime import datetime
-from typing import List, Optional
+from contextlib import AbstractAsyncContextManager, nullcontext
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from string import Formatter
+from typing import Callable, Iterator, List, Optional, Tuple
 
 import anthropic
 from dotenv import load_dotenv
 
+from semantic_diff.analyzers.rate_limiter import RateLimiter
+from semantic_diff.cache import SemanticCache
 from semantic_diff.models import (
     FileChange,
-    Impact,
     ImpactMap,
     Intent,
-    ReviewQuestion,
-    Risk,
     RiskAssessment,
     RiskLevel,
     SemanticAnalysis,
 )
 
+try:
+    import orjson
+
+    # orjson accepts str directly - no intermediate UTF-8 copy of the payload
+    json_loads = orjson.loads
+
+except ImportError:  # orjson is optional (pip install semantic-diff[fast])
+    json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+HUNK_HEADER = re.compile(r"^@@ .* @@")
+JSON_BLOCK = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+TOKEN_PIECE = re.compile(r"\w+|[^\w\s]|\n")
+
+DEFAULT_MODEL = "claude-sonnet-4-5-20250929"
+
+# Bump whenever the prompts or response handling change, so analyses cached
+# under the old version are not served for the new one
+PROMPT_VERSION = "3"
+
+NO_USAGE = {
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "total_tokens": 0,
+    "cache_creation_input_tokens": 0,
+    "cache_read_input_tokens": 0,
+}
+
+# Rules for commits that are analyzed locally instead of by the LLM
+# No .txt: requirements.txt, CMakeLists.txt and friends are build inputs, not docs
+DOC_EXTENSIONS = {".md", ".rst"}
+VERSION_FILES = {"pyproject.toml", "setup.py", "setup.cfg", "package.json", "Cargo.toml"}
+VERSION_LINE = re.compile(r"""^\s*["']?(__version__|version)["']?\s*[=:]""")
+HASH_COMMENT_LANGUAGES = {"python", "ruby", "bash", "yaml", "toml"}
+SLASH_COMMENT_LANGUAGES = {
+    "javascript",
+    "typescript",
+    "rust",
+    "go",
+    "java",
+    "php",
+    "c",
+    "cpp",
+    "csharp",
+    "swift",
+    "kotlin",
+    "scala",
+    "css",
+    "scss",
+}
+BLOCK_COMMENT_LANGUAGES = SLASH_COMMENT_LANGUAGES | {"sql"}
+# Shebangs are not comments
+HASH_COMMENT = re.compile(r"^\s*#(?!!)")
+# Comments that change behavior: encoding declarations and Ruby magic comments
+MAGIC_COMMENT = re.compile(r"^\s*#.*?(coding[:=]|frozen_string_literal:)")
+# Openers of strings that can span lines - comment markers inside them are text
+MULTILINE_STRING_MARKERS = {
+    "python": re.compile(r"\"\"\"|'''"),
+    "toml": re.compile(r"\"\"\"|'''"),
+    "javascript": re.compile(r"`"),
+    "typescript": re.compile(r"`"),
+    "go": re.compile(r"`"),
+    "java": re.compile(r'"""'),
+    "kotlin": re.compile(r'"""'),
+    "scala": re.compile(r'"""'),
+    "swift": re.compile(r'"""'),
+    "csharp": re.compile(r'"""'),
+    "rust": re.compile(r'\br#*"'),
+    "cpp": re.compile(r'\bR"'),
+    "php": re.compile(r"<<<"),
+    "ruby": re.compile(r"<<[~-]?[\"']?[A-Za-z_]"),
+    "bash": re.compile(r"<<-?\s*[\"']?\w"),
+    "yaml": re.compile(r"[|>][-+]?\d*\s*(#.*)?$"),
+}
+# Leading whitespace is syntax here; files with no detected language are treated the same
+INDENT_SENSITIVE_LANGUAGES = {"python", "yaml"}
+STRING_LITERAL = re.compile(r""""(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'""")
+SPACE_NEAR_SYMBOL = re.compile(r"\s+(?=[^\w\s])|(?<=[^\w\s])\s+")
+
+# analysis_model reported for commits classified by _trivial_analysis
+LOCAL_RULES_MODEL = "local-rules"
+
+# Caps the response size too: replies stay small enough to parse in one json_loads call
+MAX_OUTPUT_TOKENS = 4096
+
+# Files that would get fewer diff tokens than this are listed as omitted instead
+MIN_DIFF_TOKENS = 20
+# Markdown heading, change type, language and code fence around each diff (path excluded)
+DIFF_BLOCK_OVERHEAD_TOKENS = 12
+
+_env_loaded = False
+
+
+def analysis_timestamp() -> str:
+    """UTC timestamp for analysis metadata (second precision is plenty for reports)"""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def load_env_once() -> None:
+    """Read .env on first use only - later analyzers reuse the populated environment"""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+
+def resolve_model(model: Optional[str] = None) -> str:
+    """Model to use: explicit argument, then SEMANTIC_DIFF_MODEL, then the default"""
+    load_env_once()
+    return model or os.getenv("SEMANTIC_DIFF_MODEL", DEFAULT_MODEL)
+
+
+@lru_cache(maxsize=4)
+def get_client(api_key: str) -> anthropic.Anthropic:
+    """Shared client per API key, so analyzers in one process reuse its connection pool"""
+    return anthropic.Anthropic(api_key=api_key)
+
+
+@lru_cache(maxsize=8)
+def risk_level(value: str) -> RiskLevel:
+    """Map an LLM severity string to RiskLevel; unknown values fall back to MEDIUM"""
+    try:
+        return RiskLevel(value.strip().lower())
+    except (ValueError, AttributeError):
+        logger.warning(f"Unknown severity {value!r} in LLM response, using medium")
+        return RiskLevel.MEDIUM
+
+
+class _CommentTracker:
+    """
+    Tells comment lines from code on one side of a hunk, following /* ... */ blocks.
+    A hunk that starts inside a block is not detected: its lines count as code,
+    never the other way round.
+    """
+
+    def __init__(self, language: Optional[str]):
+        self.language = language
+        self.in_block = False
+
+    def is_comment(self, line: str) -> bool:
+        if self.language in HASH_COMMENT_LANGUAGES:
+            return bool(HASH_COMMENT.match(line)) and not MAGIC_COMMENT.match(line)
+        if self.language not in BLOCK_COMMENT_LANGUAGES:
+            return False
+
+        stripped = line.strip()
+        if self.in_block:
+            end = stripped.find("*/")
+            if end == -1:
+                return True
+            self.in_block = False
+            return not stripped[end + 2 :].strip()
+        if stripped.startswith("--" if self.language == "sql" else "//"):
+            return True
+        if stripped.startswith("/*"):
+            end = stripped.find("*/", 2)
+            if end == -1:
+                self.in_block = True
+                return True
+            return not stripped[end + 2 :].strip()
+        return False
+
 
 class LLMAnalyzer:
     """Analyzes code changes using Claude for semantic understanding"""
 
-    ANALYSIS_PROMPT = """You are a senior code reviewer analyzing a git commit. Your task is to provide semantic analysis that goes beyond what a simple diff shows.
+    # Static instructions - identical for every commit, sent as a cacheable prefix
+    ANALYSIS_INSTRUCTIONS = """You are a senior code reviewer. Analyze the git commit that follows (metadata, project context, changed files, diffs) beyond what the diff shows.
+
+Reply with one JSON object in a ```json block, using this schema (severity/priority/overall_risk are low|medium|high|critical):
+intent{summary: why the change was made in one sentence, reasoning: 2-3 sentences, confidence: 0-1}
+impact_map{direct_impacts[{area, description, severity}], indirect_impacts[{area, description, severity}], affected_components[str]}
+risk_assessment{overall_risk, risks[{description, severity, mitigation, edge_cases[str]}], breaking_changes: bool, requires_migration: bool}
+review_questions[{question, context, priority}]
 
-## Commit Information
+Consider ripple effects on imports, API consumers and tests, backwards compatibility and edge cases. Be specific and actionable; avoid generic observations."""
+
+    # Per-commit data, appended after the cached instructions
+    COMMIT_PROMPT = """## Commit Information
 - **Hash:** {commit_hash}
 - **Message:** {commit_message}
 - **Author:** {author}
@@ -46,100 +223,159 @@ class LLMAnalyzer:
 {files_summary}
 
 ## Detailed Diffs
-{diffs}
-
----
-
-Analyze this commit and provide a structured response in the following JSON format:
-
-```json
-{{
-    "intent": {{
-        "summary": "One sentence describing WHAT the developer was trying to accomplish (not what changed, but WHY)",
-        "reasoning": "2-3 sentences explaining your reasoning",
-        "confidence": 0.0-1.0
-    }},
-    "impact_map": {{
-        "direct_impacts": [
-            {{"area": "affected area", "description": "how it's affected", "severity": "low|medium|high|critical"}}
-        ],
-        "indirect_impacts": [
-            {{"area": "indirectly affected area", "description": "potential ripple effects", "severity": "low|medium|high|critical"}}
-        ],
-        "affected_components": ["list", "of", "components"]
-    }},
-    "risk_assessment": {{
-        "overall_risk": "low|medium|high|critical",
-        "risks": [
-            {{
-                "description": "specific risk",
-                "severity": "low|medium|high|critical",
-                "mitigation": "how to mitigate",
-                "edge_cases": ["edge case 1", "edge case 2"]
-            }}
-        ],
-        "breaking_changes": true/false,
-        "requires_migration": true/false
-    }},
-    "review_questions": [
-        {{
-            "question": "Question for the author",
-            "context": "Why this question matters",
-            "priority": "low|medium|high|critical"
-        }}
-    ]
-}}
-```
-
-Focus on:
-1. **Intent**: What problem is being solved? What's the motivation?
-2. **Impact**: What else in the system might be affected? Consider imports, API consumers, tests.
-3. **Risk**: What could break? What edge cases exist? Is this backwards compatible?
-4. **Questions**: What would you ask the author in a code review?
-
-Be specific and actionable. Avoid generic observations."""
-
-    def __init__(self, model: Optional[str] = None):
-        load_dotenv()
+{diffs}"""
+
+    # COMMIT_PROMPT split once into (literal, field) pairs so filling it is a single join
+    COMMIT_PROMPT_PARTS = tuple(
+        (literal, field) for literal, field, _, _ in Formatter().parse(COMMIT_PROMPT)
+    )
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        cache: Optional[SemanticCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        load_env_once()
 
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment")
 
-        self.model = model or os.getenv("SEMANTIC_DIFF_MODEL", "claude-sonnet-4-5-20250929")
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        self.model = resolve_model(model)
+        self.client = get_client(self.api_key)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
         self.last_usage = None
 
+    def _async_client(self) -> anthropic.AsyncAnthropic:
+        """
+        New async client for one event loop run.
+        Its connection pool is bound to the loop, so it must not outlive it.
+        """
+        return anthropic.AsyncAnthropic(api_key=self.api_key)
+
     def _format_files_summary(self, files: List[FileChange]) -> str:
         """Format file changes for the prompt"""
-        lines = []
-        for f in files:
-            lang = f"[{f.language}]" if f.language else ""
-            lines.append(f"- {f.path} ({f.change_type}) +{f.additions}/-{f.deletions} {lang}")
-        return "\n".join(lines)
+        return "\n".join(
+            f"- {f.path} ({f.change_type}) +{f.additions}/-{f.deletions} "
+            f"{f'[{f.language}]' if f.language else ''}"
+            for f in files
+        )
 
-    def _format_diffs(self, files: List[FileChange], max_total_chars: int = 15000) -> str:
-        """Format diffs for the prompt, respecting token limits"""
-        diffs = []
-        total_chars = 0
+    def _compress_hunk(self, hunk: List[str], context_lines: int, max_hunk_lines: int) -> List[str]:
+        """Keep changed lines plus context_lines of context around them"""
+        changed = [i for i, line in enumerate(hunk) if line[:1] in ("+", "-")]
+        keep = set()
+        for i in changed:
+            keep.update(range(i - context_lines, i + context_lines + 1))
 
-        for f in files:
-            if total_chars >= max_total_chars:
-                diffs.append(f"\n... (truncated - {len(files) - len(diffs)} more files)")
-                break
+        kept = []
+        for i, line in enumerate(hunk):
+            if i not in keep:
+                continue
+            # Collapse runs of blank lines
+            if not line.strip() and kept and not kept[-1].strip():
+                continue
+            kept.append(line)
+
+        if len(kept) > max_hunk_lines:
+            half = max_hunk_lines // 2
+            elided = len(kept) - 2 * half
+            kept = kept[:half] + [f"... (elided {elided} lines)"] + kept[-half:]
+        return kept
 
-            header = f"\n### {f.path} ({f.change_type})\n```{f.language or 'diff'}\n"
-            content = f.diff_content
-            footer = "\n```\n"
+    def _compress_diff(self, text: str, context_lines: int = 1, max_hunk_lines: int = 80) -> str:
+        """
+        Shrink a unified diff before it goes into the prompt.
+        Drops unchanged context beyond context_lines around each change,
+        trailing whitespace and repeated blank lines, and elides the middle
+        of very long hunks. Non-hunk content (e.g. new files) is only cleaned up.
+        """
+        lines = [line.rstrip() for line in text.split("\n")]
+
+        if not any(HUNK_HEADER.match(line) for line in lines):
+            output = []
+            for line in lines:
+                if not line and output and not output[-1]:
+                    continue
+                output.append(line)
+            return "\n".join(output)
+
+        output = []
+        hunk = None  # Lines before the first hunk header are file headers - dropped
+        for line in lines:
+            if HUNK_HEADER.match(line):
+                if hunk:
+                    output.extend(self._compress_hunk(hunk, context_lines, max_hunk_lines))
+                output.append(line)
+                hunk = []
+            elif hunk is not None and not line.startswith("\\"):
+                hunk.append(line)
+        if hunk:
+            output.extend(self._compress_hunk(hunk, context_lines, max_hunk_lines))
+
+        return "\n".join(output)
+
+    def _estimate_tokens(self, text: str) -> int:
+        """
+        Estimate the Claude token count of text without a network call.
+        Identifiers/words count one token per ~4 chars, punctuation and newlines one each.
+        """
+        return sum(
+            (len(piece) + 3) // 4 if piece[0].isalnum() or piece[0] == "_" else 1
+            for piece in TOKEN_PIECE.findall(text)
+        )
+
+    def _estimate_request_tokens(self, prompt: str) -> int:
+        """Estimated input tokens of a full request (instructions + commit prompt)"""
+        return self._estimate_tokens(self.ANALYSIS_INSTRUCTIONS) + self._estimate_tokens(prompt)
+
+    def _format_diffs(self, files: List[FileChange], max_total_tokens: int = 4000) -> str:
+        """
+        Format diffs for the prompt within a token budget.
+        The largest changes get budget first; output keeps the original file order.
+        """
+        blocks = {}
+        used_tokens = 0
+        raw_chars = 0
+        compressed_chars = 0
+
+        by_size = sorted(
+            range(len(files)), key=lambda i: files[i].additions + files[i].deletions, reverse=True
+        )
+        for i in by_size:
+            f = files[i]
+            overhead = DIFF_BLOCK_OVERHEAD_TOKENS + self._estimate_tokens(f.path)
+
+            available = max_total_tokens - used_tokens - overhead
+            if available < MIN_DIFF_TOKENS:
+                continue
+
+            content = self._compress_diff(f.diff_content)
+            raw_chars += len(f.diff_content)
+            compressed_chars += len(content)
 
             # Truncate individual file if too long
-            available = max_total_chars - total_chars - len(header) - len(footer)
-            if len(content) > available:
-                content = content[:available] + "\n... (truncated)"
+            tokens = self._estimate_tokens(content)
+            if tokens > available:
+                content = content[: len(content) * available // tokens] + "\n... (truncated)"
+                tokens = self._estimate_tokens(content)
 
-            diff_block = header + content + footer
-            diffs.append(diff_block)
-            total_chars += len(diff_block)
+            blocks[i] = (
+                f"\n### {f.path} ({f.change_type})\n```{f.language or 'diff'}\n{content}\n```\n"
+            )
+            used_tokens += overhead + tokens
+
+        diffs = [blocks[i] for i in range(len(files)) if i in blocks]
+        if len(blocks) < len(files):
+            diffs.append(f"\n... (truncated - {len(files) - len(blocks)} more files)")
+
+        if raw_chars:
+            logger.debug(
+                f"Diff compression: {raw_chars} -> {compressed_chars} chars "
+                f"({100 - compressed_chars * 100 // raw_chars}% saved), ~{used_tokens} tokens"
+            )
 
         return "\n".join(diffs)
 
@@ -157,126 +393,211 @@ Be specific and actionable. Avoid generic observations."""
 
     def _parse_response(self, response_text: str) -> dict:
         """Extract JSON from Claude's response"""
-        # Try to find JSON block
-        if "```json" in response_text:
-            start = response_text.find("```json") + 7
-            end = response_text.find("```", start)
-            json_str = response_text[start:end].strip()
-        elif "```" in response_text:
-            start = response_text.find("```") + 3
-            end = response_text.find("```", start)
-            json_str = response_text[start:end].strip()
-        else:
-            # Try to parse the whole response as JSON
-            json_str = response_text.strip()
+        # Try to find a fenced JSON block, otherwise parse the whole response
+        match = JSON_BLOCK.search(response_text)
+        json_str = match.group(1) if match else response_text.strip()
 
         try:
-            return json.loads(json_str)
+            return json_loads(json_str)
         except json.JSONDecodeError as e:
             raise ValueError(
                 f"Failed to parse LLM response as JSON: {e}\nResponse: {response_text[:500]}"
             )
 
+    def _request_params(self, prompt: str) -> dict:
+        """
+        Build the Messages API parameters for a commit prompt.
+        The static instructions go first and are marked for prompt caching,
+        so repeated calls within the cache TTL bill them at the cached rate.
+        """
+        return {
+            "model": self.model,
+            "max_tokens": MAX_OUTPUT_TOKENS,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": self.ANALYSIS_INSTRUCTIONS,
+                            "cache_control": {"type": "ephemeral"},
+                        },
+                        {"type": "text", "text": prompt},
+                    ],
+                }
+            ],
+        }
+
+    def _backoff_delay(self, error: Exception, attempt: int, base_delay: float) -> Optional[float]:
+        """
+        Compute how long to wait before retrying after error.
+        Returns None when the error should not be retried.
+        """
+        if isinstance(error, anthropic.RateLimitError):
+            # Check for Retry-After header (can be seconds or HTTP-date)
+            retry_after = getattr(error, "retry_after", None)
+            if retry_after:
+                try:
+                    delay = float(retry_after)
+                except (ValueError, TypeError):
+                    # Retry-After might be HTTP-date format, fall back to exponential
+                    logger.debug(
+                        f"Could not parse Retry-After '{retry_after}', using exponential backoff"
+                    )
+                    delay = base_delay * (2**attempt)
+            else:
+                delay = base_delay * (2**attempt)
+            # Add jitter (10-30% of delay)
+            return delay + delay * random.uniform(0.1, 0.3)
+
+        # Timeouts and connection errors are always transient; 4xx are not
+        if isinstance(error, anthropic.APIConnectionError) or (
+            isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+        ):
+            return base_delay * (2**attempt) + random.uniform(0, base_delay)
+
+        return None
+
+    @staticmethod
+    def _describe_error(error: Exception) -> str:
+        if isinstance(error, anthropic.RateLimitError):
+            return "Rate limited"
+        if isinstance(error, anthropic.APITimeoutError):
+            return "Timeout"
+        if isinstance(error, anthropic.APIConnectionError):
+            return "Connection error"
+        return f"Server error {getattr(error, 'status_code', '?')}"
+
+    @staticmethod
+    def _retry_settings(
+        max_retries: Optional[int], max_total_wait: Optional[float]
+    ) -> Tuple[int, float]:
+        if max_retries is None:
+            max_retries = int(os.getenv("SEMANTIC_DIFF_MAX_RETRIES", "3"))
+        if max_total_wait is None:
+            max_total_wait = float(os.getenv("SEMANTIC_DIFF_MAX_WAIT", "30.0"))
+        return max_retries, max_total_wait
+
+    def _stream_message(self, prompt: str, on_text: Callable[[str], None]):
+        """Stream a response, passing each text delta to on_text; returns the final Message"""
+        with self.client.messages.stream(**self._request_params(prompt)) as stream:
+            for text in stream.text_stream:
+                on_text(text)
+            return stream.get_final_message()
+
+    def _next_retry_delay(
+        self,
+        error: Exception,
+        attempt: int,
+        max_retries: int,
+        base_delay: float,
+        deadline: float,
+        max_total_wait: float,
+    ) -> Optional[float]:
+        """
+        Decide what follows a failed attempt, shared by the sync and async retry loops.
+        Re-raises errors that should not be retried; returns None when waiting would
+        overrun the deadline, otherwise the delay to wait before the next attempt.
+        """
+        delay = self._backoff_delay(error, attempt, base_delay)
+        if delay is None:
+            raise error
+        if self.rate_limiter is not None and isinstance(error, anthropic.RateLimitError):
+            self.rate_limiter.penalize(delay)
+
+        if time.monotonic() + delay > deadline:
+            logger.warning(f"Retry would exceed max_total_wait ({max_total_wait}s), giving up")
+            return None
+
+        logger.warning(
+            f"{self._describe_error(error)}, retry {attempt + 1}/{max_retries} in {delay:.1f}s"
+        )
+        return delay
+
+    @staticmethod
+    def _retries_exhausted(
+        max_retries: int, started: float, last_exception: Optional[Exception]
+    ) -> RuntimeError:
+        return RuntimeError(
+            f"API call failed after {max_retries} retries "
+            f"(waited {time.monotonic() - started:.1f}s): {last_exception}"
+        )
+
     def _call_api_with_retry(
         self,
         prompt: str,
         max_retries: Optional[int] = None,
         base_delay: float = 1.0,
         max_total_wait: Optional[float] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        on_retry: Optional[Callable[[], None]] = None,
     ):
         """
         Call Claude API with exponential backoff + jitter retry.
         Handles rate limits, timeouts, and transient errors.
         Respects Retry-After headers when present.
+        max_total_wait bounds the wall time of the whole loop, requests included.
+        With on_text the response is streamed; a retried attempt streams again from the start,
+        after on_retry is called so text from the failed attempt can be discarded.
         """
-        if max_retries is None:
-            max_retries = int(os.getenv("SEMANTIC_DIFF_MAX_RETRIES", "3"))
-        if max_total_wait is None:
-            max_total_wait = float(os.getenv("SEMANTIC_DIFF_MAX_WAIT", "30.0"))
+        max_retries, max_total_wait = self._retry_settings(max_retries, max_total_wait)
 
         last_exception = None
-        total_waited = 0.0
+        # Budget real elapsed time (requests included), not just the nominal sleeps
+        started = time.monotonic()
+        deadline = started + max_total_wait
 
         for attempt in range(max_retries):
+            if attempt and on_retry is not None:
+                on_retry()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self._estimate_request_tokens(prompt))
             try:
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=4096,
-                    messages=[{"role": "user", "content": prompt}],
-                )
-                return response
-            except anthropic.RateLimitError as e:
+                if on_text is not None:
+                    return self._stream_message(prompt, on_text)
+                return self.client.messages.create(**self._request_params(prompt))
+            except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
                 last_exception = e
-                # Check for Retry-After header (can be seconds or HTTP-date)
-                retry_after = getattr(e, "retry_after", None)
-                if retry_after:
-                    try:
-                        delay = float(retry_after)
-                    except (ValueError, TypeError):
-                        # Retry-After might be HTTP-date format, fall back to exponential
-                        logger.debug(
-                            f"Could not parse Retry-After '{retry_after}', using exponential backoff"
-                        )
-                        delay = base_delay * (2**attempt)
-                else:
-                    delay = base_delay * (2**attempt)
-                # Add jitter (10-30% of delay)
-                jitter = delay * random.uniform(0.1, 0.3)
-                delay += jitter
-
-                if total_waited + delay > max_total_wait:
-                    logger.warning(
-                        f"Retry would exceed max_total_wait ({max_total_wait}s), giving up"
-                    )
+                delay = self._next_retry_delay(
+                    e, attempt, max_retries, base_delay, deadline, max_total_wait
+                )
+                if delay is None:
                     break
-
-                logger.warning(f"Rate limited, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
                 time.sleep(delay)
-                total_waited += delay
 
-            except anthropic.APITimeoutError as e:
-                last_exception = e
-                delay = base_delay * (2**attempt) + random.uniform(0, base_delay)
+        raise self._retries_exhausted(max_retries, started, last_exception)
 
-                if total_waited + delay > max_total_wait:
-                    break
+    async def _acall_api_with_retry(
+        self,
+        client: anthropic.AsyncAnthropic,
+        prompt: str,
+        max_retries: Optional[int] = None,
+        base_delay: float = 1.0,
+        max_total_wait: Optional[float] = None,
+    ):
+        """Async counterpart of _call_api_with_retry using the AsyncAnthropic client"""
+        max_retries, max_total_wait = self._retry_settings(max_retries, max_total_wait)
 
-                logger.warning(f"Timeout, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
-                time.sleep(delay)
-                total_waited += delay
+        last_exception = None
+        # Budget real elapsed time (requests included), not just the nominal sleeps
+        started = time.monotonic()
+        deadline = started + max_total_wait
 
-            except anthropic.APIConnectionError as e:
+        for attempt in range(max_retries):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async(self._estimate_request_tokens(prompt))
+            try:
+                return await client.messages.create(**self._request_params(prompt))
+            except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
                 last_exception = e
-                delay = base_delay * (2**attempt) + random.uniform(0, base_delay)
-
-                if total_waited + delay > max_total_wait:
-                    break
-
-                logger.warning(
-                    f"Connection error, retry {attempt + 1}/{max_retries} in {delay:.1f}s"
+                delay = self._next_retry_delay(
+                    e, attempt, max_retries, base_delay, deadline, max_total_wait
                 )
-                time.sleep(delay)
-                total_waited += delay
-
-            except anthropic.APIStatusError as e:
-                if e.status_code >= 500:
-                    last_exception = e
-                    delay = base_delay * (2**attempt) + random.uniform(0, base_delay)
-
-                    if total_waited + delay > max_total_wait:
-                        break
-
-                    logger.warning(
-                        f"Server error {e.status_code}, retry {attempt + 1}/{max_retries} in {delay:.1f}s"
-                    )
-                    time.sleep(delay)
-                    total_waited += delay
-                else:
-                    raise
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
 
-        raise RuntimeError(
-            f"API call failed after {max_retries} retries (waited {total_waited:.1f}s): {last_exception}"
-        )
+        raise self._retries_exhausted(max_retries, started, last_exception)
 
     def _validate_response_data(self, data: dict) -> dict:
         """
@@ -337,96 +658,434 @@ Be specific and actionable. Avoid generic observations."""
 
         return data
 
-    def analyze(
-        self, commit_info: dict, files: List[FileChange], project_context: dict
-    ) -> SemanticAnalysis:
+    @staticmethod
+    def _changed_lines(diff_content: str) -> Tuple[List[str], List[str]]:
+        """Split a unified diff into (added, removed) line contents"""
+        added, removed = [], []
+        for line in diff_content.split("\n"):
+            if line.startswith("+") and not line.startswith("+++"):
+                added.append(line[1:])
+            elif line.startswith("-") and not line.startswith("---"):
+                removed.append(line[1:])
+        return added, removed
+
+    @staticmethod
+    def _normalize_code_line(line: str, keep_indent: bool) -> str:
         """
-        Analyze a commit using Claude.
-        Returns structured SemanticAnalysis.
+        Canonical form of a line for cosmetic comparison.
+        Drops whitespace next to operators and collapses the rest, but never
+        touches string literals (or the indentation, when keep_indent is set).
+        """
+        indent = line[: len(line) - len(line.lstrip())] if keep_indent else ""
+        pieces = []
+        last = 0
+        for literal in STRING_LITERAL.finditer(line):
+            code = line[last : literal.start()]
+            pieces.append(" ".join(SPACE_NEAR_SYMBOL.sub("", code).split()))
+            pieces.append(literal.group())
+            last = literal.end()
+        pieces.append(" ".join(SPACE_NEAR_SYMBOL.sub("", line[last:]).split()))
+        return indent + "".join(pieces)
+
+    @staticmethod
+    def _hunks(diff_content: str) -> Iterator[List[str]]:
+        """Split a unified diff into hunks (a diff without @@ headers is one hunk)"""
+        hunk = []
+        for line in diff_content.split("\n"):
+            if line.startswith("@@"):
+                if hunk:
+                    yield hunk
+                hunk = []
+            elif not line.startswith("\\"):  # "\ No newline at end of file" is not a line
+                hunk.append(line)
+        if hunk:
+            yield hunk
+
+    def _code_runs(self, f: FileChange) -> Iterator[Tuple[List[str], List[str]]]:
         """
-        # Build the prompt
-        prompt = self.ANALYSIS_PROMPT.format(
-            commit_hash=commit_info["short_hash"],
+        Split a diff into runs of changed code lines as (removed, added) pairs.
+        A run ends at a context line or hunk header, so each pair covers one spot
+        in the file. Blank and comment lines are left out.
+        """
+        marker = MULTILINE_STRING_MARKERS.get(f.language)
+        for hunk in self._hunks(f.diff_content):
+            # The hunk may start inside a multi-line string, so any opener makes its
+            # comment markers ambiguous: then every line counts as code
+            strings = marker is not None and any(marker.search(line) for line in hunk)
+            old, new = _CommentTracker(f.language), _CommentTracker(f.language)
+            removed, added = [], []
+            for line in hunk:
+                text = line[1:]
+                if line.startswith("-") and not line.startswith("---"):
+                    if not old.is_comment(text) or strings:
+                        removed.append(text)
+                elif line.startswith("+") and not line.startswith("+++"):
+                    if not new.is_comment(text) or strings:
+                        added.append(text)
+                else:
+                    old.is_comment(text)
+                    new.is_comment(text)
+                    if removed or added:
+                        yield removed, added
+                    removed, added = [], []
+            if removed or added:
+                yield removed, added
+
+    def _is_cosmetic(self, f: FileChange) -> bool:
+        """True if a modified file only changes whitespace and comments"""
+        if f.change_type != "modified" or f.diff_content == "[binary file]":
+            return False
+        if not any(self._changed_lines(f.diff_content)):
+            return False
+        keep_indent = f.language is None or f.language in INDENT_SENSITIVE_LANGUAGES
+
+        def code(lines):
+            return [self._normalize_code_line(line, keep_indent) for line in lines if line.strip()]
+
+        # Compare each run in place: a line moved past a context line or into another
+        # hunk leaves one run with only a removal and another with only an addition
+        return all(code(removed) == code(added) for removed, added in self._code_runs(f))
+
+    def _is_version_bump(self, f: FileChange) -> bool:
+        """True if a packaging file only changes its version line"""
+        if Path(f.path).name not in VERSION_FILES or f.change_type != "modified":
+            return False
+        added, removed = self._changed_lines(f.diff_content)
+        changed = added + removed
+        return bool(changed) and all(VERSION_LINE.match(line) for line in changed)
+
+    def _trivial_analysis(
+        self, commit_info: dict, files: List[FileChange]
+    ) -> Optional[SemanticAnalysis]:
+        """
+        Classify low-complexity commits locally so they skip the LLM call.
+        Handles documentation-only, whitespace/comment-only and version-bump commits.
+        Returns None for anything else.
+        """
+        if not files:
+            return None
+
+        docs = [f for f in files if Path(f.path).suffix.lower() in DOC_EXTENSIONS]
+        rest = [f for f in files if f not in docs]
+
+        if not rest:
+            summary = "Update documentation"
+            reasoning = "Only documentation files changed; no code paths are affected."
+            components = ["documentation"]
+        elif all(self._is_version_bump(f) for f in rest):
+            summary = "Bump the package version"
+            reasoning = "Only version fields in packaging files changed (plus docs, if any)."
+            components = ["packaging"]
+        elif all(self._is_cosmetic(f) for f in rest):
+            summary = "Cosmetic cleanup (whitespace/comments)"
+            reasoning = (
+                "Changed lines differ only in whitespace or comments; behavior is unchanged."
+            )
+            components = sorted({f.language or "other" for f in rest})
+        else:
+            return None
+
+        self.last_usage = dict(NO_USAGE)
+        # Every value here is produced locally with the right type: skip validation
+        return SemanticAnalysis.model_construct(
+            commit_hash=commit_info["hash"],
             commit_message=commit_info["message"],
             author=commit_info["author"],
             date=commit_info["date"],
-            project_context=self._format_project_context(project_context),
-            files_summary=self._format_files_summary(files),
-            diffs=self._format_diffs(files),
+            files_changed=files,
+            intent=Intent.model_construct(summary=summary, reasoning=reasoning, confidence=0.9),
+            impact_map=ImpactMap.model_construct(affected_components=components),
+            risk_assessment=RiskAssessment.model_construct(overall_risk=RiskLevel.LOW),
+            review_questions=[],
+            analysis_model=LOCAL_RULES_MODEL,
+            analysis_timestamp=analysis_timestamp(),
+            tokens_used=0,
         )
 
-        # Call Claude with retry
-        response = self._call_api_with_retry(prompt)
+    def _build_prompt(
+        self, commit_info: dict, files: List[FileChange], project_context: dict
+    ) -> str:
+        """Fill the per-commit part of the prompt (instructions are added in _request_params)"""
+        values = {
+            "commit_hash": commit_info["short_hash"],
+            "commit_message": commit_info["message"],
+            "author": commit_info["author"],
+            "date": commit_info["date"],
+            "project_context": self._format_project_context(project_context),
+            "files_summary": self._format_files_summary(files),
+            "diffs": self._format_diffs(files),
+        }
+        return "".join(
+            literal + (values[field] if field else "")
+            for literal, field in self.COMMIT_PROMPT_PARTS
+        )
+
+    def _diff_digest(self, files: List[FileChange]) -> str:
+        """
+        Hash of each file's path and changed lines.
+        Hunk headers and context are left out, so cherry-picks and rebases keep the digest.
+        """
+        digest = hashlib.sha256()
+        for f in files:
+            added, removed = self._changed_lines(f.diff_content)
+            digest.update(f"{f.path}\0{f.change_type}\0".encode("utf-8"))
+            digest.update("\n".join(removed).encode("utf-8") + b"\0")
+            digest.update("\n".join(added).encode("utf-8") + b"\0")
+        return digest.hexdigest()
 
-        self.last_usage = {
+    def _cache_lookup(
+        self, commit_info: dict, files: List[FileChange], prompt: str
+    ) -> Optional[SemanticAnalysis]:
+        """Serve from cache when the same (or a near-identical) commit was analyzed before"""
+        if self.cache is None:
+            return None
+
+        cache_key = self.cache.make_key(self.model, commit_info["hash"], prompt)
+        similarity_text = f"{commit_info['message']}\n{self._format_files_summary(files)}"
+        cached = self.cache.get(cache_key, self.model, similarity_text, self._diff_digest(files))
+        if cached is None:
+            return None
+
+        self.last_usage = dict(NO_USAGE)
+        # A similarity hit may come from another commit - rebind to this one.
+        # tokens_used=0 marks it as not produced by a model call for this commit.
+        return cached.model_copy(
+            update={
+                "commit_hash": commit_info["hash"],
+                "commit_message": commit_info["message"],
+                "author": commit_info["author"],
+                "date": commit_info["date"],
+                "files_changed": files,
+                "tokens_used": 0,
+            }
+        )
+
+    def _cache_store(
+        self, commit_info: dict, files: List[FileChange], prompt: str, analysis: SemanticAnalysis
+    ) -> None:
+        if self.cache is None:
+            return
+        cache_key = self.cache.make_key(self.model, commit_info["hash"], prompt)
+        similarity_text = f"{commit_info['message']}\n{self._format_files_summary(files)}"
+        self.cache.put(cache_key, self.model, analysis, similarity_text, self._diff_digest(files))
+
+    def _build_analysis(
+        self, commit_info: dict, files: List[FileChange], response
+    ) -> SemanticAnalysis:
+        """Turn a Messages API response into a SemanticAnalysis"""
+        # Keep a local copy: concurrent analyze_async calls share self.last_usage
+        usage = {
             "input_tokens": response.usage.input_tokens,
             "output_tokens": response.usage.output_tokens,
             "total_tokens": response.usage.input_tokens + response.usage.output_tokens,
+            "cache_creation_input_tokens": getattr(
+                response.usage, "cache_creation_input_tokens", None
+            )
+            or 0,
+            "cache_read_input_tokens": getattr(response.usage, "cache_read_input_tokens", None)
+            or 0,
         }
+        self.last_usage = usage
 
         # Parse and validate response
         response_text = response.content[0].text
         data = self._parse_response(response_text)
         data = self._validate_response_data(data)
 
-        # Build structured response
-        intent = Intent(
-            summary=data["intent"]["summary"],
-            reasoning=data["intent"]["reasoning"],
-            confidence=data["intent"]["confidence"],
-        )
+        # Normalize severities, then let pydantic-core build the whole tree in one call
+        impact_map = data["impact_map"]
+        risk_assessment = data["risk_assessment"]
+        for impact in impact_map["direct_impacts"] + impact_map["indirect_impacts"]:
+            impact["severity"] = risk_level(impact.get("severity"))
+        risk_assessment["overall_risk"] = risk_level(risk_assessment["overall_risk"])
+        for risk in risk_assessment["risks"]:
+            risk["severity"] = risk_level(risk.get("severity"))
+        for question in data["review_questions"]:
+            question["priority"] = risk_level(question.get("priority", "medium"))
 
-        impact_map = ImpactMap(
-            direct_impacts=[
-                Impact(
-                    area=i["area"], description=i["description"], severity=RiskLevel(i["severity"])
-                )
-                for i in data["impact_map"].get("direct_impacts", [])
-            ],
-            indirect_impacts=[
-                Impact(
-                    area=i["area"], description=i["description"], severity=RiskLevel(i["severity"])
-                )
-                for i in data["impact_map"].get("indirect_impacts", [])
-            ],
-            affected_components=data["impact_map"].get("affected_components", []),
+        return SemanticAnalysis.model_validate(
+            {
+                "commit_hash": commit_info["hash"],
+                "commit_message": commit_info["message"],
+                "author": commit_info["author"],
+                "date": commit_info["date"],
+                "files_changed": files,
+                "intent": data["intent"],
+                "impact_map": impact_map,
+                "risk_assessment": risk_assessment,
+                "review_questions": data["review_questions"],
+                "analysis_model": self.model,
+                "analysis_timestamp": analysis_timestamp(),
+                "tokens_used": usage["total_tokens"],
+            }
         )
 
-        risk_assessment = RiskAssessment(
-            overall_risk=RiskLevel(data["risk_assessment"]["overall_risk"]),
-            risks=[
-                Risk(
-                    description=r["description"],
-                    severity=RiskLevel(r["severity"]),
-                    mitigation=r.get("mitigation"),
-                    edge_cases=r.get("edge_cases", []),
-                )
-                for r in data["risk_assessment"].get("risks", [])
-            ],
-            breaking_changes=data["risk_assessment"].get("breaking_changes", False),
-            requires_migration=data["risk_assessment"].get("requires_migration", False),
+    def analyze(
+        self,
+        commit_info: dict,
+        files: List[FileChange],
+        project_context: dict,
+        on_text: Optional[Callable[[str], None]] = None,
+        on_retry: Optional[Callable[[], None]] = None,
+    ) -> SemanticAnalysis:
+        """
+        Analyze a commit using Claude.
+        Returns structured SemanticAnalysis.
+        If on_text is given, the response is streamed and each text chunk is
+        passed to it as soon as it arrives. on_retry is called before a failed
+        request is retried, i.e. before the text starts over.
+        """
+        trivial = self._trivial_analysis(commit_info, files)
+        if trivial is not None:
+            return trivial
+
+        prompt = self._build_prompt(commit_info, files, project_context)
+
+        cached = self._cache_lookup(commit_info, files, prompt)
+        if cached is not None:
+            return cached
+
+        # Call Claude with retry
+        response = self._call_api_with_retry(prompt, on_text=on_text, on_retry=on_retry)
+
+        analysis = self._build_analysis(commit_info, files, response)
+        self._cache_store(commit_info, files, prompt, analysis)
+        return analysis
+
+    def _prepare_prompt(
+        self, commit_info: dict, files: List[FileChange], project_context: dict
+    ) -> Tuple[Optional[SemanticAnalysis], Optional[str]]:
+        """
+        CPU-bound part of an analysis: local fast path, diff compression, prompt building.
+        Returns (analysis, None) for trivial commits, otherwise (None, prompt).
+        Touches no I/O, so it is safe to run in a worker thread.
+        """
+        trivial = self._trivial_analysis(commit_info, files)
+        if trivial is not None:
+            return trivial, None
+        return None, self._build_prompt(commit_info, files, project_context)
+
+    async def _analyze_async(
+        self,
+        commit_info: dict,
+        files: List[FileChange],
+        project_context: dict,
+        client: anthropic.AsyncAnthropic,
+        request_slot: AbstractAsyncContextManager,
+    ) -> SemanticAnalysis:
+        # Prepare in a worker thread so the event loop keeps serving in-flight requests
+        loop = asyncio.get_running_loop()
+        trivial, prompt = await loop.run_in_executor(
+            None, self._prepare_prompt, commit_info, files, project_context
         )
+        if trivial is not None:
+            return trivial
+
+        # The sqlite-backed cache stays on the event loop thread
+        cached = self._cache_lookup(commit_info, files, prompt)
+        if cached is not None:
+            return cached
+
+        async with request_slot:
+            response = await self._acall_api_with_retry(client, prompt)
 
-        review_questions = [
-            ReviewQuestion(
-                question=q["question"],
-                context=q["context"],
-                priority=RiskLevel(q.get("priority", "medium")),
+        analysis = self._build_analysis(commit_info, files, response)
+        self._cache_store(commit_info, files, prompt, analysis)
+        return analysis
+
+    async def analyze_async(
+        self, commit_info: dict, files: List[FileChange], project_context: dict
+    ) -> SemanticAnalysis:
+        """Async variant of analyze - neither prompt building nor the API call block the loop"""
+        async with self._async_client() as client:
+            return await self._analyze_async(
+                commit_info, files, project_context, client, nullcontext()
             )
-            for q in data.get("review_questions", [])
-        ]
 
-        return SemanticAnalysis(
-            commit_hash=commit_info["hash"],
-            commit_message=commit_info["message"],
-            author=commit_info["author"],
-            date=commit_info["date"],
-            files_changed=files,
-            intent=intent,
-            impact_map=impact_map,
-            risk_assessment=risk_assessment,
-            review_questions=review_questions,
-            analysis_model=self.model,
-            analysis_timestamp=datetime.now().isoformat(),
-            tokens_used=self.last_usage["total_tokens"],
-        )
+    async def analyze_many(
+        self, jobs: List[Tuple[dict, List[FileChange], dict]], max_concurrency: int = 8
+    ) -> List[SemanticAnalysis]:
+        """
+        Analyze several commits concurrently.
+        Each job is a (commit_info, files, project_context) tuple; results keep job order.
+        At most max_concurrency requests are in flight at once; prompts for queued
+        jobs are prepared in the meantime so they can be sent as soon as a slot frees up.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async with self._async_client() as client:
+            return list(
+                await asyncio.gather(
+                    *(self._analyze_async(*job, client, semaphore) for job in jobs)
+                )
+            )
+
+    def analyze_batch(
+        self,
+        jobs: List[Tuple[dict, List[FileChange], dict]],
+        poll_interval: float = 10.0,
+        max_wait: Optional[float] = None,
+    ) -> List[SemanticAnalysis]:
+        """
+        Analyze many commits through the Message Batches API.
+        Cheaper than one request per commit and not subject to per-request
+        rate limits, but results arrive asynchronously - meant for CI/nightly runs.
+        Jobs that error in the batch are retried through the regular API.
+        Results keep job order.
+        """
+        results: List[Optional[SemanticAnalysis]] = [None] * len(jobs)
+        prompts = {}
+        requests = []
+
+        for index, (commit_info, files, project_context) in enumerate(jobs):
+            trivial = self._trivial_analysis(commit_info, files)
+            if trivial is not None:
+                results[index] = trivial
+                continue
+            prompt = self._build_prompt(commit_info, files, project_context)
+            cached = self._cache_lookup(commit_info, files, prompt)
+            if cached is not None:
+                results[index] = cached
+                continue
+            prompts[index] = prompt
+            requests.append({"custom_id": f"job-{index}", "params": self._request_params(prompt)})
+
+        if requests:
+            batch = self.client.messages.batches.create(requests=requests)
+            # Budget real elapsed time (retrieve calls included), not just the nominal sleeps
+            deadline = None if max_wait is None else time.monotonic() + max_wait
+            while batch.processing_status != "ended":
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RuntimeError(
+                            f"Message batch {batch.id} did not finish within {max_wait:.0f}s"
+                        )
+                    time.sleep(min(poll_interval, remaining))
+                else:
+                    time.sleep(poll_interval)
+                batch = self.client.messages.batches.retrieve(batch.id)
+
+            for entry in self.client.messages.batches.results(batch.id):
+                index = int(entry.custom_id.split("-", 1)[1])
+                commit_info, files, _ = jobs[index]
+                if entry.result.type == "succeeded":
+                    response = entry.result.message
+                else:
+                    logger.warning(
+                        f"Batch request for {commit_info['short_hash']} {entry.result.type}, "
+                        "retrying individually"
+                    )
+                    response = self._call_api_with_retry(prompts[index])
+                analysis = self._build_analysis(commit_info, files, response)
+                self._cache_store(commit_info, files, prompts[index], analysis)
+                results[index] = analysis
+
+        # Anything the batch did not report back at all goes through the regular path
+        for index, result in enumerate(results):
+            if result is None:
+                commit_info, files, _ = jobs[index]
+                response = self._call_api_with_retry(prompts[index])
+                results[index] = self._build_analysis(commit_info, files, response)
+                self._cache_store(commit_info, files, prompts[index], results[index])
+
+        return results
@@ -0,0 +1,108 @@
+"""
+Client-side rate limiter for Claude API calls
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Callable
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and input tokens per minute.
+
+    Capacity is reserved up front, so concurrent callers queue behind each other
+    instead of all firing and collecting 429s. Reservations may drive a bucket
+    negative; the caller then waits until it refills.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 40,
+        tokens_per_minute: float = 16000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if requests_per_minute <= 0 or tokens_per_minute <= 0:
+            raise ValueError(
+                "Rate limits must be positive, got "
+                f"{requests_per_minute} requests and {tokens_per_minute} tokens per minute"
+            )
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Limiter sized by SEMANTIC_DIFF_RPM / SEMANTIC_DIFF_TPM (defaults otherwise)"""
+        return cls(
+            requests_per_minute=cls._env_limit("SEMANTIC_DIFF_RPM", "40"),
+            tokens_per_minute=cls._env_limit("SEMANTIC_DIFF_TPM", "16000"),
+        )
+
+    @staticmethod
+    def _env_limit(name: str, default: str) -> float:
+        value = os.getenv(name, default)
+        try:
+            limit = float(value)
+        except ValueError:
+            limit = 0.0
+        # NaN fails every comparison, so test for the valid range
+        if not 0 < limit < float("inf"):
+            raise ValueError(f"{name} must be a positive number, got {value!r}")
+        return limit
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(
+            self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60
+        )
+        self._tokens = min(
+            self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserve capacity for one request of about tokens input tokens.
+        Returns how many seconds the caller must wait before sending it.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+
+            # A single oversized request would otherwise never fit
+            tokens = min(tokens, self.tokens_per_minute)
+            self._requests -= 1
+            self._tokens -= tokens
+
+            return max(
+                0.0,
+                -self._requests * 60 / self.requests_per_minute,
+                -self._tokens * 60 / self.tokens_per_minute,
+                self._blocked_until - now,
+            )
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of tokens input tokens may be sent"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int) -> None:
+        """Async variant of acquire"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def penalize(self, delay: float) -> None:
+        """Hold back all new requests for delay seconds (after a 429 slipped through)"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + delay)
@@ -0,0 +1,187 @@
+"""
+Analysis cache - reuses previous LLM results for identical or near-identical commits
+"""
+
+import hashlib
+import math
+import re
+import sqlite3
+import time
+from array import array
+from pathlib import Path
+from typing import List, Optional, Union
+
+from semantic_diff.models import SemanticAnalysis
+
+
+class SemanticCache:
+    """
+    Two-tier cache for SemanticAnalysis results.
+
+    Tier 1 is an exact match on a key - either a hash of (model, commit hash,
+    prompt) or, when no prompt has been built yet, of (commit hash, model,
+    prompt version). Tier 2 compares a lightweight embedding of the commit message and file
+    summary against previous entries for the same model and diff digest, and only accepts
+    near-identical matches (rebases, cherry-picks, CI re-runs).
+    """
+
+    EMBEDDING_DIM = 256
+    TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+    # Columns added after the first schema; rows without a diff digest never match tier 2
+    ADDED_COLUMNS = {"last_used": "REAL NOT NULL DEFAULT 0", "diff_digest": "TEXT"}
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        ttl: Optional[float] = None,
+        similarity_threshold: float = 0.95,
+        max_entries: Optional[int] = None,
+    ):
+        """
+        Open (or create) a cache database at path.
+        Entries older than ttl seconds are ignored; None keeps them forever.
+        With max_entries, the least recently used entries are evicted on put.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            "key TEXT PRIMARY KEY, "
+            "model TEXT NOT NULL, "
+            "embedding BLOB, "
+            "diff_digest TEXT, "
+            "analysis TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        # Databases created by older versions lack later columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(analyses)")}
+        for column, definition in self.ADDED_COLUMNS.items():
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE analyses ADD COLUMN {column} {definition}")
+        if "last_used" not in columns:
+            self._conn.execute("UPDATE analyses SET last_used = created_at")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, commit_hash: str, prompt: str) -> str:
+        """Build the exact-match key for a prompt"""
+        return hashlib.sha256(f"{model}|{commit_hash}|{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_commit_key(commit_hash: str, model: str, prompt_version: str) -> str:
+        """
+        Build a key from the commit alone, usable before any diff or prompt is built.
+        Commits are immutable, so hash + model + prompt version fully determine the result.
+        """
+        return hashlib.sha256(f"{commit_hash}|{model}|{prompt_version}".encode("utf-8")).hexdigest()
+
+    def embed(self, text: str) -> List[float]:
+        """
+        Embed text as a normalized hashed bag-of-tokens vector.
+        Cheap and dependency-free; good enough to spot near-duplicates.
+        """
+        vector = [0.0] * self.EMBEDDING_DIM
+        for token in self.TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.EMBEDDING_DIM
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm == 0:
+            return vector
+        return [v / norm for v in vector]
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(
+        self, key: str, model: str, text: Optional[str] = None, digest: Optional[str] = None
+    ) -> Optional[SemanticAnalysis]:
+        """
+        Look up a cached analysis.
+        Tries the exact key first, then (if text is given) the similarity tier,
+        which only considers entries stored with the same digest.
+        """
+        row = self._conn.execute(
+            "SELECT analysis, created_at FROM analyses WHERE key = ?", (key,)
+        ).fetchone()
+        if row and not self._is_expired(row[1]):
+            self._touch(key)
+            return SemanticAnalysis.model_validate_json(row[0])
+
+        if text is None:
+            return None
+
+        query = self.embed(text)
+        best_score = 0.0
+        best_key = None
+        best_analysis = None
+        for entry_key, analysis_json, embedding, created_at in self._conn.execute(
+            "SELECT key, analysis, embedding, created_at FROM analyses "
+            "WHERE model = ? AND diff_digest IS ? AND embedding IS NOT NULL",
+            (model, digest),
+        ):
+            if self._is_expired(created_at):
+                continue
+            stored = array("f")
+            stored.frombytes(embedding)
+            score = sum(a * b for a, b in zip(query, stored))
+            if score > best_score:
+                best_score = score
+                best_key = entry_key
+                best_analysis = analysis_json
+
+        if best_analysis is not None and best_score >= self.similarity_threshold:
+            self._touch(best_key)
+            return SemanticAnalysis.model_validate_json(best_analysis)
+        return None
+
+    def _touch(self, key: str) -> None:
+        self._conn.execute("UPDATE analyses SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+    def put(
+        self,
+        key: str,
+        model: str,
+        analysis: SemanticAnalysis,
+        text: Optional[str] = None,
+        digest: Optional[str] = None,
+    ) -> None:
+        """Store an analysis under key (and its embedding and digest if text is given)"""
+        embedding = array("f", self.embed(text)).tobytes() if text is not None else None
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO analyses "
+            "(key, model, embedding, diff_digest, analysis, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model, embedding, digest, analysis.model_dump_json(), now, now),
+        )
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM analyses WHERE key NOT IN "
+                "(SELECT key FROM analyses ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+        self._conn.commit()
+
+    def invalidate(self, key: str) -> bool:
+        """Remove a single entry. Returns True if something was removed."""
+        cursor = self._conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+        self._conn.commit()
+        return cursor.rowcount > 0
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        self._conn.execute("DELETE FROM analyses")
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
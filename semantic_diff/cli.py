@@ -2,19 +2,45 @@
 CLI interface for semantic-diff
 """
 
+import importlib
 import os
+import shlex
+import shutil
 import stat
 import sys
 from pathlib import Path
+from typing import TYPE_CHECKING, Tuple
 
 import click
 
-from semantic_diff.analyzers.llm_analyzer import LLMAnalyzer
-from semantic_diff.formatters.console_formatter import ConsoleFormatter
-from semantic_diff.formatters.markdown_formatter import MarkdownFormatter
-from semantic_diff.parsers.git_parser import GitParser
+if TYPE_CHECKING:
+    from semantic_diff.analyzers.llm_analyzer import PROMPT_VERSION, LLMAnalyzer, resolve_model
+    from semantic_diff.analyzers.rate_limiter import RateLimiter
+    from semantic_diff.cache import SemanticCache
+    from semantic_diff.formatters.console_formatter import ConsoleFormatter
+    from semantic_diff.formatters.markdown_formatter import MarkdownFormatter
+    from semantic_diff.parsers.git_parser import GitParser
+
+# The analysis stack (anthropic, pydantic, rich, GitPython) takes most of a second
+# to import. Only `analyze` needs it, so --help, init and uninstall skip it.
+LAZY_IMPORTS = {
+    "PROMPT_VERSION": "semantic_diff.analyzers.llm_analyzer",
+    "LLMAnalyzer": "semantic_diff.analyzers.llm_analyzer",
+    "resolve_model": "semantic_diff.analyzers.llm_analyzer",
+    "RateLimiter": "semantic_diff.analyzers.rate_limiter",
+    "SemanticCache": "semantic_diff.cache",
+    "ConsoleFormatter": "semantic_diff.formatters.console_formatter",
+    "MarkdownFormatter": "semantic_diff.formatters.markdown_formatter",
+    "GitParser": "semantic_diff.parsers.git_parser",
+}
 
 REPORTS_DIR_NAME = "semantic_diff_reports"
+CACHE_DIR_NAME = ".semantic_diff_cache"
+CACHE_MAX_ENTRIES = 256
+CACHE_SIMILARITY_THRESHOLD = 0.95
+BATCH_CONCURRENCY = 4
+# Beyond this many files (think initial imports) the prompt could not use them anyway
+MAX_FILES_PER_COMMIT = 200
 
 PRE_PUSH_HOOK = """#!/bin/bash
 # semantic-diff pre-push hook
@@ -23,22 +49,50 @@ PRE_PUSH_HOOK = """#!/bin/bash
 remote="$1"
 url="$2"
 
+shas=()
 while read local_ref local_sha remote_ref remote_sha; do
     if [ "$local_sha" = "0000000000000000000000000000000000000000" ]; then
         continue
     fi
+    shas+=("$local_sha")
+done
 
-    echo "Running semantic-diff on: $local_sha"
-    semantic-diff "$local_sha" --save
+if [ ${#shas[@]} -eq 0 ]; then
+    exit 0
+fi
 
-    if [ $? -ne 0 ]; then
-        echo "semantic-diff analysis failed"
-        exit 1
-    fi
-done
+# One process analyzes all pushed refs concurrently
+echo "Running semantic-diff on: ${shas[*]}"
+@SEMANTIC_DIFF@ analyze-batch "${shas[@]}" --save
+
+if [ $? -ne 0 ]; then
+    echo "semantic-diff analysis failed"
+    exit 1
+fi
 
 exit 0
 """
+# Filled in by `init` with the command that installed the hook (see _hook_command)
+HOOK_COMMAND_PLACEHOLDER = "@SEMANTIC_DIFF@"
+
+
+def __getattr__(name: str):
+    """Import analysis dependencies on first access (PEP 562)"""
+    if name not in LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(LAZY_IMPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def _load_analysis_deps(*names: str) -> None:
+    """
+    Bind lazy imports (all of them if no names are given) as module globals,
+    keeping any already set (e.g. patched)
+    """
+    for name in names or LAZY_IMPORTS:
+        if name not in globals():
+            __getattr__(name)
 
 
 @click.group()
@@ -49,6 +103,8 @@ def main():
     \b
     Commands:
       semantic-diff <commit>     Analyze a commit (default: HEAD)
+      semantic-diff analyze-batch <commit>...
+                                 Analyze several commits concurrently
       semantic-diff init         Install pre-push hook
       semantic-diff uninstall    Remove pre-push hook
 
@@ -69,6 +125,17 @@ def main():
 @click.option("--save", "-s", is_flag=True, help="Save report to semantic_diff_reports/")
 @click.option("--brief", "-b", is_flag=True, help="Brief output (intent + risk + top questions)")
 @click.option("--verbose", "-v", is_flag=True, help="Verbose output")
+@click.option(
+    "--cache", "use_cache", is_flag=True, help=f"Reuse analyses cached in {CACHE_DIR_NAME}/"
+)
+@click.option(
+    "--cache-threshold",
+    type=click.FloatRange(0.0, 1.0),
+    default=CACHE_SIMILARITY_THRESHOLD,
+    show_default=True,
+    help="Similarity above which a near-duplicate commit's cached analysis is reused",
+)
+@click.option("--stream", is_flag=True, help="Show the intent live while the model responds")
 def analyze_cmd(
     commit_hash: str,
     repo: str,
@@ -77,9 +144,23 @@ def analyze_cmd(
     save: bool,
     brief: bool,
     verbose: bool,
+    use_cache: bool,
+    cache_threshold: float,
+    stream: bool,
 ):
     """Analyze a git commit semantically."""
-    _do_analyze(commit_hash, repo, model, output_json, save, brief, verbose)
+    _do_analyze(
+        commit_hash,
+        repo,
+        model,
+        output_json,
+        save,
+        brief,
+        verbose,
+        use_cache,
+        cache_threshold,
+        stream,
+    )
 
 
 # Also register as default command (when called without subcommand)
@@ -90,6 +171,25 @@ def default_command(ctx, *args, **kwargs):
     pass
 
 
+def _open_cache(git_root: Path, similarity_threshold: float) -> "SemanticCache":
+    """Open the per-repository analysis cache, keeping it out of git"""
+    cache_dir = git_root / CACHE_DIR_NAME
+    cache_dir.mkdir(exist_ok=True)
+    gitignore = cache_dir / ".gitignore"
+    if not gitignore.exists():
+        gitignore.write_text("*\n")
+    return SemanticCache(
+        cache_dir / "analyses.db",
+        similarity_threshold=similarity_threshold,
+        max_entries=CACHE_MAX_ENTRIES,
+    )
+
+
+def _project_context(repo_path: str) -> dict:
+    """Project context from a parser of its own: GitPython repos are not thread-safe"""
+    return GitParser(repo_path).get_project_context()
+
+
 def _do_analyze(
     commit_hash: str,
     repo: str,
@@ -98,8 +198,20 @@ def _do_analyze(
     save: bool,
     brief: bool,
     verbose: bool,
+    use_cache: bool = False,
+    cache_threshold: float = CACHE_SIMILARITY_THRESHOLD,
+    stream: bool = False,
 ):
     """Core analysis logic."""
+    # Rich is only needed to render: --json runs never import it
+    _load_analysis_deps(
+        "GitParser", "LLMAnalyzer", "PROMPT_VERSION", "resolve_model", "SemanticCache"
+    )
+    if not output_json:
+        _load_analysis_deps("ConsoleFormatter")
+    if save:
+        _load_analysis_deps("MarkdownFormatter")
+
     # Mutual exclusion: --brief and --verbose don't make sense together
     if brief and verbose:
         click.echo("Error: --brief and --verbose are mutually exclusive", err=True)
@@ -115,28 +227,66 @@ def _do_analyze(
             click.echo(f"Getting commit info for {commit_hash}...")
 
         commit_info = parser.get_commit_info(commit_hash)
-        files = parser.get_file_changes(commit_hash)
-        project_context = parser.get_project_context()
-
-        if verbose:
-            click.echo(f"Found {len(files)} changed files")
-            click.echo(f"Project languages: {project_context.get('languages', [])}")
-
-        if not files:
-            click.echo("No changes found in this commit.", err=True)
-            sys.exit(0)
-
-        if verbose:
-            click.echo("Calling LLM for analysis...")
 
-        analyzer = LLMAnalyzer(model=model)
-        analysis = analyzer.analyze(commit_info, files, project_context)
+        # Commits are immutable: a cached analysis for the same hash and model is final
+        cache = None
+        analysis = None
+        if use_cache:
+            cache = _open_cache(Path(parser.repo.working_dir), cache_threshold)
+            model_name = resolve_model(model)
+            cache_key = cache.make_commit_key(commit_info["hash"], model_name, PROMPT_VERSION)
+            analysis = cache.get(cache_key, model_name)
+            if analysis is not None and verbose:
+                click.echo("Using cached analysis")
+
+        if analysis is None:
+            # The project context walks the whole tree but only feeds the prompt, so build
+            # it in the background while this thread extracts the diff
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                context_future = pool.submit(_project_context, parser.repo_path)
+                # One past the cap tells a truncated commit from one that fits exactly
+                files = parser.get_file_changes(commit_info["hash"], MAX_FILES_PER_COMMIT + 1)
+                project_context = context_future.result()
+
+            if len(files) > MAX_FILES_PER_COMMIT:
+                files = files[:MAX_FILES_PER_COMMIT]
+                click.echo(f"Analyzing only the first {MAX_FILES_PER_COMMIT} files.", err=True)
+            if verbose:
+                click.echo(f"Found {len(files)} changed files")
+                click.echo(f"Project languages: {project_context.get('languages', [])}")
+
+            if not files:
+                click.echo("No changes found in this commit.", err=True)
+                sys.exit(0)
+
+            if verbose:
+                click.echo("Calling LLM for analysis...")
+
+            if cache is not None:
+                # Second tier: the analyzer reuses results of near-duplicate commits
+                # (cherry-picks, rebases, revert/reapply) above cache_threshold
+                analyzer = LLMAnalyzer(model=model, cache=cache)
+            else:
+                analyzer = LLMAnalyzer(model=model)
+            # JSON output stays machine-readable, so only the console view streams
+            if stream and not output_json:
+                with ConsoleFormatter(brief=brief).stream_progress() as (on_text, on_retry):
+                    analysis = analyzer.analyze(
+                        commit_info, files, project_context, on_text=on_text, on_retry=on_retry
+                    )
+            else:
+                analysis = analyzer.analyze(commit_info, files, project_context)
+
+            # Only results of a real model call are final for this commit: trivial and
+            # cache-served analyses report tokens_used=0 and are rebuilt cheaply anyway
+            if cache is not None and analysis.tokens_used:
+                cache.put(cache_key, model_name, analysis)
 
         if output_json:
-            import json
-
-            data = analysis.model_dump()
-            click.echo(json.dumps(data, indent=2, default=str))
+            # Serialized straight from the model by pydantic-core, no intermediate dict
+            click.echo(analysis.model_dump_json(indent=2))
         else:
             formatter = ConsoleFormatter(brief=brief)
             formatter.format(analysis)
@@ -161,6 +311,131 @@ def _do_analyze(
         sys.exit(1)
 
 
+@main.command(name="analyze-batch")
+@click.argument("commit_hashes", nargs=-1, required=True)
+@click.option("--repo", "-r", default=".", help="Path to git repository")
+@click.option("--model", "-m", default=None, help="Claude model to use")
+@click.option("--save", "-s", is_flag=True, help=f"Save reports to {REPORTS_DIR_NAME}/")
+@click.option("--brief", "-b", is_flag=True, help="Compact output")
+@click.option(
+    "--cache", "use_cache", is_flag=True, help=f"Reuse analyses cached in {CACHE_DIR_NAME}/"
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=BATCH_CONCURRENCY,
+    show_default=True,
+    help="Maximum concurrent LLM requests",
+)
+def analyze_batch_cmd(
+    commit_hashes: Tuple[str, ...],
+    repo: str,
+    model: str,
+    save: bool,
+    brief: bool,
+    use_cache: bool,
+    jobs: int,
+):
+    """Analyze several commits concurrently (used by the pre-push hook)."""
+    # asyncio alone costs more to import than the rest of the CLI module
+    import asyncio
+
+    _load_analysis_deps()
+
+    try:
+        parser = GitParser(repo if repo != "." else None)
+        cache = (
+            _open_cache(Path(parser.repo.working_dir), CACHE_SIMILARITY_THRESHOLD)
+            if use_cache
+            else None
+        )
+        model_name = resolve_model(model)
+
+        # Resolve everything up front so a bad hash fails before any API call
+        commit_infos = {}
+        for commit_hash in commit_hashes:
+            info = parser.get_commit_info(commit_hash)
+            commit_infos.setdefault(info["hash"], info)
+
+        analyses = {}
+        uncached = []
+        for sha in commit_infos:
+            if cache is not None:
+                cached = cache.get(
+                    cache.make_commit_key(sha, model_name, PROMPT_VERSION), model_name
+                )
+                if cached is not None:
+                    analyses[sha] = cached
+                    continue
+            uncached.append(sha)
+
+        pending = []
+        changes = parser.get_file_changes_batch(
+            uncached, max_workers=jobs, max_files=MAX_FILES_PER_COMMIT + 1
+        )
+        for sha, files in changes.items():
+            commit_info = commit_infos[sha]
+            if not files:
+                click.echo(f"No changes found in {commit_info['short_hash']}.", err=True)
+                continue
+            if len(files) > MAX_FILES_PER_COMMIT:
+                files = files[:MAX_FILES_PER_COMMIT]
+                click.echo(
+                    f"Analyzing only the first {MAX_FILES_PER_COMMIT} files of "
+                    f"{commit_info['short_hash']}.",
+                    err=True,
+                )
+            pending.append((commit_info, files))
+
+        if pending:
+            project_context = parser.get_project_context()
+            analyzer = LLMAnalyzer(model=model, cache=cache)
+            # The concurrent requests share one budget instead of all collecting 429s.
+            # Built after the analyzer, which loads .env.
+            analyzer.rate_limiter = RateLimiter.from_env()
+            results = asyncio.run(
+                analyzer.analyze_many(
+                    [(info, files, project_context) for info, files in pending],
+                    max_concurrency=jobs,
+                )
+            )
+            for (commit_info, _), analysis in zip(pending, results):
+                analyses[commit_info["hash"]] = analysis
+                if cache is not None and analysis.tokens_used:
+                    cache.put(
+                        cache.make_commit_key(commit_info["hash"], model_name, PROMPT_VERSION),
+                        model_name,
+                        analysis,
+                    )
+
+        # Print in the order the commits were given, not completion order
+        ordered = [analyses[sha] for sha in commit_infos if sha in analyses]
+        formatter = ConsoleFormatter(brief=brief)
+        for analysis in ordered:
+            formatter.format(analysis)
+
+        if save:
+            reports_dir = Path(parser.repo.working_dir) / REPORTS_DIR_NAME
+            for saved_path in MarkdownFormatter().save_many(ordered, reports_dir):
+                click.echo(f"Report saved: {saved_path}")
+
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+def _hook_command() -> str:
+    """
+    Absolute command for the pre-push hook, resolved once at install time.
+    The hook then neither searches PATH nor depends on a virtualenv being active.
+    """
+    executable = shutil.which("semantic-diff")
+    if executable:
+        return shlex.quote(os.path.abspath(executable))
+    return f"{shlex.quote(sys.executable)} -m semantic_diff.cli"
+
+
 @main.command()
 @click.option("--repo", "-r", default=".", help="Path to git repository")
 @click.option("--force", "-f", is_flag=True, help="Overwrite existing hook")
@@ -188,7 +463,7 @@ def init(repo: str, force: bool):
             click.echo("Use --force to overwrite")
             sys.exit(1)
 
-        hook_path.write_text(PRE_PUSH_HOOK)
+        hook_path.write_text(PRE_PUSH_HOOK.replace(HOOK_COMMAND_PLACEHOLDER, _hook_command()))
         hook_path.chmod(hook_path.stat().st_mode | stat.S_IEXEC)
 
         click.echo(f"Installed pre-push hook: {hook_path}")
@@ -233,18 +508,24 @@ def uninstall(repo: str):
         sys.exit(1)
 
 
+KNOWN_COMMANDS = frozenset({"init", "uninstall", "analyze", "analyze-batch", "--help", "-h"})
+
+
 # Wrapper for backwards compatibility: semantic-diff HEAD
 def cli():
     """Entry point that handles both commands and direct commit analysis."""
     args = sys.argv[1:]
 
-    # If no args or first arg looks like a commit (not a known command)
-    known_commands = ["init", "uninstall", "analyze", "--help", "-h"]
+    # Fast path for the common `semantic-diff` / `semantic-diff <commit>`: with no
+    # options there is nothing for Click to parse, so skip building its context
+    if not args or (
+        len(args) == 1 and args[0] not in KNOWN_COMMANDS and not args[0].startswith("-")
+    ):
+        _do_analyze(args[0] if args else "HEAD", ".", None, False, False, False, False)
+        sys.exit(0)
 
-    if not args:
-        # No args: analyze HEAD
-        sys.argv = ["semantic-diff", "analyze", "HEAD"]
-    elif args[0] not in known_commands and not args[0].startswith("-"):
+    # If first arg looks like a commit (not a known command)
+    if args[0] not in KNOWN_COMMANDS and not args[0].startswith("-"):
         # First arg is not a command, treat as commit hash
         sys.argv = ["semantic-diff", "analyze"] + args
     elif args[0].startswith("-") and args[0] not in ["--help", "-h"]:
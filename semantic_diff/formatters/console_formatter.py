@@ -2,18 +2,59 @@
 Console formatter for semantic diff output using Rich
 """
 
+import json
+import re
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Tuple
+
 from rich import box
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.table import Table
 from rich.text import Text
 
-from semantic_diff.models import RiskLevel, SemanticAnalysis
+from semantic_diff.models import Impact, ReviewQuestion, Risk, RiskLevel, SemanticAnalysis
+
+# Value of a JSON string field, possibly still unterminated mid-stream
+PARTIAL_STRING_FIELD = r'"{}"\s*:\s*"((?:[^"\\]|\\.)*)'
+
+
+@lru_cache(maxsize=None)
+def get_console() -> Console:
+    """
+    Shared Console: probing the terminal and environment happens once per process.
+    Output still goes to whatever sys.stdout is at print time.
+    """
+    return Console()
+
+
+@lru_cache(maxsize=None)
+def partial_field_pattern(field: str) -> re.Pattern:
+    """Compiled PARTIAL_STRING_FIELD for field - re-run on every streamed chunk"""
+    return re.compile(PARTIAL_STRING_FIELD.format(re.escape(field)))
+
+
+def partial_json_string(text: str, field: str) -> Optional[str]:
+    """Extract a string field from incomplete JSON, decoding escapes where possible"""
+    match = partial_field_pattern(field).search(text)
+    if match is None:
+        return None
+    # A trailing half escape is never matched; a cut-off \uXXXX falls back to raw
+    raw = match.group(1)
+    try:
+        return json.loads(f'"{raw}"', strict=False)
+    except ValueError:
+        return raw
 
 
 class ConsoleFormatter:
     """Formats SemanticAnalysis for terminal output"""
 
+    PATH_WIDTH = 50
+    MAX_FILES_DISPLAY = 10
+
     RISK_COLORS = {
         RiskLevel.LOW: "green",
         RiskLevel.MEDIUM: "yellow",
@@ -28,8 +69,17 @@ class ConsoleFormatter:
         RiskLevel.CRITICAL: "🔥",
     }
 
+    # (icon, color) per level, so a row costs one lookup instead of two.
+    # Class attributes are only visible to a comprehension's outermost iterable.
+    RISK_DISPLAY = {
+        level: (icons[level], colors[level])
+        for icons, colors in [(RISK_ICONS, RISK_COLORS)]
+        for level in icons
+    }
+    UNKNOWN_DISPLAY = ("•", "white")
+
     def __init__(self, brief: bool = False):
-        self.console = Console()
+        self.console = get_console()
         self.brief = brief
 
     def _risk_style(self, level: RiskLevel) -> str:
@@ -38,6 +88,84 @@ class ConsoleFormatter:
     def _risk_icon(self, level: RiskLevel) -> str:
         return self.RISK_ICONS.get(level, "•")
 
+    @staticmethod
+    def _confidence_bar(confidence: float) -> str:
+        filled = int(confidence * 10)
+        return "█" * filled + "░" * (10 - filled)
+
+    # Row renderers yield (text, style) tokens for Text.append_tokens, which adds a
+    # whole block in one call instead of one Text.append per styled segment
+
+    def _impact_tokens(self, impacts: List[Impact]) -> Iterator[Tuple[str, Optional[str]]]:
+        display, unknown = self.RISK_DISPLAY, self.UNKNOWN_DISPLAY
+        for impact in impacts:
+            icon, color = display.get(impact.severity, unknown)
+            yield f"  {icon} ", color
+            yield f"{impact.area}: ", "bold"
+            yield f"{impact.description}\n", None
+
+    def _risk_tokens(self, risks: List[Risk]) -> Iterator[Tuple[str, Optional[str]]]:
+        display, unknown = self.RISK_DISPLAY, self.UNKNOWN_DISPLAY
+        for r in risks:
+            icon, color = display.get(r.severity, unknown)
+            yield f"\n  {icon} ", color
+            yield f"[{r.severity.value}] ", f"bold {color}"
+            yield f"{r.description}\n", None
+            if r.mitigation:
+                yield f"     💡 Mitigation: {r.mitigation}\n", "dim"
+            if r.edge_cases:
+                yield f"     ⚡ Edge cases: {', '.join(r.edge_cases)}\n", "dim"
+
+    def _question_tokens(
+        self, questions: List[ReviewQuestion], numbered: bool
+    ) -> Iterator[Tuple[str, Optional[str]]]:
+        display, unknown = self.RISK_DISPLAY, self.UNKNOWN_DISPLAY
+        for i, q in enumerate(questions, 1):
+            icon, color = display.get(q.priority, unknown)
+            if numbered:
+                yield f"{i}. ", "bold"
+                yield f"{q.question}\n", "bold"
+                yield f"   {icon} ", color
+                yield f"{q.context}\n\n", "dim"
+            else:
+                yield f"{icon} ", color
+                yield f"{q.question}\n", None
+
+    @contextmanager
+    def stream_progress(self) -> Iterator[Tuple[Callable[[str], None], Callable[[], None]]]:
+        """
+        Show the intent live while the analysis streams in.
+        Yields (on_text, on_retry) callbacks for LLMAnalyzer.analyze; the panel
+        disappears on exit.
+        """
+        received = []
+
+        def render() -> Panel:
+            text = "".join(received)
+            summary = partial_json_string(text, "summary")
+            reasoning = partial_json_string(text, "reasoning")
+            body = Text()
+            if summary is None:
+                body.append("Waiting for the model...", style="dim")
+            else:
+                body.append(summary, style="bold")
+            if reasoning:
+                body.append(f"\n\n{reasoning}")
+            return Panel(body, title="🎯 Intent (streaming)", border_style="green")
+
+        with Live(render(), console=self.console, transient=True, refresh_per_second=8) as live:
+
+            def on_text(chunk: str) -> None:
+                received.append(chunk)
+                live.update(render())
+
+            def on_retry() -> None:
+                # The retried request streams its response from the start
+                received.clear()
+                live.update(render(), refresh=True)
+
+            yield on_text, on_retry
+
     def format(self, analysis: SemanticAnalysis) -> None:
         """Print formatted analysis to console"""
 
@@ -65,9 +193,7 @@ class ConsoleFormatter:
         )
 
         # Intent - summary only
-        confidence_bar = "█" * int(analysis.intent.confidence * 10) + "░" * (
-            10 - int(analysis.intent.confidence * 10)
-        )
+        confidence_bar = self._confidence_bar(analysis.intent.confidence)
         self.console.print(
             Panel(
                 f"{analysis.intent.summary}\n\n"
@@ -108,11 +234,7 @@ class ConsoleFormatter:
             questions_to_show.extend(others[:remaining_slots])
 
             questions_text = Text()
-            for q in questions_to_show:
-                icon = self._risk_icon(q.priority)
-                color = self._risk_style(q.priority)
-                questions_text.append(f"{icon} ", style=color)
-                questions_text.append(f"{q.question}\n")
+            questions_text.append_tokens(self._question_tokens(questions_to_show, numbered=False))
 
             # Show count if there are more hidden
             hidden_count = len(analysis.review_questions) - len(questions_to_show)
@@ -142,30 +264,34 @@ class ConsoleFormatter:
 
         # Files changed summary
         files_table = Table(box=box.SIMPLE, show_header=True, header_style="bold")
-        files_table.add_column("File", style="cyan")
+        # Rich truncates long paths while measuring the column, no per-row slicing
+        files_table.add_column(
+            "File", style="cyan", max_width=self.PATH_WIDTH, overflow="ellipsis", no_wrap=True
+        )
         files_table.add_column("Change", style="dim")
         files_table.add_column("+", style="green", justify="right")
         files_table.add_column("-", style="red", justify="right")
         files_table.add_column("Lang", style="dim")
 
-        for f in analysis.files_changed[:10]:  # Limit to 10
+        # Only the displayed slice is turned into rows
+        files = analysis.files_changed
+        for f in files[: self.MAX_FILES_DISPLAY]:
             files_table.add_row(
-                f.path[:50] + "..." if len(f.path) > 50 else f.path,
+                f.path,
                 f.change_type,
                 str(f.additions),
                 str(f.deletions),
                 f.language or "-",
             )
 
-        if len(analysis.files_changed) > 10:
-            files_table.add_row(f"... and {len(analysis.files_changed) - 10} more", "", "", "", "")
+        hidden = len(files) - self.MAX_FILES_DISPLAY
+        if hidden > 0:
+            files_table.add_row(f"... and {hidden} more", "", "", "", "")
 
         self.console.print(Panel(files_table, title="📁 Files Changed", border_style="dim"))
 
         # Intent
-        confidence_bar = "█" * int(analysis.intent.confidence * 10) + "░" * (
-            10 - int(analysis.intent.confidence * 10)
-        )
+        confidence_bar = self._confidence_bar(analysis.intent.confidence)
         self.console.print(
             Panel(
                 f"[bold]{analysis.intent.summary}[/bold]\n\n"
@@ -178,30 +304,21 @@ class ConsoleFormatter:
 
         # Impact Map
         impact_text = Text()
-
-        if analysis.impact_map.direct_impacts:
-            impact_text.append("Direct Impacts:\n", style="bold")
-            for impact in analysis.impact_map.direct_impacts:
-                icon = self._risk_icon(impact.severity)
-                color = self._risk_style(impact.severity)
-                impact_text.append(f"  {icon} ", style=color)
-                impact_text.append(f"{impact.area}: ", style="bold")
-                impact_text.append(f"{impact.description}\n")
-            impact_text.append("\n")
-
-        if analysis.impact_map.indirect_impacts:
-            impact_text.append("Indirect Impacts:\n", style="bold")
-            for impact in analysis.impact_map.indirect_impacts:
-                icon = self._risk_icon(impact.severity)
-                color = self._risk_style(impact.severity)
-                impact_text.append(f"  {icon} ", style=color)
-                impact_text.append(f"{impact.area}: ", style="bold")
-                impact_text.append(f"{impact.description}\n")
-            impact_text.append("\n")
+        append = impact_text.append
+
+        for title, impacts in (
+            ("Direct Impacts", analysis.impact_map.direct_impacts),
+            ("Indirect Impacts", analysis.impact_map.indirect_impacts),
+        ):
+            if not impacts:
+                continue
+            append(f"{title}:\n", style="bold")
+            impact_text.append_tokens(self._impact_tokens(impacts))
+            append("\n")
 
         if analysis.impact_map.affected_components:
-            impact_text.append("Affected Components: ", style="bold")
-            impact_text.append(", ".join(analysis.impact_map.affected_components))
+            append("Affected Components: ", style="bold")
+            append(", ".join(analysis.impact_map.affected_components))
 
         self.console.print(Panel(impact_text, title="🗺️  Impact Map", border_style="yellow"))
 
@@ -211,43 +328,29 @@ class ConsoleFormatter:
         risk_icon = self._risk_icon(risk.overall_risk)
 
         risk_text = Text()
-        risk_text.append(
+        append = risk_text.append
+        append(
             f"Overall Risk: {risk_icon} {risk.overall_risk.value.upper()}\n\n",
             style=f"bold {risk_color}",
         )
 
         if risk.breaking_changes:
-            risk_text.append("⚠️  BREAKING CHANGES DETECTED\n", style="bold red")
+            append("⚠️  BREAKING CHANGES DETECTED\n", style="bold red")
         if risk.requires_migration:
-            risk_text.append("📦 Migration required\n", style="bold yellow")
+            append("📦 Migration required\n", style="bold yellow")
 
         if risk.risks:
-            risk_text.append("\nIdentified Risks:\n", style="bold")
-            for r in risk.risks:
-                icon = self._risk_icon(r.severity)
-                color = self._risk_style(r.severity)
-                risk_text.append(f"\n  {icon} ", style=color)
-                risk_text.append(f"[{r.severity.value}] ", style=f"bold {color}")
-                risk_text.append(f"{r.description}\n")
-                if r.mitigation:
-                    risk_text.append(f"     💡 Mitigation: {r.mitigation}\n", style="dim")
-                if r.edge_cases:
-                    risk_text.append(
-                        f"     ⚡ Edge cases: {', '.join(r.edge_cases)}\n", style="dim"
-                    )
+            append("\nIdentified Risks:\n", style="bold")
+            risk_text.append_tokens(self._risk_tokens(risk.risks))
 
         self.console.print(Panel(risk_text, title="⚠️  Risk Assessment", border_style=risk_color))
 
         # Review Questions
         if analysis.review_questions:
             questions_text = Text()
-            for i, q in enumerate(analysis.review_questions, 1):
-                icon = self._risk_icon(q.priority)
-                color = self._risk_style(q.priority)
-                questions_text.append(f"{i}. ", style="bold")
-                questions_text.append(f"{q.question}\n", style="bold")
-                questions_text.append(f"   {icon} ", style=color)
-                questions_text.append(f"{q.context}\n\n", style="dim")
+            questions_text.append_tokens(
+                self._question_tokens(analysis.review_questions, numbered=True)
+            )
 
             self.console.print(
                 Panel(questions_text, title="❓ Review Questions", border_style="cyan")
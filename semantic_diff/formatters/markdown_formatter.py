@@ -2,10 +2,12 @@
 Markdown formatter for semantic diff output - saves to files
 """
 
-import html
-import re
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import List
 
 from semantic_diff.models import RiskLevel, SemanticAnalysis
 
@@ -20,6 +22,10 @@ class MarkdownFormatter:
         RiskLevel.CRITICAL: "🔥",
     }
 
+    ESCAPE_TABLE = str.maketrans(
+        {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"}
+    )
+
     def _risk_icon(self, level: RiskLevel) -> str:
         return self.RISK_ICONS.get(level, "•")
 
@@ -27,12 +33,9 @@ class MarkdownFormatter:
         """Escape markdown special characters and HTML to prevent injection"""
         if not text:
             return ""
-        # First escape HTML entities
-        text = html.escape(text, quote=True)
-        # Escape markdown special chars that could be used for injection
-        # but preserve basic formatting in LLM output
-        text = re.sub(r"([<>])", r"\\\1", text)
-        return text
+        # Same entities as html.escape(quote=True), in a single C-level pass.
+        # No raw < or > survive, so no separate markdown escaping is needed.
+        return text.translate(self.ESCAPE_TABLE)
 
     def _escape_inline_code(self, text: str) -> str:
         """Escape backticks in inline code content"""
@@ -42,124 +45,128 @@ class MarkdownFormatter:
 
     def format(self, analysis: SemanticAnalysis) -> str:
         """Generate markdown string from analysis"""
-        lines = []
-
-        # Header - escape user-controlled content
-        lines.append(f"# Semantic Diff: {analysis.commit_hash[:8]}")
-        lines.append("")
-        lines.append(f"**Commit:** `{analysis.commit_hash}`")
-        lines.append(f"**Author:** {self._escape_md(analysis.author)}")
-        lines.append(f"**Date:** {analysis.date}")
-        lines.append("")
-        # Escape commit message - could contain malicious markdown/HTML
-        escaped_msg = self._escape_md(analysis.commit_message)
-        lines.append(f"> {escaped_msg}")
-        lines.append("")
+        # One StringIO buffer instead of a list of hundreds of short lines
+        buf = io.StringIO()
+        w = buf.write
+        icon_for = self.RISK_ICONS.get
+
+        # Header - escape user-controlled content (author and commit message can
+        # carry malicious markdown/HTML)
+        w(
+            f"# Semantic Diff: {analysis.commit_hash[:8]}\n\n"
+            f"**Commit:** `{analysis.commit_hash}`\n"
+            f"**Author:** {self._escape_md(analysis.author)}\n"
+            f"**Date:** {analysis.date}\n\n"
+            f"> {self._escape_md(analysis.commit_message)}\n\n"
+        )
 
         # Files Changed
-        lines.append("## 📁 Files Changed")
-        lines.append("")
-        lines.append("| File | Change | + | - | Lang |")
-        lines.append("|------|--------|---|---|------|")
-        for f in analysis.files_changed:
-            path = f.path[:50] + "..." if len(f.path) > 50 else f.path
-            # Escape file path - could contain injection attempts
-            escaped_path = self._escape_inline_code(path)
-            lines.append(
-                f"| `{escaped_path}` | {f.change_type} | {f.additions} | {f.deletions} | {f.language or '-'} |"
+        w("## 📁 Files Changed\n\n")
+        w("| File | Change | + | - | Lang |\n|------|--------|---|---|------|\n")
+        escape_code = self._escape_inline_code
+        # Escape file path - could contain injection attempts. Paths are kept whole:
+        # a saved report has no terminal width to fit
+        w(
+            "".join(
+                f"| `{escape_code(f.path)}` "
+                f"| {f.change_type} | {f.additions} | {f.deletions} | {f.language or '-'} |\n"
+                for f in analysis.files_changed
             )
-        lines.append("")
+        )
+        w("\n")
 
         # Intent
-        lines.append("## 🎯 Intent")
-        lines.append("")
-        lines.append(f"**{analysis.intent.summary}**")
-        lines.append("")
-        lines.append(analysis.intent.reasoning)
-        lines.append("")
         confidence_pct = int(analysis.intent.confidence * 100)
-        lines.append(f"*Confidence: {confidence_pct}%*")
-        lines.append("")
+        w(
+            f"## 🎯 Intent\n\n**{analysis.intent.summary}**\n\n"
+            f"{analysis.intent.reasoning}\n\n*Confidence: {confidence_pct}%*\n\n"
+        )
 
         # Impact Map
-        lines.append("## 🗺️ Impact Map")
-        lines.append("")
-
-        if analysis.impact_map.direct_impacts:
-            lines.append("### Direct Impacts")
-            for impact in analysis.impact_map.direct_impacts:
-                icon = self._risk_icon(impact.severity)
-                lines.append(f"- {icon} **{impact.area}**: {impact.description}")
-            lines.append("")
-
-        if analysis.impact_map.indirect_impacts:
-            lines.append("### Indirect Impacts")
-            for impact in analysis.impact_map.indirect_impacts:
-                icon = self._risk_icon(impact.severity)
-                lines.append(f"- {icon} **{impact.area}**: {impact.description}")
-            lines.append("")
-
-        if analysis.impact_map.affected_components:
-            lines.append(
-                f"**Affected Components:** {', '.join(analysis.impact_map.affected_components)}"
-            )
-            lines.append("")
+        w("## 🗺️ Impact Map\n\n")
+        impact_map = analysis.impact_map
+        for title, impacts in (
+            ("Direct Impacts", impact_map.direct_impacts),
+            ("Indirect Impacts", impact_map.indirect_impacts),
+        ):
+            if impacts:
+                w(f"### {title}\n")
+                w(
+                    "".join(
+                        f"- {icon_for(i.severity, '•')} **{i.area}**: {i.description}\n"
+                        for i in impacts
+                    )
+                )
+                w("\n")
+
+        if impact_map.affected_components:
+            w(f"**Affected Components:** {', '.join(impact_map.affected_components)}\n\n")
 
         # Risk Assessment
-        lines.append("## ⚠️ Risk Assessment")
-        lines.append("")
         risk = analysis.risk_assessment
-        icon = self._risk_icon(risk.overall_risk)
-        lines.append(f"**Overall Risk:** {icon} {risk.overall_risk.value.upper()}")
-        lines.append("")
+        w(
+            "## ⚠️ Risk Assessment\n\n"
+            f"**Overall Risk:** {icon_for(risk.overall_risk, '•')} "
+            f"{risk.overall_risk.value.upper()}\n\n"
+        )
 
         if risk.breaking_changes:
-            lines.append("🚨 **BREAKING CHANGES DETECTED**")
-            lines.append("")
+            w("🚨 **BREAKING CHANGES DETECTED**\n\n")
         if risk.requires_migration:
-            lines.append("📦 **Migration required**")
-            lines.append("")
+            w("📦 **Migration required**\n\n")
 
         if risk.risks:
-            lines.append("### Identified Risks")
-            lines.append("")
+            w("### Identified Risks\n\n")
             for r in risk.risks:
-                icon = self._risk_icon(r.severity)
-                lines.append(f"#### {icon} [{r.severity.value}] {r.description}")
+                w(f"#### {icon_for(r.severity, '•')} [{r.severity.value}] {r.description}\n")
                 if r.mitigation:
-                    lines.append(f"- 💡 **Mitigation:** {r.mitigation}")
+                    w(f"- 💡 **Mitigation:** {r.mitigation}\n")
                 if r.edge_cases:
-                    lines.append(f"- ⚡ **Edge cases:** {', '.join(r.edge_cases)}")
-                lines.append("")
+                    w(f"- ⚡ **Edge cases:** {', '.join(r.edge_cases)}\n")
+                w("\n")
 
         # Review Questions
         if analysis.review_questions:
-            lines.append("## ❓ Review Questions")
-            lines.append("")
-            for i, q in enumerate(analysis.review_questions, 1):
-                icon = self._risk_icon(q.priority)
-                lines.append(f"### {i}. {q.question}")
-                lines.append(f"{icon} {q.context}")
-                lines.append("")
+            w("## ❓ Review Questions\n\n")
+            w(
+                "".join(
+                    f"### {i}. {q.question}\n{icon_for(q.priority, '•')} {q.context}\n\n"
+                    for i, q in enumerate(analysis.review_questions, 1)
+                )
+            )
 
         # Footer
-        lines.append("---")
-        lines.append(
-            f"*Analysis by {analysis.analysis_model} | {analysis.tokens_used:,} tokens | {analysis.analysis_timestamp}*"
+        w(
+            f"---\n*Analysis by {analysis.analysis_model} | {analysis.tokens_used:,} tokens "
+            f"| {analysis.analysis_timestamp}*"
         )
 
-        return "\n".join(lines)
+        return buf.getvalue()
 
     def save(self, analysis: SemanticAnalysis, output_dir: Path) -> Path:
         """Save analysis to markdown file in output_dir"""
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        # Filename: <short_hash>_<timestamp>.md
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Filename: <short_hash>_<timestamp>.md, with microseconds so back-to-back
+        # saves (batches, re-runs) never overwrite each other
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         filename = f"{analysis.commit_hash[:8]}_{timestamp}.md"
         filepath = output_dir / filename
 
-        content = self.format(analysis)
-        filepath.write_text(content, encoding="utf-8")
+        # Write to a temp file and rename, so a crash never leaves a half-written report
+        data = self.format(analysis).encode("utf-8")
+        tmp_path = filepath.with_suffix(".md.tmp")
+        try:
+            tmp_path.write_bytes(data)
+        except FileNotFoundError:
+            # Only the first report into a new directory pays for mkdir
+            output_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(data)
+        os.replace(tmp_path, filepath)
 
         return filepath
+
+    def save_many(self, analyses: List[SemanticAnalysis], output_dir: Path) -> List[Path]:
+        """Save several analyses concurrently; returns paths in input order"""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        # Formatting is quick; the writes are I/O that releases the GIL
+        with ThreadPoolExecutor(max_workers=min(8, len(analyses) or 1)) as pool:
+            return list(pool.map(lambda analysis: self.save(analysis, output_dir), analyses))
@@ -3,50 +3,178 @@ Git diff parser - extracts structured information from git commits
 """
 
 import os
-from pathlib import Path
-from typing import List, Optional
+import re
+import select
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from types import MappingProxyType
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
 
-from git import InvalidGitRepositoryError, Repo
+from git import Diff, InvalidGitRepositoryError, Repo
 from git.exc import NoSuchPathError
 
 from semantic_diff.models import FileChange
 
+T = TypeVar("T")
+
+
+class BatchCatFile:
+    """
+    Pipelined reader over a single `git cat-file --batch` process.
+
+    Requests are written ahead of the responses being read, so git never idles
+    waiting for the next object id. The number in flight is capped so that the
+    queued requests always fit in the pipe buffer and writing can never block
+    while git is itself blocked writing a large blob back to us.
+    """
+
+    # Each request is a 40-char object id plus newline (65 covers SHA-256 ids)
+    MAX_INFLIGHT = select.PIPE_BUF // 65
+    # Read size when streaming past the head of a large blob
+    CHUNK_SIZE = 65536
+
+    def __init__(self, git_dir: str):
+        self._process = subprocess.Popen(
+            ["git", "--git-dir", git_dir, "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def __enter__(self) -> "BatchCatFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def read_blobs(self, shas: Iterable[str]) -> Iterator[Tuple[str, Optional[bytes]]]:
+        """Yield (sha, data) in request order; data is None for missing objects"""
+        return self._responses(shas, self._process.stdout.read)
+
+    def read_blob_heads(
+        self, shas: Iterable[str], head_size: int
+    ) -> Iterator[Tuple[str, Optional[bytes], int]]:
+        """
+        Yield (sha, head, newlines) in request order without holding whole blobs:
+        head is the first head_size bytes (None for missing objects) and newlines
+        counts b"\n" over the entire blob, read in CHUNK_SIZE pieces.
+        """
+        stdout = self._process.stdout
+
+        def read_head(size: int) -> Tuple[bytes, int]:
+            head = stdout.read(min(size, head_size))
+            newlines = head.count(b"\n")
+            remaining = size - len(head)
+            while remaining > 0:
+                chunk = stdout.read(min(remaining, self.CHUNK_SIZE))
+                if not chunk:
+                    raise OSError("git cat-file exited unexpectedly")
+                newlines += chunk.count(b"\n")
+                remaining -= len(chunk)
+            return head, newlines
+
+        for sha, result in self._responses(shas, read_head):
+            if result is None:
+                yield sha, None, 0
+            else:
+                yield sha, *result
+
+    def _responses(
+        self, shas: Iterable[str], read_object: Callable[[int], T]
+    ) -> Iterator[Tuple[str, Optional[T]]]:
+        """Pipeline requests for shas; read_object consumes each object's body given its size"""
+        stdin, stdout = self._process.stdin, self._process.stdout
+        requests = iter(shas)
+        pending = deque()
+
+        def fill() -> None:
+            batch = list(islice(requests, self.MAX_INFLIGHT - len(pending)))
+            if batch:
+                stdin.write("".join(f"{sha}\n" for sha in batch).encode("ascii"))
+                stdin.flush()
+                pending.extend(batch)
+
+        fill()
+        while pending:
+            sha = pending.popleft()
+            header = stdout.readline().split()
+            if len(header) != 3:
+                # "<sha> missing" (or a dead process, which yields an empty line)
+                if not header:
+                    raise OSError("git cat-file exited unexpectedly")
+                yield sha, None
+            else:
+                result = read_object(int(header[2]))
+                stdout.read(1)  # Trailing newline after each object
+                yield sha, result
+            # Top up once half the window has drained
+            if len(pending) <= self.MAX_INFLIGHT // 2:
+                fill()
+
+    def close(self) -> None:
+        # Closing stdout too means git exits on EPIPE even if responses are left unread
+        self._process.stdin.close()
+        self._process.stdout.close()
+        self._process.wait()
+
 
 class GitParser:
     """Parses git repository information"""
 
-    LANGUAGE_EXTENSIONS = {
-        ".py": "python",
-        ".js": "javascript",
-        ".ts": "typescript",
-        ".tsx": "typescript",
-        ".jsx": "javascript",
-        ".rs": "rust",
-        ".go": "go",
-        ".java": "java",
-        ".rb": "ruby",
-        ".php": "php",
-        ".c": "c",
-        ".cpp": "cpp",
-        ".h": "c",
-        ".hpp": "cpp",
-        ".cs": "csharp",
-        ".swift": "swift",
-        ".kt": "kotlin",
-        ".scala": "scala",
-        ".sql": "sql",
-        ".md": "markdown",
-        ".json": "json",
-        ".yaml": "yaml",
-        ".yml": "yaml",
-        ".toml": "toml",
-        ".xml": "xml",
-        ".html": "html",
-        ".css": "css",
-        ".scss": "scss",
-        ".sh": "bash",
-        ".bash": "bash",
-    }
+    LANGUAGE_EXTENSIONS = MappingProxyType(
+        {
+            ".py": "python",
+            ".js": "javascript",
+            ".ts": "typescript",
+            ".tsx": "typescript",
+            ".jsx": "javascript",
+            ".rs": "rust",
+            ".go": "go",
+            ".java": "java",
+            ".rb": "ruby",
+            ".php": "php",
+            ".c": "c",
+            ".cpp": "cpp",
+            ".h": "c",
+            ".hpp": "cpp",
+            ".cs": "csharp",
+            ".swift": "swift",
+            ".kt": "kotlin",
+            ".scala": "scala",
+            ".sql": "sql",
+            ".md": "markdown",
+            ".json": "json",
+            ".yaml": "yaml",
+            ".yml": "yaml",
+            ".toml": "toml",
+            ".xml": "xml",
+            ".html": "html",
+            ".css": "css",
+            ".scss": "scss",
+            ".sh": "bash",
+            ".bash": "bash",
+        }
+    )
+
+    # Diff text kept per file for the LLM prompt
+    DIFF_CONTENT_LIMIT = 5000
+    # Files changing more lines than this get a summary instead of a patch
+    MAX_PATCH_LINES = 5000
+
+    PACKAGE_MANAGER_FILES = MappingProxyType(
+        {
+            "package.json": "npm",
+            "requirements.txt": "pip",
+            "pyproject.toml": "pip",
+            "Cargo.toml": "cargo",
+            "go.mod": "go",
+        }
+    )
+
+    TEST_PATH_PATTERN = re.compile("test|spec", re.IGNORECASE)
+    CI_PATH_PATTERN = re.compile(r"\.github/workflows|\.gitlab-ci")
 
     def __init__(self, repo_path: Optional[str] = None):
         """
@@ -60,13 +188,21 @@ class GitParser:
             raise ValueError(f"Not a git repository: {self.repo_path}")
         except NoSuchPathError:
             raise ValueError(f"Path does not exist: {self.repo_path}")
+        # Resolved commits by full hex sha. Only immutable names are cached:
+        # HEAD, branches and short hashes are re-resolved every time
+        self._commits = {}
 
     def get_commit(self, commit_hash: str):
         """Get a commit by hash (full or short)"""
+        commit = self._commits.get(commit_hash)
+        if commit is not None:
+            return commit
         try:
-            return self.repo.commit(commit_hash)
+            commit = self.repo.commit(commit_hash)
         except Exception as e:
             raise ValueError(f"Could not find commit: {commit_hash}") from e
+        self._commits[commit.hexsha] = commit
+        return commit
 
     def get_commit_info(self, commit_hash: str) -> dict:
         """Get basic commit information"""
@@ -82,36 +218,49 @@ class GitParser:
 
     def detect_language(self, filepath: str) -> Optional[str]:
         """Detect programming language from file extension"""
-        ext = Path(filepath).suffix.lower()
-        return self.LANGUAGE_EXTENSIONS.get(ext)
+        # Called per tree entry; splitext avoids building a Path just for its suffix
+        return self.LANGUAGE_EXTENSIONS.get(os.path.splitext(filepath)[1].lower())
 
-    def get_file_changes(self, commit_hash: str) -> List[FileChange]:
+    def get_file_changes(
+        self, commit_hash: str, max_files: Optional[int] = None
+    ) -> List[FileChange]:
         """
-        Get all file changes for a commit.
+        Get file changes for a commit, at most max_files of them (None for all).
         Returns structured FileChange objects.
         """
         commit = self.get_commit(commit_hash)
+        # FileChanges are built with model_construct: every field comes straight from
+        # git with the right type, so per-file validation would be wasted work
         changes = []
 
         # Handle initial commit (no parents)
         if not commit.parents:
-            for item in commit.tree.traverse():
-                if item.type == "blob":
-                    content = ""
+            # traverse() is breadth-first, so a capped initial import keeps the root files
+            # and never walks the rest of the tree
+            blobs = list(
+                islice((item for item in commit.tree.traverse() if item.type == "blob"), max_files)
+            )
+            # One pipelined cat-file process instead of a round trip per blob
+            with BatchCatFile(self.repo.git_dir) as cat_file:
+                # Only the kept prefix is held in memory; the rest is streamed to count lines
+                contents = cat_file.read_blob_heads(
+                    (item.hexsha for item in blobs), self.DIFF_CONTENT_LIMIT * 4
+                )
+                for item, (_, head, newlines) in zip(blobs, contents):
+                    additions = 0
                     diff_content = "[binary file]"
-                    try:
-                        content = item.data_stream.read().decode("utf-8", errors="replace")
-                        diff_content = f"+{content}"
-                    except (UnicodeDecodeError, IOError, OSError):
-                        pass  # Keep defaults: empty content, binary marker
+                    if head is not None:
+                        # "\n" is one byte in UTF-8, so counting bytes matches counting lines
+                        additions = newlines + 1 if head else 0
+                        diff_content = "+" + self._decode_head(head, self.DIFF_CONTENT_LIMIT - 1)
 
                     changes.append(
-                        FileChange(
+                        FileChange.model_construct(
                             path=item.path,
                             change_type="added",
-                            additions=len(content.split("\n")) if content else 0,
+                            additions=additions,
                             deletions=0,
-                            diff_content=diff_content[:5000],  # Limit size
+                            diff_content=diff_content,
                             language=self.detect_language(item.path),
                         )
                     )
@@ -119,7 +268,31 @@ class GitParser:
 
         # Normal commit with parent
         parent = commit.parents[0]
-        diffs = parent.diff(commit, create_patch=True)
+        line_counts = self._numstat(parent.hexsha, commit.hexsha)
+        oversized = {
+            path
+            for path, (additions, deletions) in line_counts.items()
+            if additions + deletions > self.MAX_PATCH_LINES
+        }
+        if oversized:
+            # Lockfiles, generated code and the like: their patches would be cut to
+            # DIFF_CONTENT_LIMIT anyway, so only render patches for the other files
+            diffs = parent.diff(commit)[:max_files]
+            pathspecs = [
+                f":(literal){p}"
+                for d in diffs
+                if (d.b_path or d.a_path) not in oversized
+                for p in {d.a_path, d.b_path}
+                if p
+            ]
+            patched = (
+                {self._diff_key(d): d for d in parent.diff(commit, pathspecs, create_patch=True)}
+                if pathspecs
+                else {}
+            )
+            diffs = [patched.get(self._diff_key(d), d) for d in diffs]
+        else:
+            diffs = parent.diff(commit, create_patch=True)[:max_files]
 
         for diff in diffs:
             # Determine change type
@@ -136,34 +309,113 @@ class GitParser:
                 change_type = "modified"
                 path = diff.b_path or diff.a_path
 
+            additions, deletions = line_counts.get(diff.b_path or diff.a_path, (0, 0))
+
             # Get diff content
-            try:
-                diff_content = diff.diff.decode("utf-8", errors="replace")
-            except (UnicodeDecodeError, AttributeError, TypeError):
-                diff_content = "[binary file]"
-
-            # Count additions/deletions
-            additions = 0
-            deletions = 0
-            for line in diff_content.split("\n"):
-                if line.startswith("+") and not line.startswith("+++"):
-                    additions += 1
-                elif line.startswith("-") and not line.startswith("---"):
-                    deletions += 1
+            if (diff.b_path or diff.a_path) in oversized:
+                diff_content = f"[diff too large: +{additions}/-{deletions} lines]"
+            else:
+                try:
+                    diff_content = self._decode_head(diff.diff, self.DIFF_CONTENT_LIMIT)
+                except (UnicodeDecodeError, AttributeError, TypeError):
+                    diff_content = "[binary file]"
 
             changes.append(
-                FileChange(
+                FileChange.model_construct(
                     path=path,
                     change_type=change_type,
                     additions=additions,
                     deletions=deletions,
-                    diff_content=diff_content[:5000],  # Limit size for LLM
+                    diff_content=diff_content,
                     language=self.detect_language(path),
                 )
             )
 
         return changes
 
+    def get_file_changes_batch(
+        self,
+        commit_hashes: List[str],
+        max_workers: Optional[int] = None,
+        max_files: Optional[int] = None,
+    ) -> Dict[str, List[FileChange]]:
+        """
+        Get file changes for several commits in parallel, keyed by the hashes given.
+        Each worker thread opens its own parser because GitPython's Repo is not
+        thread-safe; the work is mostly waiting on git subprocesses, so threads overlap.
+        """
+        local = threading.local()
+        parsers = []
+
+        def changes_for(commit_hash: str) -> List[FileChange]:
+            parser = getattr(local, "parser", None)
+            if parser is None:
+                parser = local.parser = type(self)(self.repo_path)
+                parsers.append(parser)
+            return parser.get_file_changes(commit_hash, max_files)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return dict(zip(commit_hashes, executor.map(changes_for, commit_hashes)))
+        finally:
+            for parser in parsers:
+                parser.repo.close()
+
+    @staticmethod
+    def _diff_key(diff: Diff) -> Union[str, Tuple[str, str]]:
+        """
+        Key matching a raw diff entry to its patched counterpart.
+        Raw diffs fill both paths for added/deleted files, patched ones leave one None.
+        """
+        if diff.renamed_file:
+            return (diff.a_path, diff.b_path)
+        return diff.b_path or diff.a_path
+
+    @staticmethod
+    def _decode_head(data: bytes, limit: int) -> str:
+        """
+        Decode the first limit characters of UTF-8 data without decoding the rest.
+        A character is at most 4 bytes, so that many bytes always suffice.
+        """
+        return data[: limit * 4].decode("utf-8", errors="replace")[:limit]
+
+    def _numstat(self, parent_sha: str, commit_sha: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Map each changed path (the new path for renames) to (additions, deletions).
+        git counts the lines itself, so no Python pass over the patch text is needed;
+        binary files report 0/0.
+        """
+        output = self.repo.git.diff_tree("-r", "-M", "--numstat", "-z", parent_sha, commit_sha)
+        fields = output.split("\0")
+        counts = {}
+        i = 0
+        while i < len(fields):
+            stat = fields[i]
+            i += 1
+            if not stat:
+                continue
+            added, deleted, path = stat.split("\t", 2)
+            if not path:
+                # Rename/copy: "<added>\t<deleted>\t\0<old path>\0<new path>"
+                path = fields[i + 1]
+                i += 2
+            counts[path] = (
+                int(added) if added != "-" else 0,
+                int(deleted) if deleted != "-" else 0,
+            )
+        return counts
+
+    def _blob_paths(self, tree_sha: str) -> Iterator[str]:
+        """Yield the path of every blob under a tree (submodules are skipped)"""
+        output = self.repo.git.ls_tree("-r", "-z", tree_sha)
+        for entry in output.split("\0"):
+            if not entry:
+                continue
+            # "<mode> <type> <object>\t<path>"
+            meta, path = entry.split("\t", 1)
+            if meta.split(" ", 2)[1] == "blob":
+                yield path
+
     def get_project_context(self, max_files: int = 20) -> dict:
         """
         Get project context - file structure, main files, etc.
@@ -186,40 +438,32 @@ class GitParser:
             context["languages"] = []
             return context
 
-        # Check root files
-        for item in tree.traverse():
-            if item.type == "blob":
+        # Root level: only the top tree object is needed
+        for item in tree:
+            if item.type == "tree":
+                context["directories"].append(item.path)
+            elif item.type == "blob":
                 path = item.path
+                context["root_files"].append(path)
 
-                # Root level important files
-                if "/" not in path:
-                    context["root_files"].append(path)
-
-                    # Detect package manager
-                    if path == "package.json":
-                        context["package_manager"] = "npm"
-                    elif path == "requirements.txt" or path == "pyproject.toml":
-                        context["package_manager"] = "pip"
-                    elif path == "Cargo.toml":
-                        context["package_manager"] = "cargo"
-                    elif path == "go.mod":
-                        context["package_manager"] = "go"
-
-                # Detect tests
-                if "test" in path.lower() or "spec" in path.lower():
-                    context["has_tests"] = True
-
-                # Detect CI
-                if ".github/workflows" in path or ".gitlab-ci" in path:
-                    context["has_ci"] = True
-
-                # Track languages
-                lang = self.detect_language(path)
-                if lang:
-                    context["languages"].add(lang)
-
-            elif item.type == "tree" and "/" not in item.path:
-                context["directories"].append(item.path)
+                # Detect package manager
+                package_manager = self.PACKAGE_MANAGER_FILES.get(path)
+                if package_manager:
+                    context["package_manager"] = package_manager
+
+        # Every blob path from one ls-tree call - no per-entry objects, no work tree
+        paths = list(self._blob_paths(tree.hexsha))
+
+        # Tests and CI are repo-wide flags: one regex scan over the whole listing
+        # instead of per-path checks (patterns never span the newline separators)
+        listing = "\n".join(paths)
+        context["has_tests"] = self.TEST_PATH_PATTERN.search(listing) is not None
+        context["has_ci"] = self.CI_PATH_PATTERN.search(listing) is not None
+
+        # Track languages - map() keeps the per-path loop in C
+        languages = context["languages"]
+        languages.update(map(self.detect_language, paths))
+        languages.discard(None)
 
-        context["languages"] = list(context["languages"])
+        context["languages"] = list(languages)
         return context
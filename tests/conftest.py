@@ -2,6 +2,7 @@
 Shared pytest fixtures for semantic_diff tests
 """
 
+import shutil
 from datetime import datetime
 
 import pytest
@@ -20,16 +21,18 @@ from semantic_diff.models import (
 )
 
 
-@pytest.fixture
-def temp_git_repo(tmp_path):
+@pytest.fixture(scope="session")
+def _session_git_repo(tmp_path_factory):
     """
-    Create a temporary git repository with a test commit.
+    Build the template repository for temp_git_repo once per session.
 
     Returns:
-        tuple: (repo_path, Repo object, commit_hash)
+        tuple: (repo_path, commit_hash)
     """
+    repo_path = tmp_path_factory.mktemp("template_repo")
+
     # Initialize repo
-    repo = Repo.init(tmp_path)
+    repo = Repo.init(repo_path)
 
     # Configure user
     with repo.config_writer() as config:
@@ -37,7 +40,7 @@ def temp_git_repo(tmp_path):
         config.set_value("user", "email", "test@example.com")
 
     # Create initial commit
-    test_file = tmp_path / "test.py"
+    test_file = repo_path / "test.py"
     test_file.write_text("def hello():\n    print('Hello')\n")
     repo.index.add([str(test_file)])
 
@@ -49,8 +52,59 @@ def temp_git_repo(tmp_path):
     repo.index.add([str(test_file)])
 
     second_commit = repo.index.commit("Add name parameter to hello()", author=author)
+    repo.close()
+
+    return repo_path, second_commit.hexsha
+
+
+@pytest.fixture
+def temp_git_repo(_session_git_repo, tmp_path):
+    """
+    Create a temporary git repository with a test commit.
+    Each test gets its own copy of the session template, so mutations stay isolated.
+
+    Returns:
+        tuple: (repo_path, Repo object, commit_hash)
+    """
+    template_path, commit_hash = _session_git_repo
+    repo_path = tmp_path / "repo"
+    shutil.copytree(template_path, repo_path)
+
+    return str(repo_path), Repo(repo_path), commit_hash
+
+
+@pytest.fixture(scope="session")
+def _session_single_commit_repo(tmp_path_factory):
+    """
+    Build the template repository for single_commit_repo once per session.
+
+    Returns:
+        tuple: (repo_path, commit_hash)
+    """
+    repo_path = tmp_path_factory.mktemp("single_commit_repo")
+    repo = Repo.init(repo_path)
+
+    (repo_path / "test.txt").write_text("test content")
+    repo.index.add(["test.txt"])
+    commit = repo.index.commit("Initial commit")
+    repo.close()
+
+    return repo_path, commit.hexsha
+
+
+@pytest.fixture
+def single_commit_repo(_session_single_commit_repo, tmp_path):
+    """
+    Create a repository whose only commit adds test.txt ("Initial commit").
+    The repo is copied into tmp_path itself, so tests can keep using tmp_path.
+
+    Returns:
+        tuple: (Repo object, commit_hash)
+    """
+    template_path, commit_hash = _session_single_commit_repo
+    shutil.copytree(template_path, tmp_path, dirs_exist_ok=True)
 
-    return str(tmp_path), repo, second_commit.hexsha
+    return Repo(tmp_path), commit_hash
 
 
 @pytest.fixture
@@ -0,0 +1,167 @@
+"""
+Tests for SemanticCache - exact and similarity-based analysis cache
+"""
+
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from semantic_diff.cache import SemanticCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = SemanticCache(tmp_path / "cache.db")
+    yield c
+    c.close()
+
+
+class TestMakeKey:
+    """Test exact-match key construction"""
+
+    def test_key_is_deterministic(self):
+        """Test same inputs produce same key"""
+        assert SemanticCache.make_key("m", "abc", "p") == SemanticCache.make_key("m", "abc", "p")
+
+    def test_key_depends_on_model(self):
+        """Test different models produce different keys"""
+        assert SemanticCache.make_key("m1", "abc", "p") != SemanticCache.make_key("m2", "abc", "p")
+
+    def test_commit_key_depends_on_prompt_version(self):
+        """Test bumping the prompt version invalidates commit-level keys"""
+        assert SemanticCache.make_commit_key("abc", "m", "1") != SemanticCache.make_commit_key(
+            "abc", "m", "2"
+        )
+
+
+class TestExactTier:
+    """Test exact-key lookups"""
+
+    def test_miss_on_empty_cache(self, cache):
+        """Test lookup in empty cache returns None"""
+        assert cache.get("missing", "model") is None
+
+    def test_put_then_get(self, cache, mock_semantic_analysis):
+        """Test stored analysis round-trips"""
+        cache.put("key", "model", mock_semantic_analysis)
+        result = cache.get("key", "model")
+        assert result == mock_semantic_analysis
+
+    def test_persists_across_instances(self, tmp_path, mock_semantic_analysis):
+        """Test cache survives reopening the database"""
+        first = SemanticCache(tmp_path / "cache.db")
+        first.put("key", "model", mock_semantic_analysis)
+        first.close()
+
+        second = SemanticCache(tmp_path / "cache.db")
+        assert second.get("key", "model") is not None
+        second.close()
+
+    def test_invalidate(self, cache, mock_semantic_analysis):
+        """Test invalidating a single entry"""
+        cache.put("key", "model", mock_semantic_analysis)
+        assert cache.invalidate("key") is True
+        assert cache.get("key", "model") is None
+        assert cache.invalidate("key") is False
+
+    def test_ttl_expiry(self, tmp_path, mock_semantic_analysis):
+        """Test entries older than ttl are ignored"""
+        cache = SemanticCache(tmp_path / "cache.db", ttl=60)
+        with patch("semantic_diff.cache.time.time", return_value=1000.0):
+            cache.put("key", "model", mock_semantic_analysis)
+        with patch("semantic_diff.cache.time.time", return_value=1030.0):
+            assert cache.get("key", "model") is not None
+        with patch("semantic_diff.cache.time.time", return_value=1100.0):
+            assert cache.get("key", "model") is None
+        cache.close()
+
+    def test_max_entries_evicts_least_recently_used(self, tmp_path, mock_semantic_analysis):
+        """Test put evicts the entry that was read least recently"""
+        cache = SemanticCache(tmp_path / "cache.db", max_entries=2)
+        with patch("semantic_diff.cache.time.time", return_value=1000.0):
+            cache.put("old", "model", mock_semantic_analysis)
+        with patch("semantic_diff.cache.time.time", return_value=1001.0):
+            cache.put("newer", "model", mock_semantic_analysis)
+        with patch("semantic_diff.cache.time.time", return_value=1002.0):
+            cache.get("old", "model")
+        with patch("semantic_diff.cache.time.time", return_value=1003.0):
+            cache.put("newest", "model", mock_semantic_analysis)
+
+        assert cache.get("old", "model") is not None
+        assert cache.get("newer", "model") is None
+        assert cache.get("newest", "model") is not None
+        cache.close()
+
+
+class TestSimilarityTier:
+    """Test embedding-similarity lookups"""
+
+    def test_embedding_is_normalized(self, cache):
+        """Test embeddings have unit length"""
+        vector = cache.embed("Add retry logic to api client")
+        assert sum(v * v for v in vector) == pytest.approx(1.0, abs=1e-6)
+
+    def test_empty_text_embedding(self, cache):
+        """Test empty text yields zero vector"""
+        assert not any(cache.embed(""))
+
+    def test_near_duplicate_hits(self, cache, mock_semantic_analysis):
+        """Test identical text under a different key is served from similarity tier"""
+        text = "Add auth\n- src/auth.py (added) +50/-0 [python]"
+        cache.put("key1", "model", mock_semantic_analysis, text)
+        assert cache.get("key2", "model", text) is not None
+
+    def test_different_text_misses(self, cache, mock_semantic_analysis):
+        """Test unrelated text is not served"""
+        cache.put("key1", "model", mock_semantic_analysis, "Add auth src/auth.py")
+        assert cache.get("key2", "model", "Fix typo in README documentation") is None
+
+    def test_similarity_scoped_to_model(self, cache, mock_semantic_analysis):
+        """Test similarity tier never crosses models"""
+        cache.put("key1", "model-a", mock_semantic_analysis, "same text")
+        assert cache.get("key2", "model-b", "same text") is None
+
+    def test_similarity_scoped_to_digest(self, cache, mock_semantic_analysis):
+        """Test similarity tier only matches entries with the same diff digest"""
+        cache.put("key1", "model", mock_semantic_analysis, "same text", "digest-a")
+        assert cache.get("key2", "model", "same text", "digest-b") is None
+        assert cache.get("key2", "model", "same text", "digest-a") is not None
+
+    @pytest.mark.parametrize(
+        "columns",
+        [
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, embedding BLOB, "
+            "analysis TEXT NOT NULL, created_at REAL NOT NULL",
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, embedding BLOB, "
+            "analysis TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL",
+        ],
+        ids=["without_last_used", "without_diff_digest"],
+    )
+    def test_old_database_is_migrated(self, tmp_path, mock_semantic_analysis, columns):
+        """Test caches created by older schemas gain the missing columns and keep working"""
+        path = tmp_path / "cache.db"
+        conn = sqlite3.connect(str(path))
+        conn.execute(f"CREATE TABLE analyses ({columns})")
+        conn.execute(
+            (
+                "INSERT INTO analyses (key, model, analysis, created_at) VALUES (?, ?, ?, ?)"
+                if "last_used" not in columns
+                else "INSERT INTO analyses (key, model, analysis, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, 5.0)"
+            ),
+            ("old", "model", mock_semantic_analysis.model_dump_json(), 5.0),
+        )
+        conn.commit()
+        conn.close()
+
+        cache = SemanticCache(path, max_entries=2)
+        assert cache.get("old", "model") is not None
+        cache.put("new", "model", mock_semantic_analysis, "text", "digest")
+        assert cache.get("other", "model", "text", "digest") is not None
+        assert cache._conn.execute(
+            "SELECT last_used >= created_at FROM analyses WHERE key = 'old'"
+        ).fetchone() == (1,)
+        cache.put("third", "model", mock_semantic_analysis)
+        assert cache._conn.execute("SELECT COUNT(*) FROM analyses").fetchone() == (2,)
+        cache.close()
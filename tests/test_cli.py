@@ -3,14 +3,18 @@ Tests for CLI interface
 """
 
 import json
+import subprocess
+import sys
+import threading
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from click.testing import CliRunner
 from git import Repo
 
-from semantic_diff.cli import main
+from semantic_diff.analyzers.rate_limiter import RateLimiter
+from semantic_diff.cli import cli, main
 
 
 class TestCLIHelp:
@@ -47,6 +51,18 @@ class TestCLIHelp:
         assert "Examples:" in result.output
         assert "HEAD" in result.output
 
+    def test_help_does_not_import_analysis_stack(self):
+        """Test that loading the CLI defers the LLM, git, rich and asyncio imports"""
+        code = (
+            "import sys; from semantic_diff import cli; "
+            "print(any(m in sys.modules for m in ('anthropic', 'git', 'rich', 'asyncio')))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+
+        assert result.stdout.strip() == "False"
+
 
 class TestCLIBasicExecution:
     """Test basic CLI execution scenarios"""
@@ -240,6 +256,321 @@ class TestCLIWithMockedAnalyzer:
         assert result.exit_code == 1
         assert "mutually exclusive" in result.output
 
+    def test_large_commit_is_capped(self, temp_git_repo, mock_llm_analyzer):
+        """Test that commits over MAX_FILES_PER_COMMIT are truncated with a note"""
+        repo_path, repo, commit_hash = temp_git_repo
+        for name in ("a.py", "b.py", "c.py"):
+            (Path(repo_path) / name).write_text("x = 1\n")
+        repo.index.add(["a.py", "b.py", "c.py"])
+        repo.index.commit("Add three files")
+        runner = CliRunner()
+
+        with patch("semantic_diff.cli.MAX_FILES_PER_COMMIT", 2):
+            result = runner.invoke(main, ["analyze", "HEAD", "--repo", repo_path, "--json"])
+
+        assert result.exit_code == 0
+        assert "Analyzing only the first 2 files." in result.stderr
+        files = mock_llm_analyzer.return_value.analyze.call_args[0][1]
+        assert len(files) == 2
+
+    def test_cache_flag_skips_analyzer_on_rerun(self, temp_git_repo, mock_llm_analyzer):
+        """Test that --cache serves a re-analyzed commit without calling the LLM"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+        args = ["analyze", "HEAD", "--repo", repo_path, "--json", "--cache"]
+
+        first = runner.invoke(main, args)
+        second = runner.invoke(main, args)
+
+        assert first.exit_code == 0
+        assert second.exit_code == 0
+        assert json.loads(second.output) == json.loads(first.output)
+        assert mock_llm_analyzer.return_value.analyze.call_count == 1
+
+        cache_dir = Path(repo_path) / ".semantic_diff_cache"
+        assert (cache_dir / "analyses.db").exists()
+        assert (cache_dir / ".gitignore").read_text() == "*\n"
+
+    def test_cache_skips_analyses_without_model_call(
+        self, temp_git_repo, mock_llm_analyzer, mock_semantic_analysis
+    ):
+        """Test that similarity hits are not stored under the commit's exact key"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+        analyze = mock_llm_analyzer.return_value.analyze
+        analyze.return_value = mock_semantic_analysis.model_copy(update={"tokens_used": 0})
+        args = ["analyze", "HEAD", "--repo", repo_path, "--json", "--cache"]
+
+        runner.invoke(main, args)
+        runner.invoke(main, args)
+
+        assert analyze.call_count == 2
+
+    def test_cache_threshold_reaches_similarity_tier(self, temp_git_repo, mock_llm_analyzer):
+        """Test that --cache-threshold configures the cache handed to the analyzer"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(
+            main,
+            [
+                "analyze",
+                "HEAD",
+                "--repo",
+                repo_path,
+                "--json",
+                "--cache",
+                "--cache-threshold",
+                "0.9",
+            ],
+        )
+
+        assert result.exit_code == 0
+        cache = mock_llm_analyzer.call_args.kwargs["cache"]
+        assert cache.similarity_threshold == 0.9
+
+    def test_cache_threshold_out_of_range_rejected(self, temp_git_repo):
+        """Test that a similarity threshold above 1 is a usage error"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(
+            main, ["analyze", "HEAD", "--repo", repo_path, "--cache", "--cache-threshold", "1.5"]
+        )
+
+        assert result.exit_code == 2
+
+    def test_stream_flag_passes_on_text(self, temp_git_repo, mock_llm_analyzer):
+        """Test that --stream hands a live-render callback to the analyzer"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(main, ["analyze", "HEAD", "--repo", repo_path, "--stream"])
+
+        assert result.exit_code == 0
+        kwargs = mock_llm_analyzer.return_value.analyze.call_args.kwargs
+        assert callable(kwargs["on_text"])
+        assert callable(kwargs["on_retry"])
+
+    def test_stream_flag_ignored_for_json(self, temp_git_repo, mock_llm_analyzer):
+        """Test that --stream does not mix live output into --json"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(main, ["analyze", "HEAD", "--repo", repo_path, "--stream", "--json"])
+
+        assert result.exit_code == 0
+        json.loads(result.output)
+        assert "on_text" not in mock_llm_analyzer.return_value.analyze.call_args.kwargs
+
+    def test_project_context_built_on_separate_parser(self, temp_git_repo, mock_llm_analyzer):
+        """Test that project context is gathered off-thread on its own GitParser"""
+        from semantic_diff.parsers.git_parser import GitParser
+
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+        seen = {}
+        real_changes = GitParser.get_file_changes
+        real_context = GitParser.get_project_context
+
+        def record_changes(self, *args):
+            seen["changes"] = (self, threading.get_ident())
+            return real_changes(self, *args)
+
+        def record_context(self, *args):
+            seen["context"] = (self, threading.get_ident())
+            return real_context(self, *args)
+
+        with (
+            patch.object(GitParser, "get_file_changes", record_changes),
+            patch.object(GitParser, "get_project_context", record_context),
+        ):
+            result = runner.invoke(main, ["analyze", "HEAD", "--repo", repo_path, "--json"])
+
+        assert result.exit_code == 0
+        assert seen["context"][0] is not seen["changes"][0]
+        assert seen["context"][1] != seen["changes"][1]
+        languages = mock_llm_analyzer.return_value.analyze.call_args.args[2]["languages"]
+        assert languages == ["python"]
+
+    def test_json_output_does_not_import_rich(self, temp_git_repo):
+        """Test that a --json run never loads the console formatter stack"""
+        repo_path, repo, commit_hash = temp_git_repo
+        tests_dir = Path(__file__).parent
+        code = (
+            "import sys; from unittest.mock import MagicMock, patch\n"
+            f"sys.path.insert(0, {str(tests_dir)!r}); import conftest\n"
+            "analyzer = MagicMock()\n"
+            "analyzer.return_value.analyze.return_value = "
+            "conftest.mock_minimal_analysis.__wrapped__()\n"
+            "from semantic_diff import cli\n"
+            "with patch.object(cli, 'LLMAnalyzer', analyzer, create=True):\n"
+            f"    cli._do_analyze('HEAD', {repo_path!r}, None, True, False, False, False)\n"
+            "print('rich' in sys.modules, file=sys.stderr)\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+
+        json.loads(result.stdout)
+        assert result.stderr.strip() == "False"
+
+    def test_without_cache_flag_always_calls_analyzer(self, temp_git_repo, mock_llm_analyzer):
+        """Test that analyses are not cached unless --cache is given"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        runner.invoke(main, ["analyze", "HEAD", "--repo", repo_path, "--json"])
+        runner.invoke(main, ["analyze", "HEAD", "--repo", repo_path, "--json"])
+
+        assert mock_llm_analyzer.return_value.analyze.call_count == 2
+        assert not (Path(repo_path) / ".semantic_diff_cache").exists()
+
+
+class TestCLIAnalyzeBatch:
+    """Test analyzing several commits in one invocation"""
+
+    @pytest.fixture
+    def mock_llm_analyzer(self, mock_semantic_analysis):
+        """Mock analyze_many to return one analysis per job without API calls"""
+        with patch("semantic_diff.cli.LLMAnalyzer") as mock_analyzer_class:
+            mock_instance = MagicMock()
+            mock_instance.analyze_many = AsyncMock(
+                side_effect=lambda jobs, max_concurrency: [mock_semantic_analysis] * len(jobs)
+            )
+            mock_analyzer_class.return_value = mock_instance
+            yield mock_analyzer_class
+
+    def test_batch_analyzes_all_commits_in_one_call(self, temp_git_repo, mock_llm_analyzer):
+        """Test that every commit is sent to analyze_many together"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(
+            main, ["analyze-batch", "HEAD", "HEAD~1", "--repo", repo_path, "--jobs", "2"]
+        )
+
+        assert result.exit_code == 0
+        analyze_many = mock_llm_analyzer.return_value.analyze_many
+        analyze_many.assert_awaited_once()
+        jobs = analyze_many.call_args.args[0]
+        assert [info["hash"] for info, _, _ in jobs] == [
+            repo.head.commit.hexsha,
+            repo.head.commit.parents[0].hexsha,
+        ]
+        assert analyze_many.call_args.kwargs["max_concurrency"] == 2
+
+    def test_batch_uses_rate_limiter(self, temp_git_repo, mock_llm_analyzer):
+        """Test that the concurrent requests share a client-side rate limiter"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(main, ["analyze-batch", "HEAD", "HEAD~1", "--repo", repo_path])
+
+        assert result.exit_code == 0
+        assert isinstance(mock_llm_analyzer.return_value.rate_limiter, RateLimiter)
+
+    def test_batch_reports_invalid_rate_limit(self, temp_git_repo, mock_llm_analyzer, monkeypatch):
+        """Test that a bad SEMANTIC_DIFF_RPM is reported as an error, not a traceback"""
+        repo_path, repo, commit_hash = temp_git_repo
+        monkeypatch.setenv("SEMANTIC_DIFF_RPM", "fast")
+        runner = CliRunner()
+
+        result = runner.invoke(main, ["analyze-batch", "HEAD", "--repo", repo_path])
+
+        assert result.exit_code == 1
+        assert "Error: SEMANTIC_DIFF_RPM must be a positive number, got 'fast'" in result.stderr
+        mock_llm_analyzer.return_value.analyze_many.assert_not_called()
+
+    def test_batch_deduplicates_commits(self, temp_git_repo, mock_llm_analyzer):
+        """Test that the same commit given twice is analyzed once"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(main, ["analyze-batch", "HEAD", commit_hash, "--repo", repo_path])
+
+        assert result.exit_code == 0
+        jobs = mock_llm_analyzer.return_value.analyze_many.call_args.args[0]
+        assert len(jobs) == 1
+
+    def test_batch_save_writes_one_report_per_commit(self, temp_git_repo, mock_llm_analyzer):
+        """Test that --save writes a report for each analyzed commit"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(
+            main, ["analyze-batch", "HEAD", "HEAD~1", "--repo", repo_path, "--save"]
+        )
+
+        assert result.exit_code == 0
+        assert result.output.count("Report saved:") == 2
+
+    def test_batch_cache_skips_analyses_without_model_call(
+        self, temp_git_repo, mock_llm_analyzer, mock_semantic_analysis
+    ):
+        """Test that only analyses from a real model call are cached per commit"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+        served = mock_semantic_analysis.model_copy(update={"tokens_used": 0})
+        analyze_many = mock_llm_analyzer.return_value.analyze_many
+        analyze_many.side_effect = lambda jobs, max_concurrency: [
+            served,
+            mock_semantic_analysis,
+        ][: len(jobs)]
+        args = ["analyze-batch", "HEAD", "HEAD~1", "--repo", repo_path, "--cache"]
+
+        runner.invoke(main, args)
+        runner.invoke(main, args)
+
+        jobs = analyze_many.call_args.args[0]
+        assert [info["hash"] for info, _, _ in jobs] == [repo.head.commit.hexsha]
+
+    def test_batch_invalid_commit_fails_before_api(self, temp_git_repo, mock_llm_analyzer):
+        """Test that an unknown hash fails without calling the LLM"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(main, ["analyze-batch", "HEAD", "deadbeef", "--repo", repo_path])
+
+        assert result.exit_code == 1
+        mock_llm_analyzer.return_value.analyze_many.assert_not_called()
+
+    def test_installed_hook_uses_batch_command(self, temp_git_repo):
+        """Test that the pre-push hook runs all pushed refs through analyze-batch"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        result = runner.invoke(main, ["init", "--repo", repo_path])
+
+        assert result.exit_code == 0
+        hook_path = Path(repo.git_dir) / "hooks" / "pre-push"
+        assert "analyze-batch" in hook_path.read_text()
+        assert "--cache" not in hook_path.read_text()
+        subprocess.run(["bash", "-n", str(hook_path)], check=True)
+
+    def test_installed_hook_uses_resolved_command(self, temp_git_repo):
+        """Test that init bakes the absolute semantic-diff path into the hook"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        with patch("semantic_diff.cli.shutil.which", return_value="/opt/venv/bin/semantic-diff"):
+            runner.invoke(main, ["init", "--repo", repo_path])
+
+        content = (Path(repo.git_dir) / "hooks" / "pre-push").read_text()
+        assert "/opt/venv/bin/semantic-diff analyze-batch" in content
+        assert "@SEMANTIC_DIFF@" not in content
+
+    def test_installed_hook_falls_back_to_interpreter(self, temp_git_repo):
+        """Test that without semantic-diff on PATH the hook runs the module directly"""
+        repo_path, repo, commit_hash = temp_git_repo
+        runner = CliRunner()
+
+        with patch("semantic_diff.cli.shutil.which", return_value=None):
+            runner.invoke(main, ["init", "--repo", repo_path])
+
+        content = (Path(repo.git_dir) / "hooks" / "pre-push").read_text()
+        assert f"{sys.executable} -m semantic_diff.cli analyze-batch" in content
+
 
 class TestCLIEdgeCases:
     """Test edge cases and error handling"""
@@ -301,6 +632,52 @@ class TestCLIEdgeCases:
         assert "Error:" in result.output
 
 
+class TestCLIEntryPoint:
+    """Test the semantic-diff console script dispatcher"""
+
+    @pytest.mark.parametrize(
+        "argv, commit", [(["semantic-diff"], "HEAD"), (["semantic-diff", "abc123"], "abc123")]
+    )
+    def test_bare_commit_skips_click(self, monkeypatch, argv, commit):
+        """Test that a bare commit (or nothing) goes straight to the analysis"""
+        monkeypatch.setattr(sys, "argv", argv)
+        with (
+            patch("semantic_diff.cli._do_analyze") as do_analyze,
+            patch("semantic_diff.cli.main") as click_main,
+        ):
+            with pytest.raises(SystemExit) as exc_info:
+                cli()
+
+        assert exc_info.value.code == 0
+        do_analyze.assert_called_once_with(commit, ".", None, False, False, False, False)
+        click_main.assert_not_called()
+
+    def test_commit_with_flags_goes_through_click(self, monkeypatch):
+        """Test that options still route through Click's analyze command"""
+        monkeypatch.setattr(sys, "argv", ["semantic-diff", "abc123", "--json"])
+        with (
+            patch("semantic_diff.cli._do_analyze") as do_analyze,
+            patch("semantic_diff.cli.main") as click_main,
+        ):
+            cli()
+
+        do_analyze.assert_not_called()
+        click_main.assert_called_once()
+        assert sys.argv == ["semantic-diff", "analyze", "abc123", "--json"]
+
+    def test_subcommand_goes_through_click(self, monkeypatch):
+        """Test that known commands are not mistaken for commit hashes"""
+        monkeypatch.setattr(sys, "argv", ["semantic-diff", "init"])
+        with (
+            patch("semantic_diff.cli._do_analyze") as do_analyze,
+            patch("semantic_diff.cli.main") as click_main,
+        ):
+            cli()
+
+        do_analyze.assert_not_called()
+        click_main.assert_called_once()
+
+
 class TestCLIIntegration:
     """Integration tests with real git operations but mocked LLM"""
 
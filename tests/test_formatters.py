@@ -2,7 +2,14 @@
 Tests for formatters - console and markdown output
 """
 
-from semantic_diff.formatters.console_formatter import ConsoleFormatter
+import html
+import io
+from pathlib import Path
+from unittest.mock import patch
+
+from rich.console import Console
+
+from semantic_diff.formatters.console_formatter import ConsoleFormatter, partial_json_string
 from semantic_diff.formatters.markdown_formatter import MarkdownFormatter
 from semantic_diff.models import (
     FileChange,
@@ -90,13 +97,21 @@ class TestMarkdownFormatter:
         assert "<script>" not in escaped
         assert "&lt;" in escaped or "\\<" in escaped
 
+    def test_escape_md_matches_html_escape(self):
+        """Test that _escape_md escapes the same entities as html.escape(quote=True)"""
+        formatter = MarkdownFormatter()
+        text = "a & b < c > d \"e\" 'f'"
+
+        assert formatter._escape_md(text) == html.escape(text, quote=True)
+
     def test_escape_md_handles_commit_message_injection(self, mock_semantic_analysis):
         """Test that malicious commit messages are escaped"""
         formatter = MarkdownFormatter()
 
         # Create analysis with malicious commit message
-        malicious_analysis = mock_semantic_analysis.model_copy()
-        malicious_analysis.commit_message = "<script>alert('xss')</script> Fix bug"
+        malicious_analysis = mock_semantic_analysis.model_copy(
+            update={"commit_message": "<script>alert('xss')</script> Fix bug"}
+        )
 
         output = formatter.format(malicious_analysis)
 
@@ -105,6 +120,16 @@ class TestMarkdownFormatter:
         # Should escape the tags (html.escape converts < to &lt;)
         assert "&lt;script&gt;" in output
 
+    def test_format_keeps_long_paths_whole(self, mock_minimal_analysis):
+        """Test that saved reports list file paths without truncation"""
+        formatter = MarkdownFormatter()
+        long_path = "deep/" * 20 + "leaf.py"
+        analysis = mock_minimal_analysis.model_copy(
+            update={"files_changed": [FileChange(path=long_path, change_type="added")]}
+        )
+
+        assert f"`{long_path}`" in formatter.format(analysis)
+
     def test_escape_md_handles_file_path_injection(self, mock_semantic_analysis):
         """Test that malicious file paths are escaped"""
         formatter = MarkdownFormatter()
@@ -168,15 +193,12 @@ class TestMarkdownFormatter:
         assert mock_semantic_analysis.intent.summary in content
 
     def test_save_creates_unique_filenames(self, mock_semantic_analysis, tmp_path):
-        """Test that multiple saves create unique files"""
-        import time
-
+        """Test that back-to-back saves create unique files"""
         formatter = MarkdownFormatter()
         reports_dir = tmp_path / "reports"
 
-        # Save twice with delay to ensure different timestamps
+        # Same commit saved twice within the same second
         path1 = formatter.save(mock_semantic_analysis, reports_dir)
-        time.sleep(1)  # Ensure different second in timestamp
         path2 = formatter.save(mock_semantic_analysis, reports_dir)
 
         # Should create different files (different timestamps)
@@ -184,6 +206,35 @@ class TestMarkdownFormatter:
         assert path1.exists()
         assert path2.exists()
 
+    def test_save_creates_missing_directories(self, mock_semantic_analysis, tmp_path):
+        """Test that save creates nested output directories on first use only"""
+        reports_dir = tmp_path / "a" / "b" / "reports"
+
+        with patch.object(Path, "mkdir", autospec=True, side_effect=Path.mkdir) as mkdir:
+            first = MarkdownFormatter().save(mock_semantic_analysis, reports_dir)
+            calls_after_first = mkdir.call_count
+            second = MarkdownFormatter().save(mock_semantic_analysis, reports_dir)
+
+        assert first.exists() and second.exists()
+        assert calls_after_first > 0
+        assert mkdir.call_count == calls_after_first
+
+    def test_save_leaves_no_temp_file(self, mock_semantic_analysis, tmp_path):
+        """Test that the atomic write renames its temp file into place"""
+        path = MarkdownFormatter().save(mock_semantic_analysis, tmp_path)
+
+        assert [p.name for p in tmp_path.iterdir()] == [path.name]
+        assert path.read_bytes() == MarkdownFormatter().format(mock_semantic_analysis).encode()
+
+    def test_save_many_keeps_input_order(self, mock_semantic_analysis, tmp_path):
+        """Test that save_many writes every report and returns paths in order"""
+        second = mock_semantic_analysis.model_copy(update={"commit_hash": "f" * 40})
+
+        paths = MarkdownFormatter().save_many([mock_semantic_analysis, second], tmp_path)
+
+        assert [p.name[:8] for p in paths] == [mock_semantic_analysis.commit_hash[:8], "ffffffff"]
+        assert all(p.exists() for p in paths)
+
     def test_risk_icon_mapping(self):
         """Test that risk levels map to correct icons"""
         formatter = MarkdownFormatter()
@@ -275,6 +326,30 @@ class TestConsoleFormatter:
 
         # Should truncate and show "and X more"
         assert "and" in output and "more" in output
+        assert "src/file_7.py" in output
+        assert "src/file_8.py" not in output
+        assert (
+            f"and {len(many_files.files_changed) - ConsoleFormatter.MAX_FILES_DISPLAY} more"
+            in output
+        )
+
+    def test_format_shortens_long_paths(self, mock_minimal_analysis):
+        """Test that long paths are cut to the column width with an ellipsis"""
+        formatter = ConsoleFormatter()
+        formatter.console = Console(file=io.StringIO(), width=120)
+        analysis = mock_minimal_analysis.model_copy(
+            update={
+                "files_changed": [FileChange(path="deep/" * 20 + "leaf.py", change_type="added")]
+            }
+        )
+
+        formatter.format(analysis)
+
+        row = next(
+            line for line in formatter.console.file.getvalue().splitlines() if "deep/" in line
+        )
+        assert "leaf.py" not in row
+        assert "…" in row
 
     def test_risk_icon_mapping(self):
         """Test that risk levels map to correct icons"""
@@ -308,6 +383,69 @@ class TestConsoleFormatter:
         # Should show confidence percentage
         assert "75%" in captured.out or "0.75" in captured.out
 
+    def test_formatters_share_one_console(self):
+        """Test that formatter instances reuse the process-wide Console"""
+        assert ConsoleFormatter().console is ConsoleFormatter(brief=True).console
+
+    def test_risk_display_matches_icon_and_style(self):
+        """Test the combined (icon, color) table agrees with the individual maps"""
+        formatter = ConsoleFormatter()
+
+        for level in RiskLevel:
+            assert formatter.RISK_DISPLAY[level] == (
+                formatter._risk_icon(level),
+                formatter._risk_style(level),
+            )
+
+    def test_confidence_bar_is_ten_cells(self):
+        """Test the confidence bar fills one cell per 10%"""
+        assert ConsoleFormatter._confidence_bar(0.75) == "███████░░░"
+        assert ConsoleFormatter._confidence_bar(0.0) == "░" * 10
+        assert ConsoleFormatter._confidence_bar(1.0) == "█" * 10
+
+
+class TestConsoleFormatterStreaming:
+    """Test live rendering of a streamed response"""
+
+    def test_partial_json_string_reads_unterminated_value(self):
+        """Test a string field is extracted before its closing quote arrives"""
+        text = '{"intent": {"summary": "Add \\"retry\\" to cli'
+        assert partial_json_string(text, "summary") == 'Add "retry" to cli'
+
+    def test_partial_json_string_missing_field(self):
+        """Test None is returned until the field name has streamed in"""
+        assert partial_json_string('{"intent": {"summ', "summary") is None
+
+    def test_partial_json_string_cut_escape(self):
+        """Test an escape cut in half by the stream is not decoded"""
+        assert partial_json_string('{"summary": "a \\', "summary") == "a "
+
+    def test_stream_progress_renders_summary(self):
+        """Test the live panel shows the summary as chunks arrive"""
+        formatter = ConsoleFormatter()
+        formatter.console = Console(file=io.StringIO(), force_terminal=True, width=80)
+
+        with formatter.stream_progress() as (on_text, on_retry):
+            on_text('{"intent": {"summary": "Streamed ')
+            on_text('summary", "reasoning": "Because"')
+
+        output = formatter.console.file.getvalue()
+        assert "Streamed summary" in output
+        assert "Because" in output
+
+    def test_stream_progress_retry_clears_text(self):
+        """Test a retried request starts the live panel over instead of appending"""
+        formatter = ConsoleFormatter()
+        formatter.console = Console(file=io.StringIO(), force_terminal=True, width=80)
+
+        with formatter.stream_progress() as (on_text, on_retry):
+            on_text('{"intent": {"summary": "First att')
+            on_retry()
+            on_text('{"intent": {"summary": "Second attempt"')
+
+        # Without the reset the buffer would parse as the summary 'First att{'
+        assert "Second attempt" in formatter.console.file.getvalue()
+
 
 class TestConsoleFormatterBriefMode:
     """Test ConsoleFormatter brief mode output"""
@@ -2,13 +2,44 @@
 Tests for GitParser - git diff parser
 """
 
-import shutil
+from unittest.mock import patch
 
 import pytest
 from git import Actor, Repo
 
 from semantic_diff.models import FileChange
-from semantic_diff.parsers.git_parser import GitParser
+from semantic_diff.parsers.git_parser import BatchCatFile, GitParser
+
+KNOWN_EXTENSION_CASES = [
+    ("file.py", "python"),
+    ("script.js", "javascript"),
+    ("component.tsx", "typescript"),
+    ("main.rs", "rust"),
+    ("app.go", "go"),
+    ("Main.java", "java"),
+    ("script.rb", "ruby"),
+    ("index.php", "php"),
+    ("program.c", "c"),
+    ("program.cpp", "cpp"),
+    ("header.h", "c"),
+    ("header.hpp", "cpp"),
+    ("app.cs", "csharp"),
+    ("App.swift", "swift"),
+    ("Main.kt", "kotlin"),
+    ("App.scala", "scala"),
+    ("query.sql", "sql"),
+    ("README.md", "markdown"),
+    ("config.json", "json"),
+    ("config.yaml", "yaml"),
+    ("config.yml", "yaml"),
+    ("config.toml", "toml"),
+    ("data.xml", "xml"),
+    ("index.html", "html"),
+    ("style.css", "css"),
+    ("style.scss", "scss"),
+    ("script.sh", "bash"),
+    ("script.bash", "bash"),
+]
 
 
 class TestGitParserInit:
@@ -46,43 +77,12 @@ class TestGitParserInit:
 class TestDetectLanguage:
     """Test language detection from file extensions"""
 
-    def test_detect_known_extensions(self):
+    @pytest.mark.parametrize("filepath, expected_lang", KNOWN_EXTENSION_CASES)
+    def test_detect_known_extensions(self, filepath, expected_lang):
         """Test detection of known file extensions"""
         parser = GitParser.__new__(GitParser)
 
-        test_cases = [
-            ("file.py", "python"),
-            ("script.js", "javascript"),
-            ("component.tsx", "typescript"),
-            ("main.rs", "rust"),
-            ("app.go", "go"),
-            ("Main.java", "java"),
-            ("script.rb", "ruby"),
-            ("index.php", "php"),
-            ("program.c", "c"),
-            ("program.cpp", "cpp"),
-            ("header.h", "c"),
-            ("header.hpp", "cpp"),
-            ("app.cs", "csharp"),
-            ("App.swift", "swift"),
-            ("Main.kt", "kotlin"),
-            ("App.scala", "scala"),
-            ("query.sql", "sql"),
-            ("README.md", "markdown"),
-            ("config.json", "json"),
-            ("config.yaml", "yaml"),
-            ("config.yml", "yaml"),
-            ("config.toml", "toml"),
-            ("data.xml", "xml"),
-            ("index.html", "html"),
-            ("style.css", "css"),
-            ("style.scss", "scss"),
-            ("script.sh", "bash"),
-            ("script.bash", "bash"),
-        ]
-
-        for filepath, expected_lang in test_cases:
-            assert parser.detect_language(filepath) == expected_lang
+        assert parser.detect_language(filepath) == expected_lang
 
     def test_detect_unknown_extension(self):
         """Test detection returns None for unknown extensions"""
@@ -108,59 +108,63 @@ class TestDetectLanguage:
         assert parser.detect_language("File.JS") == "javascript"
         assert parser.detect_language("File.Py") == "python"
 
+    def test_detect_ignores_dots_in_directories(self):
+        """Test only the file name's extension is considered"""
+        parser = GitParser.__new__(GitParser)
+
+        assert parser.detect_language("pkg.d/Makefile") is None
+        assert parser.detect_language("v1.2/src/main.rs") == "rust"
+        assert parser.detect_language(".github/.bashrc") is None
+
 
 class TestGetCommit:
     """Test getting commit objects"""
 
-    def test_get_commit_valid_hash(self, tmp_path):
+    def test_get_commit_valid_hash(self, tmp_path, single_commit_repo):
         """Test getting commit with valid hash"""
-        repo = Repo.init(tmp_path)
-        file_path = tmp_path / "test.txt"
-        file_path.write_text("test content")
-        repo.index.add(["test.txt"])
-        commit = repo.index.commit("Initial commit")
+        _, commit_hash = single_commit_repo
 
         parser = GitParser(str(tmp_path))
-        retrieved_commit = parser.get_commit(commit.hexsha)
+        retrieved_commit = parser.get_commit(commit_hash)
 
-        assert retrieved_commit.hexsha == commit.hexsha
+        assert retrieved_commit.hexsha == commit_hash
         assert retrieved_commit.message.strip() == "Initial commit"
 
-    def test_get_commit_short_hash(self, tmp_path):
+    def test_get_commit_short_hash(self, tmp_path, single_commit_repo):
         """Test getting commit with short hash"""
-        repo = Repo.init(tmp_path)
-        file_path = tmp_path / "test.txt"
-        file_path.write_text("test content")
-        repo.index.add(["test.txt"])
-        commit = repo.index.commit("Initial commit")
+        _, commit_hash = single_commit_repo
 
         parser = GitParser(str(tmp_path))
-        short_hash = commit.hexsha[:8]
+        short_hash = commit_hash[:8]
         retrieved_commit = parser.get_commit(short_hash)
 
-        assert retrieved_commit.hexsha == commit.hexsha
+        assert retrieved_commit.hexsha == commit_hash
 
-    def test_get_commit_invalid_hash(self, tmp_path):
-        """Test getting commit with invalid hash raises ValueError"""
-        repo = Repo.init(tmp_path)
-        file_path = tmp_path / "test.txt"
-        file_path.write_text("test content")
+    def test_get_commit_caches_full_hashes_only(self, tmp_path, single_commit_repo):
+        """Test full hashes are memoized while HEAD keeps following new commits"""
+        repo, commit_hash = single_commit_repo
+        parser = GitParser(str(tmp_path))
+
+        first = parser.get_commit("HEAD")
+        with patch.object(parser.repo, "commit", wraps=parser.repo.commit) as repo_commit:
+            assert parser.get_commit(commit_hash) is first
+            repo_commit.assert_not_called()
+
+        (tmp_path / "test.txt").write_text("changed")
         repo.index.add(["test.txt"])
-        repo.index.commit("Initial commit")
+        new_commit = repo.index.commit("Second commit")
 
+        assert parser.get_commit("HEAD").hexsha == new_commit.hexsha
+
+    def test_get_commit_invalid_hash(self, tmp_path, single_commit_repo):
+        """Test getting commit with invalid hash raises ValueError"""
         parser = GitParser(str(tmp_path))
 
         with pytest.raises(ValueError, match="Could not find commit"):
             parser.get_commit("invalid_hash_123")
 
-    def test_get_commit_nonexistent_hash(self, tmp_path):
+    def test_get_commit_nonexistent_hash(self, tmp_path, single_commit_repo):
         """Test getting commit with nonexistent but valid-looking hash"""
-        repo = Repo.init(tmp_path)
-        file_path = tmp_path / "test.txt"
-        file_path.write_text("test content")
-        repo.index.add(["test.txt"])
-        repo.index.commit("Initial commit")
-
         parser = GitParser(str(tmp_path))
 
         with pytest.raises(ValueError, match="Could not find commit"):
@@ -198,16 +202,12 @@ class TestGetCommitInfo:
         assert isinstance(info["date"], str)
         assert isinstance(info["parents"], list)
 
-    def test_get_commit_info_initial_commit(self, tmp_path):
+    def test_get_commit_info_initial_commit(self, tmp_path, single_commit_repo):
         """Test commit info for initial commit (no parents)"""
-        repo = Repo.init(tmp_path)
-        file_path = tmp_path / "test.txt"
-        file_path.write_text("test content")
-        repo.index.add(["test.txt"])
-        commit = repo.index.commit("Initial commit")
+        _, commit_hash = single_commit_repo
 
         parser = GitParser(str(tmp_path))
-        info = parser.get_commit_info(commit.hexsha)
+        info = parser.get_commit_info(commit_hash)
 
         assert info["parents"] == []
 
@@ -263,6 +263,24 @@ class TestGetFileChanges:
             assert change.additions > 0
             assert change.deletions == 0
 
+    def test_get_file_changes_initial_commit_many_files(self, tmp_path):
+        """Test initial commit with more blobs than the cat-file pipeline window"""
+        repo = Repo.init(tmp_path)
+        count = BatchCatFile.MAX_INFLIGHT * 3 + 1
+        names = []
+        for i in range(count):
+            (tmp_path / f"f{i}.py").write_text(f"x = {i}\n")
+            names.append(f"f{i}.py")
+        repo.index.add(names)
+        commit = repo.index.commit("Initial commit")
+
+        changes = GitParser(str(tmp_path)).get_file_changes(commit.hexsha)
+
+        assert len(changes) == count
+        by_path = {change.path: change for change in changes}
+        assert by_path["f7.py"].diff_content == "+x = 7\n"
+        assert by_path[f"f{count - 1}.py"].diff_content == f"+x = {count - 1}\n"
+
     def test_get_file_changes_normal_commit(self, tmp_path):
         """Test file changes for normal commit with parent"""
         repo = Repo.init(tmp_path)
@@ -372,6 +390,43 @@ class TestGetFileChanges:
             assert "old_name.py" in change.path
             assert "new_name.py" in change.path
 
+    def test_get_file_changes_counts_from_numstat(self, tmp_path):
+        """Test line counts match git, including added lines that start with '++'"""
+        repo = Repo.init(tmp_path)
+        file_path = tmp_path / "main.c"
+        file_path.write_text("int i;\n--i;\n")
+        repo.index.add(["main.c"])
+        repo.index.commit("Initial commit")
+
+        file_path.write_text("int i;\n++i;\n++i;\n")
+        repo.index.add(["main.c"])
+        commit = repo.index.commit("Increment")
+
+        change = GitParser(str(tmp_path)).get_file_changes(commit.hexsha)[0]
+
+        assert change.additions == 2
+        assert change.deletions == 1
+
+    def test_get_file_changes_renamed_file_counts(self, tmp_path):
+        """Test a renamed and edited file gets the line counts of its new path"""
+        repo = Repo.init(tmp_path)
+        body = "".join(f"line {i}\n" for i in range(20))
+        (tmp_path / "old.py").write_text(body)
+        repo.index.add(["old.py"])
+        repo.index.commit("Initial commit")
+
+        (tmp_path / "old.py").unlink()
+        (tmp_path / "new.py").write_text(body + "extra\n")
+        repo.index.remove(["old.py"])
+        repo.index.add(["new.py"])
+        commit = repo.index.commit("Rename and extend")
+
+        changes = GitParser(str(tmp_path)).get_file_changes(commit.hexsha)
+
+        assert len(changes) == 1
+        assert changes[0].change_type == "renamed"
+        assert (changes[0].additions, changes[0].deletions) == (1, 0)
+
     def test_get_file_changes_binary_file(self, tmp_path):
         """Test file changes with binary file"""
         repo = Repo.init(tmp_path)
@@ -420,33 +475,36 @@ class TestGetFileChanges:
         """Test file changes for merge commit"""
         repo = Repo.init(tmp_path)
 
-        # Initial commit on main
+        # Initial commit
         file_path = tmp_path / "test.txt"
         file_path.write_text("main content")
         repo.index.add(["test.txt"])
-        repo.index.commit("Initial commit")
+        base_commit = repo.index.commit("Initial commit")
 
-        # Create branch
-        branch = repo.create_head("feature")
-        branch.checkout()
-
-        # Commit on branch
+        # Commit on a feature line, built straight from the index (HEAD stays put)
         file_path.write_text("branch content")
         repo.index.add(["test.txt"])
-        repo.index.commit("Branch commit")
+        branch_commit = repo.index.commit("Branch commit", parent_commits=[base_commit], head=False)
 
-        # Switch back to main
-        repo.heads.master.checkout()
+        # Diverging commit on main touching another file
+        file_path.write_text("main content")
+        (tmp_path / "main.txt").write_text("main only")
+        repo.index.add(["test.txt", "main.txt"])
+        main_commit = repo.index.commit("Main commit", parent_commits=[base_commit])
 
-        # Merge branch
-        repo.git.merge("feature")
-        merge_commit = repo.head.commit
+        # True two-parent merge of both sides, no git merge subprocess
+        file_path.write_text("branch content")
+        repo.index.add(["test.txt"])
+        merge_commit = repo.index.commit(
+            "Merge feature", parent_commits=[main_commit, branch_commit]
+        )
 
         parser = GitParser(str(tmp_path))
         changes = parser.get_file_changes(merge_commit.hexsha)
 
-        # Merge commits should still return changes
-        assert isinstance(changes, list)
+        # Merge commits are diffed against their first parent
+        assert len(merge_commit.parents) == 2
+        assert [(c.path, c.change_type) for c in changes] == [("test.txt", "modified")]
 
     def test_get_file_changes_language_detection(self, tmp_path):
         """Test that language is correctly detected for changed files"""
@@ -496,6 +554,151 @@ class TestGetFileChanges:
         # Diff should be truncated
         assert len(change.diff_content) <= 5000
 
+    def test_get_file_changes_max_files_keeps_root_files_first(self, tmp_path):
+        """Test a capped initial commit lists root-level files before nested ones"""
+        repo = Repo.init(tmp_path)
+        nested = tmp_path / "a_dir"
+        nested.mkdir()
+        (nested / "deep.py").write_text("x = 1\n")
+        (tmp_path / "z_root.py").write_text("y = 2\n")
+        repo.index.add(["a_dir/deep.py", "z_root.py"])
+        commit = repo.index.commit("Initial commit")
+
+        parser = GitParser(str(tmp_path))
+        changes = parser.get_file_changes(commit.hexsha, max_files=1)
+
+        assert [c.path for c in changes] == ["z_root.py"]
+
+    def test_get_file_changes_skips_oversized_patches(self, tmp_path):
+        """Test huge files get a size summary while the other patches are unchanged"""
+        repo = Repo.init(tmp_path)
+        files = {
+            "big.txt": "a\n",
+            "small.py": "x = 1\n",
+            "[id].py": "y = 1\n",
+            "old_name.py": "".join(f"line {i}\n" for i in range(10)),
+        }
+        for name, content in files.items():
+            (tmp_path / name).write_text(content)
+        repo.index.add(list(files))
+        repo.index.commit("Initial commit")
+
+        (tmp_path / "big.txt").write_text("b\n" * 50)
+        (tmp_path / "small.py").write_text("x = 2\n")
+        (tmp_path / "[id].py").write_text("y = 2\n")
+        repo.index.move(["old_name.py", "new_name.py"])
+        (tmp_path / "new_name.py").write_text(files["old_name.py"] + "extra\n")
+        repo.index.add(["big.txt", "small.py", "[id].py", "new_name.py"])
+        commit = repo.index.commit("Grow big.txt")
+
+        parser = GitParser(str(tmp_path))
+        full = {c.path: c for c in parser.get_file_changes(commit.hexsha)}
+        with patch.object(GitParser, "MAX_PATCH_LINES", 20):
+            capped = {c.path: c for c in parser.get_file_changes(commit.hexsha)}
+
+        assert capped["big.txt"].diff_content == "[diff too large: +50/-1 lines]"
+        assert capped["big.txt"].additions == 50
+        del full["big.txt"], capped["big.txt"]
+        assert capped == full
+        assert "old_name.py -> new_name.py" in capped
+
+    def test_oversized_file_keeps_added_and_deleted_patches(self, tmp_path):
+        """Test added and deleted files still get their patch next to an oversized file"""
+        repo = Repo.init(tmp_path)
+        (tmp_path / "big.txt").write_text("a\n")
+        (tmp_path / "del.py").write_text("gone = True\n")
+        repo.index.add(["big.txt", "del.py"])
+        repo.index.commit("Initial commit")
+
+        (tmp_path / "big.txt").write_text("b\n" * 50)
+        (tmp_path / "new.py").write_text("fresh = True\n")
+        repo.index.add(["big.txt", "new.py"])
+        repo.index.remove(["del.py"], working_tree=True)
+        commit = repo.index.commit("Grow big.txt, swap files")
+
+        parser = GitParser(str(tmp_path))
+        with patch.object(GitParser, "MAX_PATCH_LINES", 20):
+            changes = {c.path: c for c in parser.get_file_changes(commit.hexsha)}
+
+        assert changes["big.txt"].diff_content == "[diff too large: +50/-1 lines]"
+        assert changes["new.py"].change_type == "added"
+        assert "+fresh = True" in changes["new.py"].diff_content
+        assert changes["del.py"].change_type == "deleted"
+        assert "-gone = True" in changes["del.py"].diff_content
+
+    def test_get_file_changes_batch_matches_single(self, tmp_path):
+        """Test batch results match per-commit results, keyed by the given hashes"""
+        repo = Repo.init(tmp_path)
+        hashes = []
+        for i in range(3):
+            (tmp_path / f"file{i}.py").write_text(f"x = {i}\n")
+            repo.index.add([f"file{i}.py"])
+            hashes.append(repo.index.commit(f"Commit {i}").hexsha)
+
+        parser = GitParser(str(tmp_path))
+        batch = parser.get_file_changes_batch(hashes, max_workers=2)
+
+        assert list(batch) == hashes
+        for commit_hash in hashes:
+            assert batch[commit_hash] == parser.get_file_changes(commit_hash)
+
+    def test_decode_head_matches_full_decode(self):
+        """Test decoding a bounded prefix gives the same text as decode-then-slice"""
+        data = "é€😀x".encode("utf-8") * 3000 + b"\xff\xfe"
+
+        assert GitParser._decode_head(data, 5000) == data.decode("utf-8", errors="replace")[:5000]
+        assert GitParser._decode_head(b"\xffabc", 2) == "\ufffda"
+
+
+class TestBatchCatFile:
+    """Test the pipelined cat-file reader"""
+
+    def test_reads_blobs_in_order_and_reports_missing(self, tmp_path):
+        """Test responses keep request order and missing objects yield None"""
+        repo = Repo.init(tmp_path)
+        (tmp_path / "a.txt").write_text("alpha\n")
+        (tmp_path / "b.txt").write_text("beta\n")
+        repo.index.add(["a.txt", "b.txt"])
+        commit = repo.index.commit("Initial commit")
+        a_sha = commit.tree["a.txt"].hexsha
+        b_sha = commit.tree["b.txt"].hexsha
+        missing = "0" * 40
+
+        with BatchCatFile(repo.git_dir) as cat_file:
+            result = list(cat_file.read_blobs([b_sha, missing, a_sha]))
+
+        assert result == [(b_sha, b"beta\n"), (missing, None), (a_sha, b"alpha\n")]
+
+    def test_close_with_unread_responses(self, tmp_path):
+        """Test closing early does not hang on responses still in the pipe"""
+        repo = Repo.init(tmp_path)
+        (tmp_path / "big.txt").write_text("x" * 200_000)
+        repo.index.add(["big.txt"])
+        sha = repo.index.commit("Initial commit").tree["big.txt"].hexsha
+
+        with BatchCatFile(repo.git_dir) as cat_file:
+            blobs = cat_file.read_blobs([sha] * 5)
+            assert next(blobs)[1] == b"x" * 200_000
+
+    def test_read_blob_heads_streams_the_rest(self, tmp_path):
+        """Test heads are truncated while newlines are counted over the whole blob"""
+        repo = Repo.init(tmp_path)
+        (tmp_path / "big.txt").write_text("line\n" * 50_000)
+        (tmp_path / "small.txt").write_text("one\ntwo")
+        repo.index.add(["big.txt", "small.txt"])
+        tree = repo.index.commit("Initial commit").tree
+        big_sha, small_sha = tree["big.txt"].hexsha, tree["small.txt"].hexsha
+        missing = "0" * 40
+
+        with BatchCatFile(repo.git_dir) as cat_file:
+            result = list(cat_file.read_blob_heads([big_sha, missing, small_sha], head_size=10))
+
+        assert result == [
+            (big_sha, b"line\nline\n", 50_000),
+            (missing, None, 0),
+            (small_sha, b"one\ntwo", 1),
+        ]
+
 
 class TestGetProjectContext:
     """Test getting project context"""
@@ -587,30 +790,43 @@ class TestGetProjectContext:
 
         assert context["has_ci"] is True
 
-    def test_get_project_context_detects_package_managers(self, tmp_path):
-        """Test project context detects package managers"""
-        test_cases = [
+    def test_get_project_context_one_path_sets_tests_and_ci(self, tmp_path):
+        """Test a single path can mark both tests and CI"""
+        repo = Repo.init(tmp_path)
+
+        ci_dir = tmp_path / ".github" / "workflows"
+        ci_dir.mkdir(parents=True)
+        (ci_dir / "test.yml").write_text("ci config")
+        repo.index.add([".github/workflows/test.yml"])
+        repo.index.commit("Add CI")
+
+        parser = GitParser(str(tmp_path))
+        context = parser.get_project_context()
+
+        assert context["has_tests"] is True
+        assert context["has_ci"] is True
+
+    @pytest.mark.parametrize(
+        "filename, expected_pm",
+        [
             ("package.json", "npm"),
             ("requirements.txt", "pip"),
             ("pyproject.toml", "pip"),
             ("Cargo.toml", "cargo"),
             ("go.mod", "go"),
-        ]
-
-        for filename, expected_pm in test_cases:
-            repo = Repo.init(tmp_path)
-            (tmp_path / filename).write_text("config")
-            repo.index.add([filename])
-            repo.index.commit("Add package file")
-
-            parser = GitParser(str(tmp_path))
-            context = parser.get_project_context()
+        ],
+    )
+    def test_get_project_context_detects_package_managers(self, tmp_path, filename, expected_pm):
+        """Test project context detects package managers"""
+        repo = Repo.init(tmp_path)
+        (tmp_path / filename).write_text("config")
+        repo.index.add([filename])
+        repo.index.commit("Add package file")
 
-            assert context["package_manager"] == expected_pm
+        parser = GitParser(str(tmp_path))
+        context = parser.get_project_context()
 
-            # Cleanup for next iteration
-            shutil.rmtree(tmp_path / ".git")
-            (tmp_path / filename).unlink()
+        assert context["package_manager"] == expected_pm
 
     def test_get_project_context_root_files(self, tmp_path):
         """Test project context lists root files"""
@@ -652,6 +868,24 @@ class TestGetProjectContext:
         for dirname in dirs:
             assert dirname in context["directories"]
 
+    def test_get_project_context_reads_committed_tree_only(self, tmp_path):
+        """Test nested files count, subdirectories are not listed, and untracked files are ignored"""
+        repo = Repo.init(tmp_path)
+
+        nested = tmp_path / "src" / "pkg"
+        nested.mkdir(parents=True)
+        (nested / "lib.go").write_text("package pkg")
+        repo.index.add(["src/pkg/lib.go"])
+        repo.index.commit("Add nested file")
+        (tmp_path / "scratch.rs").write_text("fn main() {}")
+
+        parser = GitParser(str(tmp_path))
+        context = parser.get_project_context()
+
+        assert context["languages"] == ["go"]
+        assert context["directories"] == ["src"]
+        assert context["root_files"] == []
+
     def test_get_project_context_empty_repo(self, tmp_path):
         """Test project context with empty repository"""
         Repo.init(tmp_path)
@@ -2,14 +2,34 @@
 Tests for LLMAnalyzer - Claude-based semantic analyzer
 """
 
+import asyncio
 import os
-from unittest.mock import Mock, patch
+import threading
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
 import anthropic
 import pytest
 
-from semantic_diff.analyzers.llm_analyzer import LLMAnalyzer
-from semantic_diff.models import FileChange, RiskLevel
+from semantic_diff.analyzers.llm_analyzer import LLMAnalyzer, risk_level
+from semantic_diff.cache import SemanticCache
+from semantic_diff.models import FileChange, RiskLevel, SemanticAnalysis
+
+
+@pytest.fixture
+def analyzer():
+    with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
+        with patch("anthropic.Anthropic"):
+            a = LLMAnalyzer()
+            a.client = Mock()
+            return a
+
+
+@pytest.fixture(autouse=True)
+def mock_sleep(monkeypatch):
+    """Retry and polling loops never really sleep in these tests"""
+    sleep = Mock()
+    monkeypatch.setattr("time.sleep", sleep)
+    return sleep
 
 
 class TestLLMAnalyzerInit:
@@ -49,12 +69,6 @@ class TestLLMAnalyzerInit:
 class TestFormatFilesSummary:
     """Test _format_files_summary method"""
 
-    @pytest.fixture
-    def analyzer(self):
-        with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
-            with patch("anthropic.Anthropic"):
-                return LLMAnalyzer()
-
     def test_format_single_file(self, analyzer):
         """Test formatting single file"""
         files = [
@@ -103,12 +117,6 @@ class TestFormatFilesSummary:
 class TestFormatDiffs:
     """Test _format_diffs method"""
 
-    @pytest.fixture
-    def analyzer(self):
-        with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
-            with patch("anthropic.Anthropic"):
-                return LLMAnalyzer()
-
     def test_format_single_diff(self, analyzer):
         """Test formatting single diff"""
         files = [
@@ -127,13 +135,13 @@ class TestFormatDiffs:
 
     def test_format_diffs_truncation(self, analyzer):
         """Test that long diffs are truncated"""
-        long_content = "x" * 20000  # Exceeds max_total_chars
+        long_content = "x" * 20000  # Exceeds max_total_tokens
         files = [
             FileChange(
                 path="huge.py", change_type="modified", diff_content=long_content, language="python"
             )
         ]
-        result = analyzer._format_diffs(files, max_total_chars=1000)
+        result = analyzer._format_diffs(files, max_total_tokens=250)
         assert len(result) < len(long_content)
         assert "(truncated)" in result
 
@@ -148,20 +156,75 @@ class TestFormatDiffs:
             )
             for i in range(20)
         ]
-        result = analyzer._format_diffs(files, max_total_chars=5000)
+        result = analyzer._format_diffs(files, max_total_tokens=1200)
         assert "truncated" in result.lower()
         assert "more files" in result.lower()
 
+    def test_largest_changes_get_budget_first(self, analyzer):
+        """Test budget goes to the biggest change but output keeps file order"""
+        files = [
+            FileChange(path="small.py", change_type="modified", additions=1, diff_content="+a"),
+            FileChange(
+                path="big.py",
+                change_type="modified",
+                additions=100,
+                diff_content="word " * 400,
+            ),
+            FileChange(path="tiny.py", change_type="modified", additions=2, diff_content="+b"),
+        ]
+        result = analyzer._format_diffs(files, max_total_tokens=200)
+        assert "big.py" in result
+        assert "more files" in result
+
+        files[1] = files[1].model_copy(update={"diff_content": "+c"})
+        result = analyzer._format_diffs(files)
+        assert result.index("small.py") < result.index("big.py") < result.index("tiny.py")
+
+    def test_estimate_tokens(self, analyzer):
+        """Test token estimate scales with identifiers and punctuation"""
+        assert analyzer._estimate_tokens("") == 0
+        assert analyzer._estimate_tokens("foo(bar)") == 4
+        assert analyzer._estimate_tokens("a_very_long_identifier") == 6
+
+
+class TestCompressDiff:
+    """Test _compress_diff method"""
+
+    def test_drops_distant_context(self, analyzer):
+        """Test context lines far from changes are removed"""
+        diff = "@@ -1,7 +1,7 @@\n a\n b\n c\n-old\n+new\n d\n e\n f"
+        result = analyzer._compress_diff(diff)
+        assert result == "@@ -1,7 +1,7 @@\n c\n-old\n+new\n d"
+
+    def test_keeps_hunk_headers(self, analyzer):
+        """Test each hunk keeps its @@ header"""
+        diff = "@@ -1,2 +1,2 @@\n-a\n+b\n@@ -10,2 +10,2 @@\n-c\n+d"
+        result = analyzer._compress_diff(diff)
+        assert result.count("@@ -") == 2
+
+    def test_drops_no_newline_marker(self, analyzer):
+        """Test '\\ No newline at end of file' markers are removed"""
+        diff = "@@ -1 +1 @@\n-a\n+b\n\\ No newline at end of file"
+        assert "No newline" not in analyzer._compress_diff(diff)
+
+    def test_elides_long_hunks(self, analyzer):
+        """Test very long hunks keep head and tail only"""
+        diff = "@@ -1,0 +1,200 @@\n" + "\n".join(f"+line{i}" for i in range(200))
+        result = analyzer._compress_diff(diff, max_hunk_lines=20)
+        assert "+line0" in result
+        assert "+line199" in result
+        assert "+line100" not in result
+        assert "(elided 180 lines)" in result
+
+    def test_collapses_blank_lines_without_hunks(self, analyzer):
+        """Test non-hunk content only gets whitespace cleanup"""
+        result = analyzer._compress_diff("+first   \n\n\n\nsecond")
+        assert result == "+first\n\nsecond"
+
 
 class TestFormatProjectContext:
     """Test _format_project_context method"""
 
-    @pytest.fixture
-    def analyzer(self):
-        with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
-            with patch("anthropic.Anthropic"):
-                return LLMAnalyzer()
-
     def test_format_full_context(self, analyzer):
         """Test formatting full project context"""
         context = {
@@ -189,12 +252,6 @@ class TestFormatProjectContext:
 class TestParseResponse:
     """Test _parse_response method"""
 
-    @pytest.fixture
-    def analyzer(self):
-        with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
-            with patch("anthropic.Anthropic"):
-                return LLMAnalyzer()
-
     def test_parse_json_in_code_block(self, analyzer):
         """Test parsing JSON in ```json block"""
         response = """Here's my analysis:
@@ -220,6 +277,18 @@ Done."""
         result = analyzer._parse_response(response)
         assert result["intent"]["summary"] == "raw"
 
+    def test_parse_json_block_with_trailing_fence(self, analyzer):
+        """Test only the first fenced JSON object is used"""
+        response = """```json
+{"intent": {"summary": "first"}}
+```
+Example usage:
+```
+{"other": true}
+```"""
+        result = analyzer._parse_response(response)
+        assert result["intent"]["summary"] == "first"
+
     def test_parse_invalid_json(self, analyzer):
         """Test parsing invalid JSON raises ValueError"""
         response = "This is not JSON at all"
@@ -233,15 +302,27 @@ Done."""
             analyzer._parse_response(response)
 
 
+class TestRiskLevel:
+    """Test risk_level severity factory"""
+
+    def test_known_values(self):
+        """Test all severity strings map to RiskLevel members"""
+        for level in RiskLevel:
+            assert risk_level(level.value) is level
+
+    def test_normalizes_case_and_whitespace(self):
+        """Test LLM casing quirks are tolerated"""
+        assert risk_level(" High ") is RiskLevel.HIGH
+
+    def test_unknown_value_defaults_to_medium(self):
+        """Test unknown severities fall back to MEDIUM instead of raising"""
+        assert risk_level("catastrophic") is RiskLevel.MEDIUM
+        assert risk_level(None) is RiskLevel.MEDIUM
+
+
 class TestValidateResponseData:
     """Test _validate_response_data method"""
 
-    @pytest.fixture
-    def analyzer(self):
-        with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
-            with patch("anthropic.Anthropic"):
-                return LLMAnalyzer()
-
     def test_validate_empty_data(self, analyzer):
         """Test validation fills defaults for empty data"""
         data = {}
@@ -290,86 +371,258 @@ class TestValidateResponseData:
         assert result["risk_assessment"]["overall_risk"] == "low"
 
 
-class TestCallApiWithRetry:
-    """Test _call_api_with_retry method"""
+class TestTrivialAnalysis:
+    """Test local fast path for trivial commits"""
 
     @pytest.fixture
-    def analyzer(self):
-        with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
-            with patch("anthropic.Anthropic"):
-                a = LLMAnalyzer()
-                a.client = Mock()
-                return a
+    def commit_info(self):
+        return {
+            "hash": "abc123",
+            "short_hash": "abc123",
+            "message": "Tidy up",
+            "author": "Test",
+            "date": "2024-01-01",
+        }
 
-    def test_successful_call(self, analyzer):
-        """Test successful API call without retry"""
-        mock_response = Mock()
-        analyzer.client.messages.create.return_value = mock_response
+    def test_docs_only_commit(self, analyzer, commit_info):
+        """Test documentation-only commits skip the API"""
+        files = [FileChange(path="README.md", change_type="modified", diff_content="+text")]
+        result = analyzer.analyze(commit_info, files, {})
 
-        result = analyzer._call_api_with_retry("test prompt", max_retries=3)
-        assert result == mock_response
-        assert analyzer.client.messages.create.call_count == 1
+        assert result.analysis_model == "local-rules"
+        assert result.risk_assessment.overall_risk == RiskLevel.LOW
+        assert result.tokens_used == 0
+        analyzer.client.messages.create.assert_not_called()
 
-    def test_retry_on_rate_limit(self, analyzer):
-        """Test retry on rate limit error"""
-        mock_response = Mock()
-        rate_limit_error = anthropic.RateLimitError(
-            message="Rate limited", response=Mock(status_code=429), body={}
-        )
+    def test_local_analysis_is_valid(self, analyzer, commit_info):
+        """Test the unvalidated local analysis still passes full validation"""
+        files = [FileChange(path="README.md", change_type="modified", diff_content="+text")]
+        result = analyzer.analyze(commit_info, files, {})
 
-        analyzer.client.messages.create.side_effect = [rate_limit_error, mock_response]
+        assert SemanticAnalysis.model_validate_json(result.model_dump_json()) == result
 
-        with patch("time.sleep"):  # Skip actual sleep
-            result = analyzer._call_api_with_retry(
-                "test prompt", max_retries=3, base_delay=0.01, max_total_wait=100
+    def test_comment_only_change(self, analyzer, commit_info):
+        """Test comment and whitespace changes are cosmetic"""
+        files = [
+            FileChange(
+                path="app.py",
+                change_type="modified",
+                language="python",
+                diff_content="@@ -1,2 +1,3 @@\n-x = 1\n+# explain x\n+x  =  1\n+",
             )
+        ]
+        result = analyzer._trivial_analysis(commit_info, files)
+        assert result is not None
+        assert "Cosmetic" in result.intent.summary
 
-        assert result == mock_response
-        assert analyzer.client.messages.create.call_count == 2
+    def test_c_preprocessor_line_is_not_a_comment(self, analyzer, commit_info):
+        """Test '#' only counts as a comment in languages that use it"""
+        files = [
+            FileChange(
+                path="main.c",
+                change_type="modified",
+                language="c",
+                diff_content="@@ -1 +1 @@\n+#include <stdio.h>",
+            )
+        ]
+        assert analyzer._trivial_analysis(commit_info, files) is None
 
-    def test_retry_on_timeout(self, analyzer):
-        """Test retry on timeout error"""
-        mock_response = Mock()
-        timeout_error = anthropic.APITimeoutError(request=Mock())
+    def test_version_bump(self, analyzer, commit_info):
+        """Test version-only packaging changes are recognized"""
+        files = [
+            FileChange(
+                path="pyproject.toml",
+                change_type="modified",
+                diff_content='@@ -3 +3 @@\n-version = "0.1.0"\n+version = "0.2.0"',
+            ),
+            FileChange(path="CHANGELOG.md", change_type="modified", diff_content="+## 0.2.0"),
+        ]
+        result = analyzer._trivial_analysis(commit_info, files)
+        assert result is not None
+        assert "version" in result.intent.summary.lower()
 
-        analyzer.client.messages.create.side_effect = [timeout_error, mock_response]
+    def test_code_change_is_not_trivial(self, analyzer, commit_info):
+        """Test real code changes still go to the LLM"""
+        files = [
+            FileChange(
+                path="app.py",
+                change_type="modified",
+                language="python",
+                diff_content="@@ -1 +1 @@\n-x = 1\n+x = 2",
+            )
+        ]
+        assert analyzer._trivial_analysis(commit_info, files) is None
+
+    @pytest.mark.parametrize(
+        "path, language, diff",
+        [
+            ("app.py", "python", "@@ -1,2 +1,2 @@\n if ok:\n-    run()\n+run()"),
+            ("app.py", "python", "@@ -1,2 +1,2 @@\n-a()\n-b()\n+b()\n+a()"),
+            ("app.py", "python", '@@ -1 +1 @@\n-sep = "a b"\n+sep = "ab"'),
+            ("ci.yml", "yaml", "@@ -1,2 +1,2 @@\n jobs:\n-  test:\n+test:"),
+            ("Makefile", None, "@@ -1,2 +1,2 @@\n all:\n-\tmake\n+make"),
+            ("main.js", "javascript", "@@ -1 +1 @@\n-log('a  b')\n+log('a b')"),
+            ("app.py", "python", "@@ -1,3 +1,3 @@\n-a()\n-b()\n-c()\n+b()\n+c()\n+a()"),
+            (
+                "app.py",
+                "python",
+                "@@ -1,2 +1,2 @@\n-    validate(x)\n     use(x)\n+    validate(x)",
+            ),
+            ("app.py", "python", "@@ -1,2 +1 @@\n-a()\n b()\n@@ -9 +8,2 @@\n c()\n+a()"),
+            ("app.py", "python", "@@ -1 +1 @@\n-a()\n+c()\n@@ -9 +9 @@\n-c()\n+a()"),
+        ],
+        ids=[
+            "dedent",
+            "reorder",
+            "string_literal",
+            "yaml_indent",
+            "makefile",
+            "js_string",
+            "rotate_in_run",
+            "move_past_context",
+            "move_across_hunks",
+            "swap_across_hunks",
+        ],
+    )
+    def test_behavior_changes_are_not_cosmetic(self, analyzer, commit_info, path, language, diff):
+        """Test indentation, order and string-literal changes still go to the LLM"""
+        files = [
+            FileChange(path=path, change_type="modified", language=language, diff_content=diff)
+        ]
+        assert analyzer._trivial_analysis(commit_info, files) is None
 
-        with patch("time.sleep"):
-            result = analyzer._call_api_with_retry(
-                "test prompt", max_retries=3, base_delay=0.01, max_total_wait=100
+    def test_reindent_is_cosmetic_where_indent_is_not_syntax(self, analyzer, commit_info):
+        """Test re-indenting a brace language is still cosmetic"""
+        files = [
+            FileChange(
+                path="main.js",
+                change_type="modified",
+                language="javascript",
+                diff_content="@@ -1 +1 @@\n-  run( 1 );\n+    run(1);",
+            )
+        ]
+        assert analyzer._trivial_analysis(commit_info, files) is not None
+
+    @pytest.mark.parametrize(
+        "path, language, diff",
+        [
+            ("app.js", "javascript", "@@ -1,2 +1,2 @@\n const x = a\n-  * b;\n+  * c;"),
+            ("run.sh", "bash", "@@ -1 +1 @@\n-#!/bin/bash\n+#!/bin/sh"),
+            (
+                "app.py",
+                "python",
+                "@@ -1 +1 @@\n-# -*- coding: utf-8 -*-\n+# -*- coding: latin-1 -*-",
+            ),
+            (
+                "app.rb",
+                "ruby",
+                "@@ -1 +1 @@\n-# frozen_string_literal: true\n+# frozen_string_literal: false",
+            ),
+            ("app.py", "python", '@@ -1,3 +1,3 @@\n SQL = """\n-# select a\n+# select b\n """'),
+            ("app.py", "python", '@@ -5,2 +5,2 @@\n-# step one\n+# step two\n """'),
+            ("app.js", "javascript", "@@ -1,3 +1,3 @@\n const t = `\n-// a\n+// b\n`;"),
+        ],
+        ids=[
+            "star_continuation",
+            "shebang",
+            "coding",
+            "ruby_magic",
+            "python_string",
+            "inside_docstring",
+            "template_literal",
+        ],
+    )
+    def test_code_that_looks_like_comments(self, analyzer, commit_info, path, language, diff):
+        """Test lines that only resemble comments still go to the LLM"""
+        files = [
+            FileChange(path=path, change_type="modified", language=language, diff_content=diff)
+        ]
+        assert analyzer._trivial_analysis(commit_info, files) is None
+
+    @pytest.mark.parametrize(
+        "diff",
+        [
+            "@@ -1,4 +1,4 @@\n /*\n- * old\n+ * new\n */\n run();",
+            "@@ -1,2 +1,2 @@\n run();\n-/* old */\n+/* new */",
+            "@@ -1,2 +1,2 @@\n run();\n-// old\n+// new",
+        ],
+        ids=["block", "one_line_block", "line"],
+    )
+    def test_js_comment_changes_are_cosmetic(self, analyzer, commit_info, diff):
+        """Test edits inside real comments are still recognized as cosmetic"""
+        files = [
+            FileChange(
+                path="app.js", change_type="modified", language="javascript", diff_content=diff
             )
+        ]
+        assert analyzer._trivial_analysis(commit_info, files) is not None
 
-        assert result == mock_response
+    def test_cosmetic_runs_in_several_hunks(self, analyzer, commit_info):
+        """Test whitespace fixes spread over several hunks are still cosmetic"""
+        files = [
+            FileChange(
+                path="app.py",
+                change_type="modified",
+                language="python",
+                diff_content=(
+                    "@@ -1,2 +1,2 @@\n a = 1\n-b=2\n+b = 2\n@@ -9 +9 @@\n-f( x )\n+f(x)\n c()"
+                ),
+            )
+        ]
+        assert analyzer._trivial_analysis(commit_info, files) is not None
 
-    def test_retry_on_connection_error(self, analyzer):
-        """Test retry on connection error"""
-        mock_response = Mock()
-        conn_error = anthropic.APIConnectionError(request=Mock())
+    @pytest.mark.parametrize("path", ["requirements.txt", "requirements-dev.txt", "CMakeLists.txt"])
+    def test_txt_build_files_are_not_docs(self, analyzer, commit_info, path):
+        """Test dependency and build files ending in .txt are not treated as docs"""
+        files = [FileChange(path=path, change_type="modified", diff_content="-requests==2.31")]
+        analyzer.client.messages.create.side_effect = RuntimeError("reached the API")
 
-        analyzer.client.messages.create.side_effect = [conn_error, mock_response]
+        with pytest.raises(RuntimeError, match="reached the API"):
+            analyzer.analyze(commit_info, files, {})
 
-        with patch("time.sleep"):
-            result = analyzer._call_api_with_retry(
-                "test prompt", max_retries=3, base_delay=0.01, max_total_wait=100
-            )
+    def test_new_code_file_is_not_trivial(self, analyzer, commit_info):
+        """Test added files are never treated as cosmetic"""
+        files = [FileChange(path="app.py", change_type="added", diff_content="+# comment")]
+        assert analyzer._trivial_analysis(commit_info, files) is None
 
-        assert result == mock_response
 
-    def test_retry_on_server_error(self, analyzer):
-        """Test retry on 5xx server error"""
+class TestCallApiWithRetry:
+    """Test _call_api_with_retry method"""
+
+    def test_successful_call(self, analyzer):
+        """Test successful API call without retry"""
         mock_response = Mock()
-        server_error = anthropic.APIStatusError(
-            message="Server error", response=Mock(status_code=500), body={}
-        )
+        analyzer.client.messages.create.return_value = mock_response
+
+        result = analyzer._call_api_with_retry("test prompt", max_retries=3)
+        assert result == mock_response
+        assert analyzer.client.messages.create.call_count == 1
 
-        analyzer.client.messages.create.side_effect = [server_error, mock_response]
+    @pytest.mark.parametrize(
+        "make_error",
+        [
+            lambda: anthropic.RateLimitError(
+                message="Rate limited", response=Mock(status_code=429), body={}
+            ),
+            lambda: anthropic.APITimeoutError(request=Mock()),
+            lambda: anthropic.APIConnectionError(request=Mock()),
+            lambda: anthropic.APIStatusError(
+                message="Server error", response=Mock(status_code=500), body={}
+            ),
+        ],
+        ids=["rate_limit", "timeout", "connection_error", "server_error"],
+    )
+    def test_retry_on_transient_error(self, analyzer, make_error):
+        """Test retry on rate limit, timeout, connection and 5xx errors"""
+        mock_response = Mock()
+        analyzer.client.messages.create.side_effect = [make_error(), mock_response]
 
-        with patch("time.sleep"):
-            result = analyzer._call_api_with_retry(
-                "test prompt", max_retries=3, base_delay=0.01, max_total_wait=100
-            )
+        result = analyzer._call_api_with_retry(
+            "test prompt", max_retries=3, base_delay=0.01, max_total_wait=100
+        )
 
         assert result == mock_response
+        assert analyzer.client.messages.create.call_count == 2
 
     def test_no_retry_on_client_error(self, analyzer):
         """Test no retry on 4xx client error (except rate limit)"""
@@ -392,12 +645,41 @@ class TestCallApiWithRetry:
 
         analyzer.client.messages.create.side_effect = rate_limit_error
 
-        with patch("time.sleep"):
-            with pytest.raises(RuntimeError, match="API call failed after"):
+        with pytest.raises(RuntimeError, match="API call failed after"):
+            analyzer._call_api_with_retry(
+                "test prompt", max_retries=2, base_delay=0.01, max_total_wait=100
+            )
+
+    def test_max_total_wait_counts_request_time(self, analyzer):
+        """Test slow requests use up the retry budget even with tiny sleeps"""
+        timeout_error = anthropic.APITimeoutError(request=Mock())
+        analyzer.client.messages.create.side_effect = timeout_error
+
+        # Each request "takes" 20s of wall time
+        clock = iter([0.0, 20.0, 40.0, 60.0, 80.0])
+        with patch("time.monotonic", side_effect=lambda: next(clock)):
+            with pytest.raises(RuntimeError):
                 analyzer._call_api_with_retry(
-                    "test prompt", max_retries=2, base_delay=0.01, max_total_wait=100
+                    "test prompt", max_retries=5, base_delay=0.01, max_total_wait=30
                 )
 
+        assert analyzer.client.messages.create.call_count == 2
+
+    def test_rate_limiter_gates_and_is_penalized(self, analyzer):
+        """Test calls go through the rate limiter and 429s penalize it"""
+        analyzer.rate_limiter = Mock()
+        rate_limit_error = anthropic.RateLimitError(
+            message="Rate limited", response=Mock(status_code=429), body={}
+        )
+        analyzer.client.messages.create.side_effect = [rate_limit_error, Mock()]
+
+        analyzer._call_api_with_retry(
+            "test prompt", max_retries=3, base_delay=0.01, max_total_wait=100
+        )
+
+        assert analyzer.rate_limiter.acquire.call_count == 2
+        analyzer.rate_limiter.penalize.assert_called_once()
+
     def test_max_total_wait_exceeded(self, analyzer):
         """Test stopping when max_total_wait is exceeded"""
         rate_limit_error = anthropic.RateLimitError(
@@ -406,27 +688,91 @@ class TestCallApiWithRetry:
 
         analyzer.client.messages.create.side_effect = rate_limit_error
 
-        with patch("time.sleep"):
-            with pytest.raises(RuntimeError):
-                analyzer._call_api_with_retry(
-                    "test prompt",
-                    max_retries=10,
-                    base_delay=10,  # Large delay
-                    max_total_wait=0.001,  # Very small max wait
-                )
+        with pytest.raises(RuntimeError):
+            analyzer._call_api_with_retry(
+                "test prompt",
+                max_retries=10,
+                base_delay=10,  # Large delay
+                max_total_wait=0.001,  # Very small max wait
+            )
+
+
+class TestRequestParams:
+    """Test Messages API payload construction"""
+
+    def test_build_prompt_matches_str_format(self, analyzer):
+        """Test the precompiled template fills exactly like str.format"""
+        commit_info = {
+            "hash": "abc123",
+            "short_hash": "abc123",
+            "message": "Use {braces} in message",
+            "author": "Test",
+            "date": "2024-01-01",
+        }
+        files = [FileChange(path="a.py", change_type="modified", diff_content="+x")]
+
+        expected = analyzer.COMMIT_PROMPT.format(
+            commit_hash="abc123",
+            commit_message="Use {braces} in message",
+            author="Test",
+            date="2024-01-01",
+            project_context=analyzer._format_project_context({}),
+            files_summary=analyzer._format_files_summary(files),
+            diffs=analyzer._format_diffs(files),
+        )
+        assert analyzer._build_prompt(commit_info, files, {}) == expected
+
+    def test_instructions_cover_response_schema(self, analyzer):
+        """Test the compact schema still names every field the response builder reads"""
+        for field in (
+            "intent",
+            "summary",
+            "reasoning",
+            "confidence",
+            "direct_impacts",
+            "indirect_impacts",
+            "affected_components",
+            "overall_risk",
+            "mitigation",
+            "edge_cases",
+            "breaking_changes",
+            "requires_migration",
+            "review_questions",
+            "priority",
+        ):
+            assert field in analyzer.ANALYSIS_INSTRUCTIONS
+
+    def test_static_instructions_are_cacheable_prefix(self, analyzer):
+        """Test instructions come first with cache_control, commit data second"""
+        params = analyzer._request_params("## Commit Information\n...")
+        blocks = params["messages"][0]["content"]
+
+        assert blocks[0]["text"] == analyzer.ANALYSIS_INSTRUCTIONS
+        assert blocks[0]["cache_control"] == {"type": "ephemeral"}
+        assert blocks[1]["text"].startswith("## Commit Information")
+        assert "cache_control" not in blocks[1]
+
+    def test_cache_read_tokens_tracked(self, analyzer):
+        """Test prompt-cache usage is recorded in last_usage"""
+        response = Mock()
+        response.content = [Mock(text='{"intent": {"summary": "s"}}')]
+        response.usage = Mock(
+            input_tokens=100,
+            output_tokens=50,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=900,
+        )
+        commit_info = {"hash": "abc", "message": "m", "author": "a", "date": "d"}
+
+        analyzer._build_analysis(commit_info, [], response)
+
+        assert analyzer.last_usage["cache_read_input_tokens"] == 900
+        assert analyzer.last_usage["total_tokens"] == 150
 
 
 class TestAnalyze:
     """Test analyze method - full integration"""
 
-    @pytest.fixture
-    def analyzer(self):
-        with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
-            with patch("anthropic.Anthropic"):
-                a = LLMAnalyzer()
-                a.client = Mock()
-                return a
-
     def test_analyze_returns_semantic_analysis(self, analyzer):
         """Test analyze returns properly structured SemanticAnalysis"""
         # Mock response
@@ -480,6 +826,44 @@ class TestAnalyze:
         assert result.risk_assessment.overall_risk == RiskLevel.LOW
         assert result.tokens_used == 150
 
+    def test_analyze_builds_nested_models(self, analyzer):
+        """Test impacts, risks and questions are built with normalized severities"""
+        mock_response = Mock()
+        mock_response.content = [Mock(text="""{
+    "intent": {"summary": "s", "reasoning": "r", "confidence": 0.9},
+    "impact_map": {
+        "direct_impacts": [{"area": "API", "description": "d", "severity": "HIGH"}],
+        "indirect_impacts": [{"area": "Docs", "description": "d", "severity": "low"}],
+        "affected_components": ["api"]
+    },
+    "risk_assessment": {
+        "overall_risk": "medium",
+        "risks": [{"description": "r", "severity": "critical", "edge_cases": ["e"]}],
+        "breaking_changes": true
+    },
+    "review_questions": [{"question": "q", "context": "c"}]
+}""")]
+        mock_response.usage.input_tokens = 10
+        mock_response.usage.output_tokens = 5
+        analyzer.client.messages.create.return_value = mock_response
+
+        commit_info = {
+            "hash": "abc",
+            "short_hash": "abc",
+            "message": "m",
+            "author": "a",
+            "date": "d",
+        }
+        result = analyzer.analyze(commit_info, [], {})
+
+        assert result.impact_map.direct_impacts[0].severity == RiskLevel.HIGH
+        assert result.impact_map.indirect_impacts[0].area == "Docs"
+        assert result.risk_assessment.risks[0].severity == RiskLevel.CRITICAL
+        assert result.risk_assessment.risks[0].mitigation is None
+        assert result.risk_assessment.breaking_changes is True
+        assert result.risk_assessment.requires_migration is False
+        assert result.review_questions[0].priority == RiskLevel.MEDIUM
+
     def test_analyze_with_empty_files(self, analyzer):
         """Test analyze with empty file list"""
         mock_response = Mock()
@@ -507,18 +891,352 @@ class TestAnalyze:
         assert result.intent.summary == "Empty"
 
 
-class TestRetryAfterHeader:
-    """Test Retry-After header handling"""
+class TestStreaming:
+    """Test streamed responses via on_text"""
+
+    def test_on_text_receives_chunks(self, analyzer):
+        """Test streamed chunks reach the callback and the final message is parsed"""
+        chunks = ['{"intent": {"summary": "Str', 'eamed", "reasoning": "r", "confidence": 0.6}}']
+        final = Mock()
+        final.content = [Mock(text="".join(chunks))]
+        final.usage.input_tokens = 10
+        final.usage.output_tokens = 5
+
+        stream = MagicMock()
+        stream.__enter__.return_value.text_stream = iter(chunks)
+        stream.__enter__.return_value.get_final_message.return_value = final
+        analyzer.client.messages.stream.return_value = stream
+
+        received = []
+        commit_info = {
+            "hash": "abc",
+            "short_hash": "abc",
+            "message": "m",
+            "author": "a",
+            "date": "d",
+        }
+        result = analyzer.analyze(commit_info, [], {}, on_text=received.append)
+
+        assert received == chunks
+        assert result.intent.summary == "Streamed"
+        analyzer.client.messages.create.assert_not_called()
+
+    def test_retry_restarts_stream(self, analyzer):
+        """Test on_retry runs before a failed stream is retried from the start"""
+        final = Mock()
+        final.content = [Mock(text='{"intent": {"summary": "Second"}}')]
+        final.usage.input_tokens = 10
+        final.usage.output_tokens = 5
+
+        def failing_text():
+            yield '{"intent": {"summary": "Fir'
+            raise anthropic.APIConnectionError(request=Mock())
+
+        failed, succeeded = MagicMock(), MagicMock()
+        failed.__enter__.return_value.text_stream = failing_text()
+        succeeded.__enter__.return_value.text_stream = iter(['{"intent": {"summary": "Second"}}'])
+        succeeded.__enter__.return_value.get_final_message.return_value = final
+        analyzer.client.messages.stream.side_effect = [failed, succeeded]
+
+        events = []
+        commit_info = {
+            "hash": "abc",
+            "short_hash": "abc",
+            "message": "m",
+            "author": "a",
+            "date": "d",
+        }
+        result = analyzer.analyze(
+            commit_info, [], {}, on_text=events.append, on_retry=lambda: events.append(None)
+        )
+
+        assert events == ['{"intent": {"summary": "Fir', None, '{"intent": {"summary": "Second"}}']
+        assert result.intent.summary == "Second"
+
+
+class TestAnalyzeAsync:
+    """Test analyze_async / analyze_many concurrency helpers"""
 
     @pytest.fixture
-    def analyzer(self):
+    def aclient(self):
+        client = MagicMock()
+        client.__aenter__.return_value = client
+        return client
+
+    @pytest.fixture
+    def analyzer(self, analyzer, aclient):
+        analyzer._async_client = Mock(return_value=aclient)
+        return analyzer
+
+    @staticmethod
+    def _response(summary):
+        mock_response = Mock()
+        mock_response.content = [
+            Mock(
+                text=f'{{"intent": {{"summary": "{summary}", "reasoning": "r", "confidence": 0.7}}}}'
+            )
+        ]
+        mock_response.usage.input_tokens = 10
+        mock_response.usage.output_tokens = 5
+        return mock_response
+
+    @staticmethod
+    def _job(commit_hash):
+        commit_info = {
+            "hash": commit_hash,
+            "short_hash": commit_hash,
+            "message": f"Commit {commit_hash}",
+            "author": "Test",
+            "date": "2024-01-01",
+        }
+        return commit_info, [], {}
+
+    def test_analyze_many_preserves_order(self, analyzer, aclient):
+        """Test results come back in job order"""
+        aclient.messages.create = AsyncMock(
+            side_effect=[self._response("first"), self._response("second")]
+        )
+
+        results = asyncio.run(analyzer.analyze_many([self._job("aaa"), self._job("bbb")]))
+
+        assert [r.commit_hash for r in results] == ["aaa", "bbb"]
+        assert aclient.messages.create.await_count == 2
+
+    def test_analyze_many_respects_concurrency_limit(self, analyzer, aclient):
+        """Test no more than max_concurrency calls are in flight"""
+        in_flight = 0
+        peak = 0
+
+        async def fake_create(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return self._response("ok")
+
+        aclient.messages.create = fake_create
+
+        jobs = [self._job(f"c{i}") for i in range(6)]
+        asyncio.run(analyzer.analyze_many(jobs, max_concurrency=2))
+
+        assert peak <= 2
+
+    def test_prompt_prepared_off_event_loop(self, analyzer, aclient):
+        """Test prompt building runs in a worker thread, not on the loop thread"""
+        loop_thread = threading.get_ident()
+        prepared_in = []
+        original = analyzer._prepare_prompt
+
+        def spy(*args):
+            prepared_in.append(threading.get_ident())
+            return original(*args)
+
+        analyzer._prepare_prompt = spy
+        aclient.messages.create = AsyncMock(return_value=self._response("ok"))
+
+        asyncio.run(analyzer.analyze_async(*self._job("abc")))
+
+        assert prepared_in and prepared_in[0] != loop_thread
+
+    def test_async_retry_on_timeout(self, analyzer, aclient):
+        """Test async retry path recovers from a timeout"""
+        aclient.messages.create = AsyncMock(
+            side_effect=[anthropic.APITimeoutError(request=Mock()), self._response("ok")]
+        )
+
+        with patch("asyncio.sleep", new=AsyncMock()):
+            result = asyncio.run(analyzer.analyze_async(*self._job("abc")))
+
+        assert result.intent.summary == "ok"
+
+    def test_each_run_gets_its_own_client(self, analyzer, aclient):
+        """Test the async client is closed after each event loop run, never reused"""
+        aclient.messages.create = AsyncMock(return_value=self._response("ok"))
+
+        asyncio.run(analyzer.analyze_many([self._job("aaa")]))
+        asyncio.run(analyzer.analyze_async(*self._job("bbb")))
+
+        assert analyzer._async_client.call_count == 2
+        assert aclient.__aexit__.await_count == 2
+
+
+class TestAnalyzeBatch:
+    """Test analyze_batch via the Message Batches API"""
+
+    @pytest.fixture
+    def clock(self, monkeypatch, mock_sleep):
+        """Fake monotonic clock that sleeping advances"""
+        clock = Mock(now=0.0)
+        monkeypatch.setattr("time.monotonic", lambda: clock.now)
+        mock_sleep.side_effect = lambda seconds: setattr(clock, "now", clock.now + seconds)
+        return clock
+
+    @staticmethod
+    def _message(summary):
+        message = Mock()
+        message.content = [
+            Mock(
+                text=f'{{"intent": {{"summary": "{summary}", "reasoning": "r", "confidence": 0.7}}}}'
+            )
+        ]
+        message.usage.input_tokens = 10
+        message.usage.output_tokens = 5
+        return message
+
+    @staticmethod
+    def _job(commit_hash):
+        commit_info = {
+            "hash": commit_hash,
+            "short_hash": commit_hash,
+            "message": f"Commit {commit_hash}",
+            "author": "Test",
+            "date": "2024-01-01",
+        }
+        return commit_info, [], {}
+
+    def test_batch_results_routed_by_custom_id(self, analyzer):
+        """Test out-of-order batch results map back to their jobs"""
+        analyzer.client.messages.batches.create.return_value = Mock(
+            id="batch_1", processing_status="in_progress"
+        )
+        analyzer.client.messages.batches.retrieve.return_value = Mock(
+            id="batch_1", processing_status="ended"
+        )
+        analyzer.client.messages.batches.results.return_value = [
+            Mock(custom_id="job-1", result=Mock(type="succeeded", message=self._message("b"))),
+            Mock(custom_id="job-0", result=Mock(type="succeeded", message=self._message("a"))),
+        ]
+
+        results = analyzer.analyze_batch([self._job("aaa"), self._job("bbb")])
+
+        assert [r.intent.summary for r in results] == ["a", "b"]
+        requests = analyzer.client.messages.batches.create.call_args.kwargs["requests"]
+        assert [r["custom_id"] for r in requests] == ["job-0", "job-1"]
+        analyzer.client.messages.create.assert_not_called()
+
+    def test_errored_entries_fall_back_to_retry_path(self, analyzer):
+        """Test errored batch entries are re-requested individually"""
+        analyzer.client.messages.batches.create.return_value = Mock(
+            id="batch_1", processing_status="ended"
+        )
+        analyzer.client.messages.batches.results.return_value = [
+            Mock(custom_id="job-0", result=Mock(type="errored")),
+        ]
+        analyzer.client.messages.create.return_value = self._message("retried")
+
+        results = analyzer.analyze_batch([self._job("aaa")])
+
+        assert results[0].intent.summary == "retried"
+        assert analyzer.client.messages.create.call_count == 1
+
+    def test_batch_timeout(self, analyzer, clock):
+        """Test RuntimeError when the batch does not finish in time"""
+        analyzer.client.messages.batches.create.return_value = Mock(
+            id="batch_1", processing_status="in_progress"
+        )
+        analyzer.client.messages.batches.retrieve.return_value = Mock(
+            id="batch_1", processing_status="in_progress"
+        )
+
+        with pytest.raises(RuntimeError, match="did not finish"):
+            analyzer.analyze_batch([self._job("aaa")], poll_interval=1, max_wait=3)
+        assert analyzer.client.messages.batches.retrieve.call_count == 3
+
+    def test_batch_timeout_counts_retrieve_time(self, analyzer, clock):
+        """Test slow status polls use up max_wait even with short sleeps"""
+        analyzer.client.messages.batches.create.return_value = Mock(
+            id="batch_1", processing_status="in_progress"
+        )
+
+        def slow_retrieve(batch_id):
+            clock.now += 5.0
+            return Mock(id=batch_id, processing_status="in_progress")
+
+        analyzer.client.messages.batches.retrieve.side_effect = slow_retrieve
+
+        with pytest.raises(RuntimeError, match="did not finish"):
+            analyzer.analyze_batch([self._job("aaa")], poll_interval=1, max_wait=3)
+        assert analyzer.client.messages.batches.retrieve.call_count == 1
+
+
+class TestAnalyzeCache:
+    """Test analyze with a SemanticCache attached"""
+
+    @pytest.fixture
+    def analyzer(self, tmp_path):
         with patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key"}):
             with patch("anthropic.Anthropic"):
-                a = LLMAnalyzer()
+                a = LLMAnalyzer(cache=SemanticCache(tmp_path / "cache.db"))
                 a.client = Mock()
                 return a
 
-    def test_retry_after_numeric(self, analyzer):
+    @pytest.fixture
+    def mock_response(self, analyzer):
+        mock_response = Mock()
+        mock_response.content = [
+            Mock(text='{"intent": {"summary": "Cached", "reasoning": "r", "confidence": 0.8}}')
+        ]
+        mock_response.usage.input_tokens = 10
+        mock_response.usage.output_tokens = 5
+        analyzer.client.messages.create.return_value = mock_response
+        return mock_response
+
+    @staticmethod
+    def _commit(commit_hash):
+        return {
+            "hash": commit_hash,
+            "short_hash": commit_hash,
+            "message": "Fix bug",
+            "author": "Test",
+            "date": "2024-01-01",
+        }
+
+    def test_second_call_served_from_cache(self, analyzer, mock_response):
+        """Test repeated analysis of the same commit skips the API"""
+        files = [FileChange(path="a.py", change_type="modified", diff_content="+x")]
+
+        first = analyzer.analyze(self._commit("abc123"), files, {})
+        second = analyzer.analyze(self._commit("abc123"), files, {})
+
+        assert analyzer.client.messages.create.call_count == 1
+        assert second.intent.summary == first.intent.summary
+        assert analyzer.last_usage["total_tokens"] == 0
+
+    def test_cherry_pick_served_from_similarity_tier(self, analyzer, mock_response):
+        """Test the same change at other line numbers reuses the analysis"""
+        diff = "-if x:\n+if x is not None:"
+        original = [
+            FileChange(path="a.py", change_type="modified", diff_content=f"@@ -3 +3 @@\n{diff}")
+        ]
+        picked = [
+            FileChange(path="a.py", change_type="modified", diff_content=f"@@ -9 +9 @@\n{diff}")
+        ]
+
+        first = analyzer.analyze(self._commit("aaa111"), original, {})
+        second = analyzer.analyze(self._commit("bbb222"), picked, {})
+
+        assert analyzer.client.messages.create.call_count == 1
+        assert second.commit_hash == "bbb222"
+        assert second.intent.summary == first.intent.summary
+        assert second.tokens_used == 0
+
+    def test_different_diff_misses_similarity_tier(self, analyzer, mock_response):
+        """Test same message and files with a different change still calls the API"""
+        first = [FileChange(path="a.py", change_type="modified", diff_content="-x = 1\n+x = 2")]
+        second = [FileChange(path="a.py", change_type="modified", diff_content="-y = 1\n+y = 3")]
+
+        analyzer.analyze(self._commit("aaa111"), first, {})
+        result = analyzer.analyze(self._commit("bbb222"), second, {})
+
+        assert analyzer.client.messages.create.call_count == 2
+        assert result.tokens_used == 15
+
+
+class TestRetryAfterHeader:
+    """Test Retry-After header handling"""
+
+    def test_retry_after_numeric(self, analyzer, mock_sleep):
         """Test handling numeric Retry-After value"""
         mock_response = Mock()
         rate_limit_error = anthropic.RateLimitError(
@@ -528,13 +1246,12 @@ class TestRetryAfterHeader:
 
         analyzer.client.messages.create.side_effect = [rate_limit_error, mock_response]
 
-        with patch("time.sleep") as mock_sleep:
-            analyzer._call_api_with_retry("test", max_retries=3, base_delay=1.0, max_total_wait=100)
+        analyzer._call_api_with_retry("test", max_retries=3, base_delay=1.0, max_total_wait=100)
 
-            # Should use retry_after value (plus jitter)
-            assert mock_sleep.called
-            actual_delay = mock_sleep.call_args[0][0]
-            assert actual_delay >= 2.0  # At least retry_after value
+        # Should use retry_after value (plus jitter)
+        assert mock_sleep.called
+        actual_delay = mock_sleep.call_args[0][0]
+        assert actual_delay >= 2.0  # At least retry_after value
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+"""
+Tests for RateLimiter - token-bucket gating of API calls
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from semantic_diff.analyzers.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestReserve:
+    """Test capacity reservation"""
+
+    def test_first_request_is_free(self, clock):
+        """Test a fresh limiter lets the first request through"""
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, clock=clock)
+        assert limiter.reserve(100) == 0
+
+    def test_request_limit_queues(self, clock):
+        """Test exceeding requests/min yields a wait of one refill interval"""
+        limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=100000, clock=clock)
+        assert limiter.reserve(1) == 0
+        assert limiter.reserve(1) == 0
+        assert limiter.reserve(1) == pytest.approx(30.0)
+        assert limiter.reserve(1) == pytest.approx(60.0)
+
+    def test_token_limit_queues(self, clock):
+        """Test exceeding tokens/min yields a proportional wait"""
+        limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000, clock=clock)
+        assert limiter.reserve(1000) == 0
+        assert limiter.reserve(500) == pytest.approx(30.0)
+
+    def test_buckets_refill_over_time(self, clock):
+        """Test capacity comes back as time passes"""
+        limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=100000, clock=clock)
+        limiter.reserve(1)
+        clock.now = 60.0
+        assert limiter.reserve(1) == 0
+
+    def test_oversized_request_is_capped(self, clock):
+        """Test a request larger than tokens/min does not wait forever"""
+        limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000, clock=clock)
+        assert limiter.reserve(50000) == 0
+
+    def test_penalize_blocks_new_requests(self, clock):
+        """Test penalize holds back requests after a 429"""
+        limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=100000, clock=clock)
+        limiter.penalize(5.0)
+        assert limiter.reserve(1) == pytest.approx(5.0)
+
+    def test_from_env(self, monkeypatch):
+        """Test limits can be configured through the environment"""
+        monkeypatch.setenv("SEMANTIC_DIFF_RPM", "10")
+        monkeypatch.setenv("SEMANTIC_DIFF_TPM", "5000")
+        limiter = RateLimiter.from_env()
+        assert limiter.requests_per_minute == 10
+        assert limiter.tokens_per_minute == 5000
+
+    @pytest.mark.parametrize(
+        "name, value",
+        [
+            ("SEMANTIC_DIFF_RPM", "0"),
+            ("SEMANTIC_DIFF_RPM", "-5"),
+            ("SEMANTIC_DIFF_TPM", "abc"),
+            ("SEMANTIC_DIFF_TPM", "nan"),
+        ],
+    )
+    def test_from_env_rejects_invalid_limits(self, monkeypatch, name, value):
+        """Test a bad environment value names the variable instead of dividing by zero"""
+        monkeypatch.setenv(name, value)
+        with pytest.raises(ValueError, match=f"{name} must be a positive number, got '{value}'"):
+            RateLimiter.from_env()
+
+    @pytest.mark.parametrize("requests, tokens", [(0, 100), (10, 0), (-1, 100)])
+    def test_rejects_non_positive_limits(self, requests, tokens):
+        """Test limits that would make reserve divide by zero are refused"""
+        with pytest.raises(ValueError, match="must be positive"):
+            RateLimiter(requests_per_minute=requests, tokens_per_minute=tokens)
+
+
+class TestAcquire:
+    """Test blocking helpers"""
+
+    def test_acquire_sleeps_for_reserved_delay(self, clock):
+        """Test sync acquire sleeps only when needed"""
+        limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=100000, clock=clock)
+        with patch("semantic_diff.analyzers.rate_limiter.time.sleep") as mock_sleep:
+            limiter.acquire(1)
+            mock_sleep.assert_not_called()
+            limiter.acquire(1)
+            mock_sleep.assert_called_once_with(pytest.approx(60.0))
+
+    def test_acquire_async(self, clock):
+        """Test async acquire awaits the reserved delay"""
+        limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=100000, clock=clock)
+        with patch("semantic_diff.analyzers.rate_limiter.asyncio.sleep", new=AsyncMock()) as sleep:
+            asyncio.run(limiter.acquire_async(1))
+            asyncio.run(limiter.acquire_async(1))
+            sleep.assert_awaited_once_with(pytest.approx(60.0))